@@ -0,0 +1,128 @@
+"""
+Per-step chat completion latency with a new service per call (cold) and with the shared, warmed services.
+
+Runs against a local OpenAI-compatible mock server over TLS (the Azure endpoint must be https), so
+only the client side is measured, connection setup and TLS handshakes included:
+
+    openssl req -x509 -newkey rsa:2048 -nodes -days 1 -subj /CN=localhost -keyout key.pem -out cert.pem
+    SSL_CERT_FILE=cert.pem python benchmarks/bench_shared_services.py --certfile cert.pem --keyfile key.pem
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+mock_app = FastAPI()
+
+
+@mock_app.post("/openai/deployments/{deployment}/chat/completions")
+async def chat_completions(deployment: str, request: Request):
+    await request.json()
+    return {
+        "id": "bench",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": deployment,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": '{"status": "OK", "list_of_issues": []}'},
+        }],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    }
+
+
+@mock_app.get("/openai/models")
+async def models():
+    return {"object": "list", "data": []}
+
+
+def start_mock_server(certfile: str, keyfile: str) -> str:
+    """
+    Serve the mock API from a separate process and return its endpoint.
+
+    A server thread in the benchmark process competes with the client for the GIL, enough to make
+    some TLS handshakes exceed the connect timeout.
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = multiprocessing.Process(target=uvicorn.run, args=(mock_app,), daemon=True, kwargs=dict(
+        host="127.0.0.1", port=port, log_level="warning", ssl_certfile=certfile, ssl_keyfile=keyfile
+    ))
+    server.start()
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline or not server.is_alive():
+                raise RuntimeError("The mock server did not start")
+            time.sleep(0.1)
+    return f"https://localhost:{port}/"
+
+
+async def measure(calls: int):
+    from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+    from semantic_kernel.kernel import Kernel
+    from src.models.step_models import ValidationResult
+    from src.utils import chat_helpers
+
+    cold, warm = [], []
+    # Untimed first call, so that lazy imports and the mock server start-up are not counted as cold latency
+    kernel = Kernel()
+    kernel.add_service(AzureChatCompletion(service_id=chat_helpers.SERVICE_ID))
+    await chat_helpers.call_chat_completion_structured_outputs(kernel, "benchmark", ValidationResult)
+    for _ in range(calls):
+        # What initialize_kernel used to do: a new service, and with it a new connection pool, per call
+        kernel = Kernel()
+        kernel.add_service(AzureChatCompletion(service_id=chat_helpers.SERVICE_ID))
+        start_time = time.perf_counter()
+        await chat_helpers.call_chat_completion_structured_outputs(kernel, "benchmark", ValidationResult)
+        cold.append(time.perf_counter() - start_time)
+
+    await chat_helpers.warm_up_services()
+    for _ in range(calls):
+        kernel = await chat_helpers.initialize_kernel()
+        start_time = time.perf_counter()
+        await chat_helpers.call_chat_completion_structured_outputs(kernel, "benchmark", ValidationResult)
+        warm.append(time.perf_counter() - start_time)
+    return cold, warm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=30, help="Chat completions per configuration")
+    parser.add_argument("--certfile", required=True, help="Certificate of the mock server, trusted by the client")
+    parser.add_argument("--keyfile", required=True, help="Private key of the certificate")
+    args = parser.parse_args()
+
+    endpoint = start_mock_server(args.certfile, args.keyfile)
+    os.environ.update(
+        AZURE_OPENAI_API_KEY="benchmark",
+        AZURE_OPENAI_ENDPOINT=endpoint,
+        AZURE_OPENAI_API_VERSION="2024-12-01-preview",
+        AZURE_OPENAI_CHAT_DEPLOYMENT_NAME="benchmark",
+        # The response cache would replay every call after the first one
+        LLM_RESPONSE_CACHE_DIR="",
+    )
+    os.environ.pop("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME", None)
+
+    cold, warm = asyncio.run(measure(args.calls))
+    for name, latencies in (("cold (service per call)", cold), ("warm (shared services)", warm)):
+        ms = sorted(latency * 1000 for latency in latencies)
+        print(f"{name:<24} median {statistics.median(ms):7.2f} ms   p95 {ms[int(len(ms) * 0.95) - 1]:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
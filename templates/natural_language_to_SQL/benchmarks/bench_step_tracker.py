@@ -0,0 +1,117 @@
+"""
+Per-transition overhead of the StepTracker (start_step + end_step) with schema-sized payloads.
+
+Configurations:
+- console on: the console listener renders every step (STEP_TRACKER_CONSOLE="full", output discarded)
+- console off: no console listener, a WebSocket client subscribed, so payloads are serialized per step
+- lazy: no console listener and no subscriber, payloads are only serialized when the history is requested
+
+    python benchmarks/bench_step_tracker.py --steps 500
+    python benchmarks/bench_step_tracker.py --root /path/to/older/checkout  # trackers without these options
+                                                                             # only run with the console on
+"""
+import os
+import sys
+import time
+import inspect
+import argparse
+import statistics
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--steps", type=int, default=500, help="Transitions timed per repeat")
+    parser.add_argument("--repeats", type=int, default=5, help="Repeats per configuration, the median is reported")
+    parser.add_argument("--root", default=os.path.join(os.path.dirname(__file__), ".."),
+                        help="Project folder the tracker is imported from")
+    return parser.parse_args()
+
+
+class SubscribedManager:
+    """Stand-in for the WebSocket ConnectionManager with one client listening to every run."""
+
+    def __init__(self):
+        self.published = 0
+
+    def has_subscribers(self, run_id=None) -> bool:
+        return True
+
+    def publish(self, message):
+        self.published += 1
+
+
+def make_payloads():
+    from src.models.step_models import ExecutionResult, ExecutionStepInput, GetColumnNames, TableColumns
+
+    columns = GetColumnNames(table_column_list=[
+        TableColumns(table_name=f"TABLE_{t}", column_names=[f"COLUMN_{t}_{c}" for c in range(20)])
+        for t in range(10)
+    ])
+    step_input = ExecutionStepInput(
+        user_query="How many providers are there per county and specialty?",
+        table_column_names=columns,
+        sql_statement="SELECT COUNTY, SPECIALTY, COUNT(*) FROM PROVIDERS GROUP BY COUNTY, SPECIALTY",
+    )
+    step_output = ExecutionResult(
+        user_query=step_input.user_query,
+        sql_statement=step_input.sql_statement,
+        response={"result": [{"COUNTY": f"County {i}", "SPECIALTY": "Cardiology", "COUNT": i} for i in range(50)]},
+    )
+    return step_input, step_output
+
+
+def time_transitions(make_tracker, steps: int, step_input, step_output) -> float:
+    """Return the mean time of a start_step/end_step pair in microseconds."""
+    tracker = make_tracker()
+    start_time = time.perf_counter()
+    for _ in range(steps):
+        tracker.start_step("SQLGenerationStep", step_input)
+        tracker.end_step(next_step="SQLReviewStep", next_event="SQLGenerationStepDone", output_data=step_output)
+    return (time.perf_counter() - start_time) / steps * 1e6
+
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, os.path.abspath(args.root))
+    os.environ.setdefault("STEP_TRACKER_CONSOLE", "off")
+    os.environ["OTEL_TRACING_ENABLED"] = "false"
+
+    from rich.console import Console
+    from src.utils import step_tracker
+
+    # Render to a discarded terminal-sized console, the rendering cost stays the same
+    step_tracker.console = Console(file=open(os.devnull, "w"), width=120, force_terminal=True)
+    StepTracker = step_tracker.StepTracker
+    step_input, step_output = make_payloads()
+
+    if "console_output" in inspect.signature(StepTracker.__init__).parameters:
+        def make(console_output, manager):
+            def make_tracker():
+                StepTracker._websocket_manager = manager
+                return StepTracker(run_id="bench", console_output=console_output)
+            return make_tracker
+
+        configurations = {
+            "console on": make("full", None),
+            "console off": make("off", SubscribedManager()),
+            "lazy": make("off", None),
+        }
+    else:
+        configurations = {"console on": lambda: StepTracker(run_id="bench")}
+
+    for name, make_tracker in configurations.items():
+        timings = [time_transitions(make_tracker, args.steps, step_input, step_output) for _ in range(args.repeats)]
+        print(f"{name:<12} {statistics.median(timings):10.1f} us per step")
+
+    # Serialization deferred by the lazy configuration, paid when the history is requested
+    tracker = configurations["lazy"]() if "lazy" in configurations else configurations["console on"]()
+    for _ in range(20):
+        tracker.start_step("SQLGenerationStep", step_input)
+        tracker.end_step(next_step="SQLReviewStep", next_event="SQLGenerationStepDone", output_data=step_output)
+    start_time = time.perf_counter()
+    tracker.get_transition_history_serializable()
+    print(f"{'history':<12} {(time.perf_counter() - start_time) * 1e3:10.2f} ms for 20 steps")
+
+
+if __name__ == "__main__":
+    main()
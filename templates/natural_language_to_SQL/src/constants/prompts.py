@@ -1,4 +1,10 @@
-"""SQL Generation process prompts."""
+"""
+SQL Generation process prompts.
+
+Static content (instructions, business rules, table lists, output format) comes first and the per-query
+inputs (retrieved few-shot examples, selected schema, notes, question) come last, so that the prompts of different queries share a byte-identical prefix that
+the model provider can serve from its prompt cache. Prompts are rendered with `render_prompt`.
+"""
 
 
 
@@ -15,13 +21,16 @@ Make sure to include all foreign keys and relationships that are relevant to the
 {rules}
 ```
 
-## User Query
-{user_query}
-
 ## START OF LIST OF TABLES
 {table_list}
 ## END OF LIST OF TABLES
 
+Please generate the response in JSON format, using the following structure:
+
+{{
+    "table_names": ["RelevantTable1_example", "RelevantTable2_example", "RelevantTable3_example", ...]
+}}
+
 # **Inputs from previous generation rounds**
 
 ## Table and Column Names (from previous generation rounds - you need to refine those):
@@ -32,11 +41,8 @@ Make sure to include all foreign keys and relationships that are relevant to the
 
 [End of Inputs from previous generation rounds]
 
-Please generate the response in JSON format, using the following structure:
-
-{{
-    "table_names": ["RelevantTable1_example", "RelevantTable2_example", "RelevantTable3_example", ...]
-}}
+## User Query
+{user_query}
 
 """
 
@@ -63,8 +69,25 @@ You are an advanced SQL query generator. Your task is to extract the relevant ta
 ```
 
 
-## User Query
-{user_query}
+Please generate the response in JSON format, using the following structure:
+
+{{
+	"table_column_names": [
+		{{
+    	"table_name": "Table1_example",
+		"column_names": ["RelevantColumn1_example", "RelevantColumn2_example", "RelevantColumn3_example", ...]
+		}},
+		{{
+			"table_name": "Table2_example",
+			"column_names": ["RelevantColumn1_example", "RelevantColumn2_example", "RelevantColumn3_example", ...]
+		}},
+		{{
+			"table_name": "Table3_example",
+			"column_names": ["RelevantColumn1_example", "RelevantColumn2_example", "RelevantColumn3_example", ...]
+		}},
+        ...
+    ]
+}}
 
 ## START OF LIST OF TABLES AND COLUMNS
 {table_column_list}
@@ -81,31 +104,71 @@ You are an advanced SQL query generator. Your task is to extract the relevant ta
 
 [End of Inputs from previous generation rounds]
 
+## User Query
+{user_query}
+
+"""
+
+
+
+
+get_schema_selection_prompt_template = """
+## Instructions:
+You are an advanced SQL query generator. Your task is to extract the relevant tables, and the relevant columns of each table, using the following **natural language question** from a list of business tables and columns.
+
+[Rules]
+
+[Rule1] You **MUST** include **ONLY** the relevant tables and columns, and not all columns in a table. The reason is that some tables might have a large number of columns that are not relevant to the user's question. You **MUST NOT** forget including the correct relationships and foreign keys in the list of columns.
+
+[Rule2] You **MUST** take a conservative approach: if in doubt whether a table or a column is relevant or not, then you need to include it in the list. It is better to have it and not need it than to need it and not have it.
+
+[Rule3] Make sure to include all foreign keys and relationships that are relevant to the user's question that are necessary to join the tables. If the tables do not have direct relationships, please analyze the situation and include any intermediary tables that can join the tables, and might be necessary to answer the user's question.
+
+[Rule4] From each identified relative table, you **MUST** include **ALL** unique IDs, keys and foreign keys in the list of the output columns below. Hint: include all columns that include "_ID" or "_KEY" or "ID_" or "KEY_" in their names, or is of type "KEY" or similar.
+
+[Rule5] Make sure to review the Business Rules when deciding on the table and column names.
+
+## **Business Rules**
+```json
+{rules}
+```
+
 
 Please generate the response in JSON format, using the following structure:
 
 {{
-	"table_column_names": [
-		{{
-    	"table_name": "Table1_example",
-		"column_names": ["RelevantColumn1_example", "RelevantColumn2_example", "RelevantColumn3_example", ...]
-		}},
+	"table_column_list": [
 		{{
-			"table_name": "Table2_example",
+			"table_name": "Table1_example",
 			"column_names": ["RelevantColumn1_example", "RelevantColumn2_example", "RelevantColumn3_example", ...]
 		}},
 		{{
-			"table_name": "Table3_example",
+			"table_name": "Table2_example",
 			"column_names": ["RelevantColumn1_example", "RelevantColumn2_example", "RelevantColumn3_example", ...]
 		}},
         ...
     ]
 }}
 
+## START OF LIST OF TABLES AND COLUMNS
+{table_column_list}
+## END OF LIST OF TABLES AND COLUMNS
 
-"""
 
+# **Inputs from previous generation rounds**
+
+## Table and Column Names (from previous generation rounds - you need to refine those):
+{previous_table_column_names}
+
+## Notes (you need to pay attention to those):
+{notes}
 
+[End of Inputs from previous generation rounds]
+
+## User Query
+{user_query}
+
+"""
 
 
 sql_generation_prompt = """
@@ -118,26 +181,6 @@ You are an advanced SQL query generator. Your task is to transform the following
 ### END OF BUSINESS RULES
 ---
 
-## **Database Schema**
-{data_model}
----
-
-## Tables and Columns Selected through previous generation rounds:
-{suggested_table_column_names}
-
-**CRITICAL AND VERY IMPORTANT**: You are restricted to the above table and columns names. You **MUST NOT** invent new tables or columns. You **MUST** use the above table and column names to generate the SQL query.
----
-
-## **Notes from Previous Generation Steps**:
-### START OF Notes from Previous Generation Steps
-{notes}
-### END OF Notes from Previous Generation Steps
----
-
-## **User question:**
-{question}
-
-
 The query **MUST COMPLY** with the following conditions:
 - **Be fully functional** for answering the user's question using the provided schema.
 - The SQL query must be compatible with the SQL dialect of **SQLITE DATABASE**
@@ -165,17 +208,38 @@ The query **MUST COMPLY** with the following conditions:
 
 ---
 
+**Final Considerations:**
+- If the question is ambiguous, return the best possible interpretation.
+- Do not generate explanations, only the SQL query.
+- Ensure that the query is syntactically correct and optimal.
+- Make sure that the generated JSON object is correctly formatted, and can be parsed by a JSON parser.
+
+---
+
 ## ** Few-shot Examples:**
 ### START OF FEW SHOT EXAMPLES - use these to guide your SQL statement generation
 {examples}
 ### END OF FEW SHOT EXAMPLES
+---
 
+## **Database Schema**
+{data_model}
+---
 
-**Final Considerations:**
-- If the question is ambiguous, return the best possible interpretation.
-- Do not generate explanations, only the SQL query.
-- Ensure that the query is syntactically correct and optimal.
-- Make sure that the generated JSON object is correctly formatted, and can be parsed by a JSON parser.
+## Tables and Columns Selected through previous generation rounds:
+{suggested_table_column_names}
+
+**CRITICAL AND VERY IMPORTANT**: You are restricted to the above table and columns names. You **MUST NOT** invent new tables or columns. You **MUST** use the above table and column names to generate the SQL query.
+---
+
+## **Notes from Previous Generation Steps**:
+### START OF Notes from Previous Generation Steps
+{notes}
+### END OF Notes from Previous Generation Steps
+---
+
+## **User question:**
+{question}
 
 """
 
@@ -191,15 +255,6 @@ You **MUST** make sure that the Business Rules you will be reviewing against, ar
 
 Each Business Rule has 4 parts: "id", "name", "condition", and "action". You **MUST** make sure that the **"condition"** applies to the current user query, before judging whether this SQL Statement is compliant with the business rule or not. Only if the condition is not met AND it is a big deal (not a small issue), only then are you allowed to raise this as an issue. 
 
-## **User question:**
-{question}
-
-
-## **Generated SQL Query:**
-```sql
-{sql_query}
-```
-
 ## **START OF BUSINESS RULES**
 {rules}
 
@@ -213,6 +268,15 @@ Each Business Rule has 4 parts: "id", "name", "condition", and "action". You **M
     "list_of_fixes": ["Sugested in-details fixes to the first rule in violation.", "Sugested in-details fixes to the second rule in violation.", ...]
 }}
 
+## **User question:**
+{question}
+
+
+## **Generated SQL Query:**
+```sql
+{sql_query}
+```
+
 """
 
 
@@ -231,6 +295,16 @@ The SQL query must be compatible with the SQL dialect of **SQLITE DATABASE**.
 
 **VERY IMPORTANT**: When validating the SQL statement, do not generate an issue unless absolutely necessary, and you know for sure that there is a structural or fundamental problem with the query. If you are not sure, or if the issue is minor, then do not generate an issue.
 
+**Return the result as a single JSON object with the following structure:**
+{{
+	"status": "OK | ERROR",
+	"list_of_issues": ["The first problem in violation, and why it's not compliant", "The second problem in violation, and why it's not compliant"...], # Reasons need to be a comprehensive list of problems in that SQL query
+    "list_of_fixes": ["Sugested in-details fixes to the first problem in violation.", "Sugested in-details fixes to the second probelem in violation.", ...]
+}}
+
+## Tables and Column Names - to check against
+{table_column_names}
+
 ## **User question:**
 {question}
 
@@ -239,16 +313,6 @@ The SQL query must be compatible with the SQL dialect of **SQLITE DATABASE**.
 {sql_query}
 ```
 
-## Tables and Column Names - to check against
-{table_column_names}
-
-**Return the result as a single JSON object with the following structure:**
-{{
-	"status": "OK | ERROR",
-	"list_of_issues": ["The first problem in violation, and why it's not compliant", "The second problem in violation, and why it's not compliant"...], # Reasons need to be a comprehensive list of problems in that SQL query
-    "list_of_fixes": ["Sugested in-details fixes to the first problem in violation.", "Sugested in-details fixes to the second probelem in violation.", ...]
-}}
-
 """
 
 
@@ -285,3 +349,43 @@ Generated Query: SELECT DISTINCT G.COUNTY FROM D_HC_Providers_v3 AS P JOIN D_HC_
 # Generated Query: SELECT PMS.ADHERENCE_LEVEL, COUNT(DISTINCT PDS.PATIENT_ID) AS PATIENT_COUNT FROM HC_Patient_Daily_Summary_v3 AS PDS JOIN HC_Patient_Medication_Summary_v3 AS PMS ON PDS.PATIENT_ID = PMS.PATIENT_ID WHERE PDS."INSURANCE_REC.PATIENT_AGE_GROUP_CD" = \'65+\' GROUP BY PMS.ADHERENCE_LEVEL;
 
 # """
+
+
+# Format of a retrieved few-shot example in the SQL generation prompt
+few_shot_example_template = """
+### Example #{index}
+User Query: {question}
+Generated Query: {sql_statement}
+"""
+
+# Seed examples of the few-shot example store, reviewed runs are added to them when FEW_SHOT_AUTO_APPEND is on
+few_shot_seed_examples = [
+    {
+        "question": "from which counties do our providers come from?",
+        "sql_statement": "SELECT DISTINCT G.COUNTY FROM D_HC_Providers_v3 AS P JOIN D_HC_Geography_v3 AS G ON P.ZIP_CODE = G.ZIP_CODE;"
+    },
+    {
+        "question": "Find the medication adherence level distribution for elderly patients (age 65+)",
+        "sql_statement": "SELECT PMS.ADHERENCE_LEVEL, COUNT(DISTINCT PDS.PATIENT_ID) AS PATIENT_COUNT FROM HC_Patient_Daily_Summary_v3 AS PDS JOIN HC_Patient_Medication_Summary_v3 AS PMS ON PDS.PATIENT_ID = PMS.PATIENT_ID WHERE PDS.\"INSURANCE_REC.PATIENT_AGE_GROUP_CD\" = '65+' GROUP BY PMS.ADHERENCE_LEVEL;"
+    },
+    {
+        "question": "Find the top 5 medications with the lowest adherence rates",
+        "sql_statement": "SELECT MEDICATION_NAME, AVG(ADHERENCE_RATE) AS AVG_ADHERENCE FROM HC_Patient_Medication_Summary_v3 GROUP BY MEDICATION_NAME ORDER BY AVG_ADHERENCE ASC LIMIT 5;"
+    },
+    {
+        "question": "How many patients use wearable devices?",
+        "sql_statement": "SELECT COUNT(DISTINCT PATIENT_ID) AS PATIENT_COUNT FROM HC_Patient_Device_Details_v3 WHERE DEVICE_CATEGORY = 'Wearable';"
+    },
+    {
+        "question": "Which insurance plans cover telehealth services and what is the average premium of their patients?",
+        "sql_statement": "SELECT IP.PLAN_NAME, AVG(PDS.\"INSURANCE_REC.PREMIUM_AMOUNT\") AS AVG_PREMIUM FROM HC_Patient_Daily_Summary_v3 AS PDS JOIN D_Insurance_Plan_v3 AS IP ON PDS.\"INSURANCE_REC.INSURANCE_PLAN_ID\" = IP.PLAN_ID WHERE IP.TELEHEALTH_COVERED = 1 GROUP BY IP.PLAN_NAME;"
+    },
+    {
+        "question": "How many patients have at least one chronic condition per age group?",
+        "sql_statement": "SELECT \"INSURANCE_REC.PATIENT_AGE_GROUP_CD\" AS AGE_GROUP, COUNT(DISTINCT PATIENT_ID) AS PATIENT_COUNT FROM HC_Patient_Daily_Summary_v3 WHERE \"INSURANCE_REC.CHRONIC_CONDITIONS_NUM\" > 0 GROUP BY \"INSURANCE_REC.PATIENT_AGE_GROUP_CD\";"
+    },
+    {
+        "question": "Which providers accepting new patients have the highest quality rating in each specialty?",
+        "sql_statement": "SELECT PRIMARY_SPECIALTY, PROVIDER_NAME, QUALITY_RATING FROM D_HC_Providers_v3 AS P WHERE ACCEPTING_NEW_PATIENTS = 1 AND QUALITY_RATING = (SELECT MAX(QUALITY_RATING) FROM D_HC_Providers_v3 WHERE PRIMARY_SPECIALTY = P.PRIMARY_SPECIALTY AND ACCEPTING_NEW_PATIENTS = 1) ORDER BY PRIMARY_SPECIALTY;"
+    },
+]
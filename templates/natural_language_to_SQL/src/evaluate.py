@@ -0,0 +1,357 @@
+import sys
+import os
+import json
+import math
+import time
+import asyncio
+import argparse
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.append("./")
+sys.path.append("../")
+
+# Step rendering on the console is off for batch runs unless explicitly requested
+os.environ.setdefault("STEP_TRACKER_CONSOLE", "off")
+
+from rich.console import Console
+from rich.table import Table
+
+from src.process.sql_process import SqlProcess
+from src.process.run_manager import RunManager, RunRecord
+from src.utils.chat_helpers import initialize_kernel
+from src.utils.db_helpers import get_sql_backend
+from src.utils.example_store import get_example_store
+from src.utils.llm_cache import LLMResponseCache, get_llm_response_cache, set_llm_response_cache
+from src.utils.query_cache import get_query_cache, set_query_cache
+from src.utils.run_context import RunContext
+from src.utils.usage_metrics import UsageStats
+
+console = Console()
+
+EVAL_CONCURRENCY = int(os.environ.get("EVAL_CONCURRENCY", "4"))
+
+
+def load_questions(path: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Load the evaluation set from a JSONL file.
+
+    Each line has a "question" (or "query"), an optional "id", and optionally the "expected_sql"
+    or the "expected_result" rows (lists or dicts) the answer is compared with.
+    """
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            item["question"] = item.get("question") or item.get("query")
+            if not item["question"]:
+                raise ValueError(f"{path}:{line_number}: missing 'question'")
+            item.setdefault("id", str(line_number))
+            questions.append(item)
+            if limit and len(questions) >= limit:
+                break
+    return questions
+
+
+def _normalize_value(value: Any) -> str:
+    if isinstance(value, float):
+        value = round(value, 6)
+        if value.is_integer():
+            value = int(value)
+    return "" if value is None else str(value)
+
+
+def normalize_rows(rows: List[Any]) -> Counter:
+    """Rows as a multiset of value tuples, ignoring row order, column names and column order."""
+    normalized = Counter()
+    for row in rows or []:
+        values = row.values() if isinstance(row, dict) else row if isinstance(row, (list, tuple)) else [row]
+        normalized[tuple(sorted(_normalize_value(value) for value in values))] += 1
+    return normalized
+
+
+async def check_answer(item: Dict[str, Any], result: Optional[Dict[str, Any]]) -> Optional[bool]:
+    """Compare the execution result with the expected rows, None when the item has no expectation."""
+    if "expected_result" in item:
+        expected_rows = item["expected_result"]
+    elif item.get("expected_sql"):
+        expected = await get_sql_backend().execute_async(item["expected_sql"])
+        if not isinstance(expected, dict) or "error" in expected:
+            console.print(f"[yellow]Expected SQL of question {item['id']} failed: {expected}[/yellow]")
+            return None
+        expected_rows = expected.get("result", [])
+    else:
+        return None
+    response = (result or {}).get("response")
+    if not isinstance(response, dict) or "result" not in response:
+        return False
+    return normalize_rows(response["result"]) == normalize_rows(expected_rows)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, math.ceil(q / 100 * len(values)) - 1))
+    return values[rank]
+
+
+def get_cache_state(use_caches: bool) -> Dict[str, bool]:
+    """Which caches the questions of a batch run with, recorded in the report."""
+    example_store = get_example_store()
+    return {
+        "query_cache": use_caches and get_query_cache() is not None,
+        "result_cache": use_caches and get_sql_backend().result_cache is not None,
+        "example_auto_append": use_caches and example_store is not None and example_store.auto_append,
+    }
+
+
+def disable_caches() -> Callable[[], None]:
+    """
+    Disable the query cache, the SQL result cache and the few-shot example auto-append.
+
+    Every question then goes through generation and execution, and no answer is reused by, or
+    becomes an example for, the next questions. Returns a function restoring the previous state.
+    """
+    query_cache = get_query_cache()
+    sql_backend = get_sql_backend()
+    result_cache = sql_backend.result_cache
+    example_store = get_example_store()
+    auto_append = example_store.auto_append if example_store is not None else False
+
+    set_query_cache(None)
+    sql_backend.result_cache = None
+    if example_store is not None:
+        example_store.auto_append = False
+
+    def restore():
+        set_query_cache(query_cache)
+        sql_backend.result_cache = result_cache
+        if example_store is not None:
+            example_store.auto_append = auto_append
+    return restore
+
+
+async def run_batch(kernel, questions: List[Dict[str, Any]], concurrency: int = EVAL_CONCURRENCY,
+                    use_caches: bool = False) -> List[RunRecord]:
+    """
+    Run every question through a SqlProcess on a bounded worker pool and return the run records.
+
+    The caches are disabled for the batch unless `use_caches` is set, so the results measure the
+    process rather than the answers of earlier questions.
+    """
+    async def handler(run_context: RunContext):
+        sql_process = SqlProcess(kernel, tracker=run_context.tracker)
+        await sql_process.start(run_context.user_query, run_context=run_context)
+        return sql_process.run_context.result
+
+    restore_caches = None if use_caches else disable_caches()
+    run_manager = RunManager(handler, workers=concurrency, queue_size=len(questions), history_size=len(questions)).start()
+    try:
+        records = [run_manager.submit(item["question"]) for item in questions]
+        for done, record in enumerate(records, 1):
+            await record.done.wait()
+            console.print(f"[cyan]{done}/{len(records)}[/cyan] {record.status}: {record.run_context.user_query}")
+    finally:
+        await run_manager.stop()
+        if restore_caches is not None:
+            restore_caches()
+    return records
+
+
+async def build_report(questions: List[Dict[str, Any]], records: List[RunRecord], wall_time: float,
+                       caches: Optional[Dict[str, bool]] = None) -> Dict[str, Any]:
+    """Aggregate execution accuracy, per-step latency percentiles, retry loops and token cost."""
+    results = []
+    step_durations: Dict[str, List[float]] = defaultdict(list)
+    failure_events: Counter = Counter()
+    step_usage: Dict[str, UsageStats] = defaultdict(UsageStats)
+
+    for item, record in zip(questions, records):
+        budget = record.tracker.get_budget_stats()
+        failures = 0
+        for transition in record.tracker.transitions:
+            step_durations[transition.step_name].append(transition.duration)
+            event = str(getattr(transition.next_event, "value", transition.next_event) or "")
+            if event.endswith("Failed"):
+                failures += 1
+                failure_events[event] += 1
+        for step_name, stats in record.tracker.llm_usage.items():
+            step_usage[step_name].merge(stats)
+        if record.status == "completed":
+            correct = await check_answer(item, record.result)
+        else:
+            correct = False if ("expected_result" in item or item.get("expected_sql")) else None
+        results.append({
+            "id": item["id"],
+            "question": item["question"],
+            "status": record.status,
+            "error": record.error,
+            "sql_statement": (record.result or {}).get("sql_statement"),
+            "correct": correct,
+            "gave_up_reason": budget.get("gave_up_reason"),
+            "sql_iterations": budget.get("iterations", 0),
+            "failed_checks": failures,
+            "llm_calls": budget.get("llm_calls", 0),
+            "total_tokens": budget.get("total_tokens", 0),
+            "duration": (record.finished_at - record.started_at).total_seconds() if record.started_at and record.finished_at else None,
+        })
+
+    evaluated = [result for result in results if result["correct"] is not None]
+    total_usage = UsageStats()
+    for stats in step_usage.values():
+        total_usage.merge(stats)
+    response_cache = get_llm_response_cache()
+    return {
+        "questions": len(results),
+        "completed": sum(1 for result in results if result["status"] == "completed"),
+        "failed": sum(1 for result in results if result["status"] == "failed"),
+        "gave_up": sum(1 for result in results if result["gave_up_reason"]),
+        "evaluated": len(evaluated),
+        "correct": sum(1 for result in evaluated if result["correct"]),
+        "execution_accuracy": round(sum(1 for result in evaluated if result["correct"]) / len(evaluated), 4) if evaluated else None,
+        "wall_time": round(wall_time, 3),
+        "steps": {
+            step_name: {
+                "count": len(durations),
+                "p50": round(percentile(durations, 50), 4),
+                "p90": round(percentile(durations, 90), 4),
+                "p99": round(percentile(durations, 99), 4),
+                "max": round(max(durations), 4),
+            }
+            for step_name, durations in step_durations.items()
+        },
+        "retries": {
+            "failed_checks": sum(failure_events.values()),
+            "by_event": dict(failure_events),
+            "runs_with_retries": sum(1 for result in results if result["failed_checks"]),
+            "max_sql_iterations": max((result["sql_iterations"] for result in results), default=0),
+        },
+        "usage": {
+            "steps": {step_name: stats.to_dict() for step_name, stats in step_usage.items()},
+            "total": total_usage.to_dict(),
+        },
+        "llm_response_cache": response_cache.get_stats() if response_cache is not None else None,
+        "caches": caches,
+        "results": results,
+    }
+
+
+def compare_reports(report: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Compare a report with a baseline report: flipped answers and accuracy, latency and cost deltas."""
+    baseline_results = {result["id"]: result for result in baseline.get("results", [])}
+    regressions, fixes = [], []
+    for result in report["results"]:
+        previous = baseline_results.get(result["id"])
+        if previous is None or previous.get("correct") is None or result["correct"] is None:
+            continue
+        if previous["correct"] and not result["correct"]:
+            regressions.append(result["id"])
+        elif result["correct"] and not previous["correct"]:
+            fixes.append(result["id"])
+
+    def delta(current, previous):
+        return None if current is None or previous is None else round(current - previous, 4)
+
+    return {
+        "regressions": regressions,
+        "fixes": fixes,
+        "execution_accuracy": delta(report["execution_accuracy"], baseline.get("execution_accuracy")),
+        "cost": delta(report["usage"]["total"]["cost"], baseline.get("usage", {}).get("total", {}).get("cost")),
+        "total_tokens": delta(report["usage"]["total"]["total_tokens"], baseline.get("usage", {}).get("total", {}).get("total_tokens")),
+        "step_p50": {
+            step_name: delta(stats["p50"], baseline.get("steps", {}).get(step_name, {}).get("p50"))
+            for step_name, stats in report["steps"].items()
+        },
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    """Print the evaluation report on the console."""
+    console.print("\n[bold magenta]============== EVALUATION REPORT ==============[/bold magenta]")
+    accuracy = report["execution_accuracy"]
+    console.print(f"[bold cyan]Questions:[/bold cyan] {report['questions']} "
+                  f"(completed {report['completed']}, failed {report['failed']}, gave up {report['gave_up']}) "
+                  f"in {report['wall_time']:.1f}s")
+    console.print(f"[bold cyan]Execution accuracy:[/bold cyan] "
+                  + (f"{accuracy:.1%} ({report['correct']}/{report['evaluated']})" if accuracy is not None else "n/a (no expected results)"))
+
+    table = Table(show_header=True, header_style="bold", title="Step Latency (s)")
+    for column in ("Step", "Count", "p50", "p90", "p99", "Max", "LLM Calls", "Tokens", "Cached %", "Cost ($)"):
+        table.add_column(column)
+    usage_steps = report["usage"]["steps"]
+    for step_name, stats in report["steps"].items():
+        usage = usage_steps.get(step_name, {})
+        table.add_row(
+            step_name, str(stats["count"]),
+            f"{stats['p50']:.3f}", f"{stats['p90']:.3f}", f"{stats['p99']:.3f}", f"{stats['max']:.3f}",
+            str(usage.get("calls", 0)), str(usage.get("total_tokens", 0)),
+            f"{usage.get('cached_prompt_ratio', 0.0):.0%}", f"{usage.get('cost', 0.0):.4f}"
+        )
+    console.print(table)
+
+    retries = report["retries"]
+    console.print(f"[bold cyan]Failed checks (retry loops):[/bold cyan] {retries['failed_checks']} in {retries['runs_with_retries']} runs, "
+                  f"max {retries['max_sql_iterations']} SQL iterations in a run")
+    for event, count in retries["by_event"].items():
+        console.print(f"  {event}: {count}")
+    total = report["usage"]["total"]
+    console.print(f"[bold cyan]Tokens:[/bold cyan] {total['total_tokens']} ({total['prompt_tokens']} prompt, "
+                  f"{total['cached_prompt_tokens']} cached, {total['completion_tokens']} completion), "
+                  f"[bold cyan]cost:[/bold cyan] ${total['cost']:.4f}")
+    if report.get("caches"):
+        enabled = [name for name, on in report["caches"].items() if on]
+        console.print(f"[bold cyan]Caches:[/bold cyan] {', '.join(enabled) if enabled else 'disabled'}")
+    if report["llm_response_cache"]:
+        cache = report["llm_response_cache"]
+        console.print(f"[bold cyan]LLM response cache:[/bold cyan] {cache['hits']} replayed, {cache['misses']} live calls")
+
+    comparison = report.get("comparison")
+    if comparison:
+        console.print("\n[bold magenta]============== REGRESSIONS VS BASELINE ==============[/bold magenta]")
+        console.print(f"[bold cyan]Accuracy delta:[/bold cyan] {comparison['execution_accuracy']}, "
+                      f"[bold cyan]cost delta:[/bold cyan] {comparison['cost']}, "
+                      f"[bold cyan]token delta:[/bold cyan] {comparison['total_tokens']}")
+        if comparison["regressions"]:
+            console.print(f"[bold red]Regressed ({len(comparison['regressions'])}):[/bold red] {', '.join(comparison['regressions'])}")
+        if comparison["fixes"]:
+            console.print(f"[bold green]Fixed ({len(comparison['fixes'])}):[/bold green] {', '.join(comparison['fixes'])}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Evaluate the NL-to-SQL process on a JSONL file of questions.")
+    parser.add_argument("questions", help="JSONL file with one {\"question\", \"expected_sql\" | \"expected_result\"} object per line")
+    parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY, help="Number of questions processed concurrently")
+    parser.add_argument("--replay-dir", default=None, help="Directory caching the LLM responses for deterministic replays")
+    parser.add_argument("--report", default="evaluation_report.json", help="Path of the JSON report")
+    parser.add_argument("--baseline", default=None, help="Previous JSON report to compare with")
+    parser.add_argument("--limit", type=int, default=None, help="Only evaluate the first N questions")
+    parser.add_argument("--use-caches", action="store_true",
+                        help="Keep the query cache, the SQL result cache and the few-shot example auto-append enabled")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions, args.limit)
+    if args.replay_dir:
+        set_llm_response_cache(LLMResponseCache(args.replay_dir))
+
+    kernel = await initialize_kernel()
+    start_time = time.perf_counter()
+    caches = get_cache_state(args.use_caches)
+    records = await run_batch(kernel, questions, args.concurrency, use_caches=args.use_caches)
+    report = await build_report(questions, records, time.perf_counter() - start_time, caches)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["comparison"] = compare_reports(report, json.load(f))
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    print_report(report)
+    console.print(f"\nReport written to {args.report}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -9,8 +9,11 @@ sys.path.append("./")
 sys.path.append("../")
 
 from src.process.sql_process import SqlProcess
-from src.utils.chat_helpers import initialize_kernel
+from src.utils.chat_helpers import initialize_kernel, call_function_streaming
+from src.utils.result_encoder import encode_sql_result
 from src.utils.step_tracker import get_tracker
+from src.utils.tracing import exporter_configured, set_up_tracing, shutdown_tracing
+from src.utils.prompt_capture import set_prompt_sink
 
 console = Console()
 
@@ -54,14 +57,9 @@ async def main():
     # Track SQL result retrieval
     tracker.start_step("ResultRetrieval", {"query": query})
     
-    if os.path.exists("response.json"):
-        with open("response.json", "r") as f:
-            sql_result = f.read()
-        sql_result = json.loads(sql_result)
-        if sql_result["query"] == query:
-            sql_result = sql_result["response"]
-        else:            
-            sql_result = "No response found."
+    # The ExecutionStep hands the result back in memory through the run context
+    if sql_process.run_context.result is not None:
+        sql_result = sql_process.run_context.result["response"]
     else:
         sql_result = "No response found."
 
@@ -74,9 +72,21 @@ async def main():
     # Track final answer generation
     tracker.start_step("FinalAnswerGeneration", {"query": query, "sql_result": sql_result})
     
-    final_answer = await kernel.invoke(final_answer_fn, query=query, context=str(sql_result))
     console.print("[green]Final Answer:[/green]")
-    console.print(str(final_answer))
+    
+    # Print the answer as it is generated
+    async def print_delta(delta: str):
+        console.print(delta, end="", markup=False, highlight=False)
+    
+    final_answer = await call_function_streaming(
+        kernel,
+        final_answer_fn,
+        on_delta=print_delta,
+        tracker=tracker,
+        query=query,
+        context=encode_sql_result(sql_result)
+    )
+    console.print()
     
     # End final answer generation tracking
     tracker.end_step(next_step="Complete", next_event="AnswerGenerated", output_data=str(final_answer))
@@ -126,4 +136,8 @@ async def main():
 if __name__ == "__main__":
     # Import datetime here to avoid circular imports
     from datetime import datetime
+    if exporter_configured():
+        set_up_tracing()
     asyncio.run(main())
+    shutdown_tracing()
+    set_prompt_sink(None)
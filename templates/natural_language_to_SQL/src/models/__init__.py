@@ -6,13 +6,15 @@ from .step_models import (
     BusinessRulesStepInput,
     ValidationStepInput,
     ExecutionStepInput,
+    ExecutionResult,
     Execution2TableNames,
     GetTableNames,
     GetColumnNames,
     SQLGenerateResult,
     ValidationResult,
     ValidTableName,
-    TableColumns
+    TableColumns,
+    get_table_names_response_format
 )
 
 __all__ = [
@@ -23,11 +25,13 @@ __all__ = [
     "BusinessRulesStepInput",
     "ValidationStepInput",
     "ExecutionStepInput",
+    "ExecutionResult",
     "Execution2TableNames",
     "GetTableNames",
     "GetColumnNames",
     "SQLGenerateResult",
     "ValidationResult",
     "ValidTableName",
-    "TableColumns"
+    "TableColumns",
+    "get_table_names_response_format"
 ]
\ No newline at end of file
@@ -9,13 +9,16 @@ class SQLEvents(str, Enum):
     
     # Process control events
     StartProcess = "StartProcess"
+    StartFromCache = "StartFromCache"
     ErrorOccurred = "ErrorOccurred"
     
     # Step completion events
     TableNameStepDone = "TableNameStepDone"
     ColumnNameStepDone = "ColumnNameStepDone"
+    SchemaSelectionStepDone = "SchemaSelectionStepDone"
     SQLGenerationStepDone = "SQLGenerationStepDone"
     SQLGenerationStepFailed = "SQLGenerationStepFailed"
+    SQLPrecheckFailed = "SQLPrecheckFailed"
     BusinessRulesStepDone = "BusinessRulesStepDone"
     BusinessRulesFailed = "BusinessRulesFailed"
     
@@ -23,6 +26,13 @@ class SQLEvents(str, Enum):
     ValidationPassed = "ValidationPassed"
     ValidationFailed = "ValidationFailed"
     
+    # Parallel review events (business rules and validation in one step)
+    SQLReviewPassed = "SQLReviewPassed"
+    SQLReviewFailed = "SQLReviewFailed"
+    
     # Execution events
     ExecutionSuccess = "ExecutionSuccess"
     ExecutionError = "ExecutionError"
+    
+    # Terminal event when the run is out of budget or looping
+    GiveUp = "GiveUp"
@@ -1,28 +1,48 @@
 import sys
 sys.path.append("../../")
 
-from pydantic import BaseModel, Field
-from typing import List, Any, Union, Literal, Optional
+from functools import lru_cache
+from pydantic import BaseModel, Field, create_model, field_validator
+from typing import List, Any, Union, Literal, Optional, Tuple, Type
+
+from src.constants.data_model import global_database_model
+
+VALID_TABLE_NAMES = frozenset(table["TableName"] for table in global_database_model)
 
 
 # Structured Outputs Models
 
 class ValidTableName(BaseModel):
-    table_name: Literal['HC_Patient_Daily_Summary_v3',
-                        'HC_Patient_Device_Details_v3',
-                        'HC_Patient_Medication_Summary_v3',
-                        'D_Patient_Type_v3',
-                        'D_Insurance_Plan_v3',
-                        'D_HC_Geography_v3',
-                        'D_HC_Procedures_v3',
-                        'D_HC_Providers_v3',
-                        'D_Patient_Devices_v3']
+    table_name: str
+
+    @field_validator("table_name")
+    @classmethod
+    def check_table_exists(cls, value: str) -> str:
+        """Table names are validated against the database model instead of a static list."""
+        if value not in VALID_TABLE_NAMES:
+            raise ValueError(f"Unknown table name: {value}")
+        return value
 
 
 class GetTableNames(BaseModel):
     table_names: List[ValidTableName]
 
 
+@lru_cache(maxsize=128)
+def get_table_names_response_format(candidate_tables: Tuple[str, ...]) -> Type[BaseModel]:
+    """
+    Build the structured output model for table selection, restricted to the candidate tables.
+
+    The candidates are exposed as an enum in the JSON schema so the model can only pick among them.
+    Parse results are converted to GetTableNames with `GetTableNames.model_validate(result.model_dump())`.
+    Without candidates (e.g. an empty retrieval result) every table of the database model is allowed.
+    """
+    if not candidate_tables:
+        candidate_tables = tuple(sorted(VALID_TABLE_NAMES))
+    candidate_table_name = create_model("ValidTableName", table_name=(Literal[candidate_tables], ...))
+    return create_model("GetTableNames", table_names=(List[candidate_table_name], ...))
+
+
 class TableColumns(BaseModel):
     table_name: str
     column_names: List[str]
@@ -83,6 +103,8 @@ class ValidationStepInput(BaseModel):
     user_query: str
     table_column_names: GetColumnNames
     sql_statement: str
+    # False when the business rule issues were ignored after the maximum number of retries
+    business_rules_passed: bool = True
 
 
 class ExecutionStepInput(BaseModel):
@@ -92,6 +114,20 @@ class ExecutionStepInput(BaseModel):
     sql_statement: str
     table_names: Optional[GetTableNames] = None
     column_names: Optional[List[str]] = None
+    from_cache: bool = False
+    # True only when every review check passed, SQL let through after the retry limit is not cached
+    review_passed: bool = False
+    # Key of the matched query cache entry, which may differ from the user query on a semantic hit
+    cache_key: Optional[str] = None
+
+
+class ExecutionResult(BaseModel):
+    """Result of the SQL execution, emitted as the ExecutionSuccess payload."""
+    user_query: str
+    sql_statement: str
+    response: Any
+    # Set when the run stopped early (budget exhausted or loop detected) with the best answer so far
+    gave_up_reason: Optional[str] = None
 
 
 class Execution2TableNames(BaseModel):
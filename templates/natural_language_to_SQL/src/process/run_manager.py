@@ -0,0 +1,158 @@
+import sys
+sys.path.append("../../")
+
+import os
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from rich.console import Console
+
+from src.utils.run_context import RunContext
+from src.utils.step_tracker import StepTracker
+
+console = Console()
+
+RUN_WORKERS = int(os.environ.get("RUN_WORKERS", "4"))
+RUN_QUEUE_SIZE = int(os.environ.get("RUN_QUEUE_SIZE", "32"))
+# Number of finished runs kept in memory for result retrieval
+RUN_HISTORY_SIZE = int(os.environ.get("RUN_HISTORY_SIZE", "256"))
+
+RunHandler = Callable[[RunContext], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class RunQueueFullError(Exception):
+    """Raised when a run is submitted while the queue is at capacity."""
+
+
+class RunRecord:
+    """Status and result of a single run submitted to the RunManager."""
+
+    def __init__(self, query: str):
+        self.run_context = RunContext(user_query=query)
+        self.run_context.tracker = StepTracker(run_id=self.run_context.run_id)
+        self.status = "queued"  # "queued", "running", "completed" or "failed"
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.submitted_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.done = asyncio.Event()
+
+    @property
+    def run_id(self) -> str:
+        return self.run_context.run_id
+
+    @property
+    def tracker(self) -> StepTracker:
+        return self.run_context.tracker
+
+    def to_dict(self, include_transitions: bool = False) -> Dict[str, Any]:
+        """Return a serializable view of the run."""
+        data = {
+            "run_id": self.run_id,
+            "query": self.run_context.user_query,
+            "status": self.status,
+            "submitted_at": self.submitted_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "result": self.result,
+            "error": self.error,
+            "budget": self.tracker.get_budget_stats(),
+        }
+        if include_transitions:
+            data["transitions"] = self.tracker.get_transition_history_serializable()
+        return data
+
+
+class RunManager:
+    """
+    Bounded asyncio worker pool that executes SQL process runs concurrently.
+
+    Runs are queued on a bounded asyncio.Queue; when the queue is full `submit` raises
+    RunQueueFullError so that callers can apply backpressure (e.g. HTTP 429). Each run gets its
+    own RunContext and StepTracker, and its result is kept in memory until it is evicted from
+    the run history.
+    """
+
+    def __init__(self, handler: RunHandler, workers: int = RUN_WORKERS, queue_size: int = RUN_QUEUE_SIZE,
+                 history_size: int = RUN_HISTORY_SIZE):
+        self.handler = handler
+        self.workers = workers
+        self.history_size = history_size
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._runs: "OrderedDict[str, RunRecord]" = OrderedDict()
+        self._worker_tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """Start the worker tasks. Must be called from a running event loop."""
+        if self._worker_tasks:
+            return self
+        for i in range(self.workers):
+            self._worker_tasks.append(asyncio.create_task(self._worker(i)))
+        console.print(f"[bold green]RunManager started with {self.workers} workers (queue size {self._queue.maxsize})[/bold green]")
+        return self
+
+    async def stop(self):
+        """Cancel the worker tasks."""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def submit(self, query: str) -> RunRecord:
+        """Queue a query for execution and return its run record."""
+        record = RunRecord(query)
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            raise RunQueueFullError(f"Run queue is full ({self._queue.maxsize} pending runs)")
+        self._runs[record.run_id] = record
+        self._trim_history()
+        return record
+
+    def get(self, run_id: str) -> Optional[RunRecord]:
+        return self._runs.get(run_id)
+
+    def list_runs(self) -> List[RunRecord]:
+        return list(self._runs.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return queue and worker statistics."""
+        statuses: Dict[str, int] = {}
+        for record in self._runs.values():
+            statuses[record.status] = statuses.get(record.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "queue_size": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "runs": statuses,
+        }
+
+    def _trim_history(self):
+        """Evict the oldest finished runs once the history is over capacity."""
+        finished = [run_id for run_id, record in self._runs.items() if record.done.is_set()]
+        while len(self._runs) > self.history_size and finished:
+            del self._runs[finished.pop(0)]
+
+    async def _worker(self, worker_id: int):
+        while True:
+            record: RunRecord = await self._queue.get()
+            record.status = "running"
+            record.started_at = datetime.now()
+            try:
+                record.result = await self.handler(record.run_context)
+                record.status = "completed"
+            except asyncio.CancelledError:
+                record.status = "failed"
+                record.error = "Run cancelled"
+                raise
+            except Exception as e:
+                console.print(f"[bold red]Run {record.run_id} failed on worker {worker_id}: {e}[/bold red]")
+                record.status = "failed"
+                record.error = str(e)
+            finally:
+                record.finished_at = datetime.now()
+                record.done.set()
+                self._queue.task_done()
@@ -1,4 +1,8 @@
 import sys
+import os
+import time
+from functools import lru_cache
+from typing import List
 
 sys.path.append("../../")
 
@@ -8,49 +12,116 @@ from semantic_kernel.processes.kernel_process import KernelProcess
 from semantic_kernel.processes.local_runtime.local_event import KernelProcessEvent
 from semantic_kernel.processes.local_runtime.local_kernel_process import start
 
-from src.models.step_models import TableNamesStepInput
+from src.models.step_models import TableNamesStepInput, ExecutionStepInput
 from src.models.events import SQLEvents
 from src.steps import (
     TableNameStep,
     ColumnNameStep,
+    SchemaSelectionStep,
     SQLGenerationStep,
     BusinessRulesStep,
     ValidationStep,
+    SQLReviewStep,
     ExecutionStep
 )
 from src.utils.step_tracker import get_tracker
+from src.utils.query_cache import get_query_cache, schema_fingerprint
+from src.utils.run_context import RunContext, set_run_context, reset_run_context
+from src.utils.chat_helpers import has_embedding_service, call_text_embedding
+from src.utils.schema_index import get_schema_index
+from src.utils.result_encoder import get_token_counter
+from src.constants.data_model import global_database_model, json_rules
 from rich.console import Console
 console = Console()
 
+# Run the business rules and validation checks concurrently in a single review step,
+# set to "false" to run BusinessRulesStep and then ValidationStep in sequence
+PARALLEL_SQL_REVIEW = os.environ.get("PARALLEL_SQL_REVIEW", "true").lower() == "true"
+# Table and column selection: "combined" (one LLM call), "two_stage" (TableNameStep then ColumnNameStep)
+# or "auto" to use the combined selection when the schema fits SCHEMA_SELECTION_MAX_TOKENS
+SCHEMA_SELECTION_MODE = os.environ.get("SCHEMA_SELECTION_MODE", "auto").lower()
+SCHEMA_SELECTION_MAX_TOKENS = int(os.environ.get("SCHEMA_SELECTION_MAX_TOKENS", "8000"))
+
+
+@lru_cache(maxsize=1)
+def estimate_schema_tokens() -> int:
+    """Estimate the prompt tokens of the full schema, as rendered for the combined selection."""
+    schema_index = get_schema_index()
+    return get_token_counter()(schema_index.render_tables(schema_index.tables))
 
 
 class SqlProcess():
 
-    def __init__(self, kernel):
+    def __init__(self, kernel, query_cache=None, tracker=None, parallel_review=None, schema_selection=None):
         self.kernel = kernel
+        self.parallel_review = PARALLEL_SQL_REVIEW if parallel_review is None else parallel_review
+        self.schema_selection = self._choose_schema_selection(schema_selection or SCHEMA_SELECTION_MODE)
         self.process = self.get_sql_process()
-        # Initialize the step tracker with this process
-        self.tracker = get_tracker().set_process(self.process)
+        # Use the process-wide query cache unless a specific one is provided
+        self.query_cache = query_cache if query_cache is not None else get_query_cache()
+        # Initialize the step tracker with this process (a per-run tracker when running concurrently)
+        self.tracker = (tracker or get_tracker()).set_process(self.process)
+        self.run_context = None
+
+    async def _get_initial_event(self, query) -> KernelProcessEvent:
+        """Build the initial event, skipping straight to execution when the query cache has a validated SQL statement."""
+        if self.query_cache is not None:
+            # Invalidate cached entries if the data model or the business rules changed since they were stored
+            self.query_cache.set_schema_version(schema_fingerprint(global_database_model, json_rules))
+            if self.query_cache.embed_fn is None and has_embedding_service(self.kernel):
+                self.query_cache.embed_fn = lambda text: call_text_embedding(self.kernel, text)
 
-    
-    async def start(self, query):
+            cached = await self.query_cache.lookup(query)
+            if cached is not None:
+                console.print(f"[green]Query cache hit, skipping to execution:[/green] {cached.sql_statement}")
+                cached_input = ExecutionStepInput(
+                    user_query=query,
+                    table_column_names=cached.table_column_names,
+                    sql_statement=cached.sql_statement,
+                    from_cache=True,
+                    cache_key=cached.key
+                )
+                return KernelProcessEvent(id=SQLEvents.StartFromCache, data=cached_input)
+
+        return KernelProcessEvent(id=SQLEvents.StartProcess, data=TableNamesStepInput(user_query=query))
+
+    async def start(self, query, run_context: RunContext = None):
         console.print(f"[green]Processing query:[/green] {query}")
-        initial_input = TableNamesStepInput(user_query=query)
-        
-        # Reset tracker for a fresh start
-        self.tracker.reset()
+        # Retry counters and notes live in the run context, so concurrent runs don't share them
+        self.run_context = run_context or RunContext(user_query=query)
+        if self.run_context.tracker is None:
+            self.run_context.tracker = self.tracker
+        # The steps read the cache this process was built with, not the process-wide one
+        self.run_context.query_cache = self.query_cache
+        # The budget clock starts when the run starts, not when it was queued
+        self.run_context.budget.started_at = time.monotonic()
+        self.tracker.set_budget(self.run_context.budget)
+        token = set_run_context(self.run_context)
+        # Parent of the step spans when OpenTelemetry tracing is enabled
+        self.tracker.start_run_span(query)
+        try:
+            initial_event = await self._get_initial_event(query)
+            
+            # Reset tracker for a fresh start
+            self.tracker.reset()
+            
+            # Start tracking the process start - using the async version
+            await self.tracker.start_step_async("Process Start", initial_event.data)
         
-        # Start tracking the process start - using the async version
-        await self.tracker.start_step_async("Process Start", initial_input)
-    
-        state = await start(
-                process=self.process,
-                kernel=self.kernel,
-                initial_event=KernelProcessEvent(id=SQLEvents.StartProcess, data=initial_input)
-            )
+            state = await start(
+                    process=self.process,
+                    kernel=self.kernel,
+                    initial_event=initial_event
+                )
+        except Exception as e:
+            self.tracker.end_run_span(error=e)
+            raise
+        finally:
+            reset_run_context(token)
             
         # End the process tracking - using the async version
         await self.tracker.end_step_async(next_step="Process End")
+        self.tracker.end_run_span()
         
         # Print the complete transition history
         self.tracker.print_transition_history()
@@ -58,6 +129,27 @@ class SqlProcess():
         console.print("\n[green]Process completed![/green]")
         return state
 
+    @staticmethod
+    def _choose_schema_selection(mode: str) -> str:
+        """Resolve the "auto" selection mode from the schema size, returning "combined" or "two_stage"."""
+        if mode in ("combined", "two_stage"):
+            return mode
+        schema_tokens = estimate_schema_tokens()
+        selection = "combined" if schema_tokens <= SCHEMA_SELECTION_MAX_TOKENS else "two_stage"
+        print(f"Schema selection: {selection} (schema ~{schema_tokens} tokens, limit {SCHEMA_SELECTION_MAX_TOKENS})")
+        return selection
+
+    @classmethod
+    def get_step_names(cls, parallel_review: bool = None, schema_selection: str = None) -> List[str]:
+        """Names of the steps of the process built with these options, in flow order."""
+        parallel_review = PARALLEL_SQL_REVIEW if parallel_review is None else parallel_review
+        schema_selection = cls._choose_schema_selection(schema_selection or SCHEMA_SELECTION_MODE)
+        step_names = ["SchemaSelectionStep"] if schema_selection == "combined" else ["TableNameStep", "ColumnNameStep"]
+        step_names.append("SQLGenerationStep")
+        step_names += ["SQLReviewStep"] if parallel_review else ["BusinessRulesStep", "ValidationStep"]
+        step_names.append("ExecutionStep")
+        return step_names
+
     def get_sql_process(self) -> KernelProcess:
         """
         Build and configure the SQL generation process with all steps and their transitions.
@@ -69,71 +161,115 @@ class SqlProcess():
         process = ProcessBuilder(name="SQLGenerationProcess")
 
         # Add steps to the process
-        table_step = process.add_step(TableNameStep)
-        print("Added TableNameStep to process.")
-        column_step = process.add_step(ColumnNameStep)
-        print("Added ColumnNameStep to process.")
+        if self.schema_selection == "combined":
+            # A single step selects tables and columns, retries come back to it instead of TableNameStep
+            table_step = process.add_step(SchemaSelectionStep)
+            print("Added SchemaSelectionStep to process.")
+        else:
+            table_step = process.add_step(TableNameStep)
+            print("Added TableNameStep to process.")
+            column_step = process.add_step(ColumnNameStep)
+            print("Added ColumnNameStep to process.")
         sql_generation_step = process.add_step(SQLGenerationStep)
         print("Added SQLGenerationStep to process.")
-        business_rules_step = process.add_step(BusinessRulesStep)
-        print("Added BusinessRulesStep to process.")
-        validation_step = process.add_step(ValidationStep)
-        print("Added ValidationStep to process.")
+        if self.parallel_review:
+            review_step = process.add_step(SQLReviewStep)
+            print("Added SQLReviewStep to process.")
+        else:
+            business_rules_step = process.add_step(BusinessRulesStep)
+            print("Added BusinessRulesStep to process.")
+            validation_step = process.add_step(ValidationStep)
+            print("Added ValidationStep to process.")
         execution_step = process.add_step(ExecutionStep)
         print("Added ExecutionStep to process.")
 
         # Define the process flow by connecting events to steps
         print("Defining process flow...")
         process.on_input_event(event_id=SQLEvents.StartProcess).send_event_to(target=table_step, parameter_name="data")
-        print("Configured process flow: StartProcess -> TableNameStep.")
-        
-        table_step.on_event(event_id=SQLEvents.TableNameStepDone).send_event_to(
-            target=column_step, parameter_name="data"
-        )
-        print("Configured process flow: TableNameStepDone -> ColumnNameStep.")
-        
-        column_step.on_event(event_id=SQLEvents.ColumnNameStepDone).send_event_to(
-            target=sql_generation_step, parameter_name="data"
-        )
-        print("Configured process flow: ColumnNameStepDone -> SQLGenerationStep.")
+        table_step_name = "SchemaSelectionStep" if self.schema_selection == "combined" else "TableNameStep"
+        print(f"Configured process flow: StartProcess -> {table_step_name}.")
+
+        process.on_input_event(event_id=SQLEvents.StartFromCache).send_event_to(target=execution_step, parameter_name="data")
+        print("Configured process flow: StartFromCache -> ExecutionStep.")
         
-        sql_generation_step.on_event(event_id=SQLEvents.SQLGenerationStepDone).send_event_to(
-            target=business_rules_step, parameter_name="data"
-        )
-        print("Configured process flow: SQLGenerationStepDone -> BusinessRulesStep.")
+        if self.schema_selection == "combined":
+            table_step.on_event(event_id=SQLEvents.SchemaSelectionStepDone).send_event_to(
+                target=sql_generation_step, parameter_name="data"
+            )
+            print("Configured process flow: SchemaSelectionStepDone -> SQLGenerationStep.")
+        else:
+            table_step.on_event(event_id=SQLEvents.TableNameStepDone).send_event_to(
+                target=column_step, parameter_name="data"
+            )
+            print("Configured process flow: TableNameStepDone -> ColumnNameStep.")
+            
+            column_step.on_event(event_id=SQLEvents.ColumnNameStepDone).send_event_to(
+                target=sql_generation_step, parameter_name="data"
+            )
+            print("Configured process flow: ColumnNameStepDone -> SQLGenerationStep.")
         
         sql_generation_step.on_event(event_id=SQLEvents.SQLGenerationStepFailed).send_event_to(
             target=table_step, parameter_name="data"
         )
-        print("Configured process flow: SQLGenerationStepFailed -> TableNameStep.")
+        print(f"Configured process flow: SQLGenerationStepFailed -> {table_step_name}.")
         
-        business_rules_step.on_event(event_id=SQLEvents.BusinessRulesStepDone).send_event_to(
-            target=validation_step, parameter_name="data"
-        )
-        print("Configured process flow: BusinessRulesStepDone -> ValidationStep.")
-        
-        business_rules_step.on_event(event_id=SQLEvents.BusinessRulesFailed).send_event_to(
+        sql_generation_step.on_event(event_id=SQLEvents.SQLPrecheckFailed).send_event_to(
             target=sql_generation_step, parameter_name="data"
         )
-        print("Configured process flow: BusinessRulesFailed -> SQLGenerationStep.")
-        
-        validation_step.on_event(event_id=SQLEvents.ValidationPassed).send_event_to(
-            target=execution_step, parameter_name="data"
-        )
-        print("Configured process flow: ValidationPassed -> ExecutionStep.")
+        print("Configured process flow: SQLPrecheckFailed -> SQLGenerationStep.")
         
-        validation_step.on_event(event_id=SQLEvents.ValidationFailed).send_event_to(
-            target=sql_generation_step, parameter_name="data"
-        )
-        print("Configured process flow: ValidationFailed -> SQLGenerationStep.")
+        if self.parallel_review:
+            sql_generation_step.on_event(event_id=SQLEvents.SQLGenerationStepDone).send_event_to(
+                target=review_step, parameter_name="data"
+            )
+            print("Configured process flow: SQLGenerationStepDone -> SQLReviewStep.")
+            
+            review_step.on_event(event_id=SQLEvents.SQLReviewPassed).send_event_to(
+                target=execution_step, parameter_name="data"
+            )
+            print("Configured process flow: SQLReviewPassed -> ExecutionStep.")
+            
+            review_step.on_event(event_id=SQLEvents.SQLReviewFailed).send_event_to(
+                target=sql_generation_step, parameter_name="data"
+            )
+            print("Configured process flow: SQLReviewFailed -> SQLGenerationStep.")
+        else:
+            sql_generation_step.on_event(event_id=SQLEvents.SQLGenerationStepDone).send_event_to(
+                target=business_rules_step, parameter_name="data"
+            )
+            print("Configured process flow: SQLGenerationStepDone -> BusinessRulesStep.")
+            
+            business_rules_step.on_event(event_id=SQLEvents.BusinessRulesStepDone).send_event_to(
+                target=validation_step, parameter_name="data"
+            )
+            print("Configured process flow: BusinessRulesStepDone -> ValidationStep.")
+            
+            business_rules_step.on_event(event_id=SQLEvents.BusinessRulesFailed).send_event_to(
+                target=sql_generation_step, parameter_name="data"
+            )
+            print("Configured process flow: BusinessRulesFailed -> SQLGenerationStep.")
+            
+            validation_step.on_event(event_id=SQLEvents.ValidationPassed).send_event_to(
+                target=execution_step, parameter_name="data"
+            )
+            print("Configured process flow: ValidationPassed -> ExecutionStep.")
+            
+            validation_step.on_event(event_id=SQLEvents.ValidationFailed).send_event_to(
+                target=sql_generation_step, parameter_name="data"
+            )
+            print("Configured process flow: ValidationFailed -> SQLGenerationStep.")
         
         execution_step.on_event(event_id=SQLEvents.ExecutionSuccess).stop_process()
         print("Configured process flow: ExecutionSuccess -> Stop Process.")
         
+        table_step.on_event(event_id=SQLEvents.GiveUp).stop_process()
+        sql_generation_step.on_event(event_id=SQLEvents.GiveUp).stop_process()
+        print("Configured process flow: GiveUp -> Stop Process.")
+        
         execution_step.on_event(event_id=SQLEvents.ExecutionError).send_event_to(
             target=table_step, parameter_name="data"
         )
-        print("Configured process flow: ExecutionError -> TableNameStep.")
+        print(f"Configured process flow: ExecutionError -> {table_step_name}.")
 
         print("SQL Generation Process built successfully.")
         return process.build()
@@ -4,17 +4,29 @@ sys.path.append("../")
 sys.path.append("../src/")
 import json
 import os
-from typing import List, Dict, Any, Optional
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, BackgroundTasks
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, BackgroundTasks, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from pydantic import BaseModel
 
 from src.utils.step_tracker import get_tracker, StepTracker
 from src.process.sql_process import SqlProcess
-from src.utils.chat_helpers import initialize_kernel
+from src.process.run_manager import RunManager, RunQueueFullError
+from src.utils.chat_helpers import initialize_kernel, warm_up_services, call_function_streaming
+from src.utils.result_encoder import encode_sql_result
+from src.utils.run_context import RunContext
+from src.utils.schema_retrieval import get_schema_retrieval_index
+from src.utils.usage_metrics import get_metrics_registry
+from src.utils.broadcaster import ConnectionManager
+from src.utils.transition_store import get_transition_store
+from src.utils.tracing import exporter_configured, set_up_tracing, shutdown_tracing
+from src.utils.db_helpers import get_sql_backend
+from src.utils.sql_prevalidation import close_sql_prevalidator
+from src.utils.prompt_capture import MemoryPromptSink, get_prompt_sink, set_prompt_sink
 
 # Define the prompt template for final answer generation
 prompt_template = """You are a helpful assistant, you will be given a query, and a context from our SQL database. Your task is to formulate a final answer based on the query and the context from the database.
@@ -25,6 +37,7 @@ Query: {{$query}}
 DB Context:
 {{$context}}
 
+If the context says the result was truncated, say that the answer is based on the first rows only.
 """
 
 app = FastAPI()
@@ -44,38 +57,7 @@ frontend_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__fi
 # Mount the static files directory
 app.mount("/static", StaticFiles(directory=frontend_dir), name="static")
 
-# Store active connections
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        print(f"WebSocket connected. Total connections: {len(self.active_connections)}")
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        print(f"WebSocket disconnected. Remaining connections: {len(self.active_connections)}")
-
-    async def broadcast(self, message: Dict[str, Any]):
-        print(f"Broadcasting message: {message.get('type')}")
-        disconnected = []                
-
-        try:
-            connection = self.active_connections[-1]  # Send to the last connected client
-            message['input_data'] = str(message.get('input_data', ''))
-            message['output_data'] = str(message.get('output_data', ''))
-            await connection.send_json(message)
-        except Exception as e:
-            print(f"Error sending message: {e}")
-            # disconnected.append(connection)
-    
-    # # Clean up disconnected sockets
-    # for conn in disconnected:
-    #     if conn in self.active_connections:
-    #             self.active_connections.remove(conn)
-
+# Fan-out broadcaster, one bounded queue and writer task per connection
 manager = ConnectionManager()
 
 # Models
@@ -97,74 +79,62 @@ class StepTransition(BaseModel):
 class QueryRequest(BaseModel):
     query: str
 
+# Dashboard entries of the steps, by step name
+STEP_DESCRIPTIONS = {
+    "TableNameStep": ("table_name_step", "Table Name Step", "Extracts relevant table names from the query"),
+    "ColumnNameStep": ("column_name_step", "Column Name Step", "Identifies relevant columns from the selected tables"),
+    "SchemaSelectionStep": ("schema_selection_step", "Schema Selection Step", "Selects the relevant tables and their columns in one call"),
+    "SQLGenerationStep": ("sql_generation_step", "SQL Generation Step", "Generates the SQL statement based on tables and columns"),
+    "SQLReviewStep": ("sql_review_step", "SQL Review Step", "Checks the business rules and validates the SQL concurrently"),
+    "BusinessRulesStep": ("business_rules_step", "Business Rules Step", "Validates the SQL against business rules"),
+    "ValidationStep": ("validation_step", "Validation Step", "Validates the SQL syntax and semantics"),
+    "ExecutionStep": ("execution_step", "Execution Step", "Executes the SQL against the database"),
+}
+
+
+@lru_cache(maxsize=1)
+def get_process_step_names() -> Tuple[str, ...]:
+    """Steps of the process SqlProcess builds from PARALLEL_SQL_REVIEW and SCHEMA_SELECTION_MODE."""
+    return tuple(SqlProcess.get_step_names())
+
+
 # Get process steps configuration
 def get_process_steps():
     """Return the list of steps in the SQL process."""
-    return [
-        {
-            "id": "process_start",
-            "name": "Process Start",
-            "description": "Initializes the process with the user query",
-            "status": "pending"
-        },
-        {
-            "id": "table_name_step",
-            "name": "Table Name Step",
-            "description": "Extracts relevant table names from the query",
-            "status": "pending"
-        },
-        {
-            "id": "column_name_step",
-            "name": "Column Name Step",
-            "description": "Identifies relevant columns from the selected tables",
-            "status": "pending"
-        },
-        {
-            "id": "sql_generation_step",
-            "name": "SQL Generation Step",
-            "description": "Generates the SQL statement based on tables and columns",
-            "status": "pending"
-        },
-        {
-            "id": "business_rules_step",
-            "name": "Business Rules Step",
-            "description": "Validates the SQL against business rules",
-            "status": "pending"
-        },
-        {
-            "id": "validation_step",
-            "name": "Validation Step",
-            "description": "Validates the SQL syntax and semantics",
-            "status": "pending"
-        },
-        {
-            "id": "execution_step",
-            "name": "Execution Step",
-            "description": "Executes the SQL against the database",
-            "status": "pending"
-        },
-        {
-            "id": "process_end",
-            "name": "Process End",
-            "description": "Completes the process and returns the result",
-            "status": "pending"
-        }
-    ]
+    steps = [{
+        "id": "process_start",
+        "name": "Process Start",
+        "description": "Initializes the process with the user query",
+        "status": "pending"
+    }]
+    for step_name in get_process_step_names():
+        step_id, name, description = STEP_DESCRIPTIONS[step_name]
+        steps.append({"id": step_id, "name": name, "description": description, "status": "pending"})
+    steps.append({
+        "id": "process_end",
+        "name": "Process End",
+        "description": "Completes the process and returns the result",
+        "status": "pending"
+    })
+    return steps
 
 # Function to run a SQL process with the given query
-async def run_sql_process(query: str):
+async def run_sql_process(query: str, run_context: RunContext = None):
     """Run the SQL process with the given query and generate a final answer."""
+    # Messages of concurrent runs are tagged with their run ID
+    run_fields = {"run_id": run_context.run_id} if run_context else {}
     try:
         # Broadcast process start
         await manager.broadcast({
             "type": "process_started",
             "query": query,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now().isoformat(),
+            **run_fields
         })
         
         # Initialize the kernel and SQL process
         kernel = await initialize_kernel()
-        sql_process = SqlProcess(kernel)
+        sql_process = SqlProcess(kernel, tracker=run_context.tracker if run_context else None)
         
         # Define a semantic function for generating the final answer
         final_answer_fn = kernel.add_function(
@@ -174,30 +144,40 @@ async def run_sql_process(query: str):
         )
         
         # Execute the SQL process
-        await sql_process.start(query)
+        await sql_process.start(query, run_context=run_context)
         
-        # Get the results from the response.json file if available
-        result = None
+        # Get the results handed back in memory by the ExecutionStep, if available
+        result = sql_process.run_context.result
         sql_result = None
-        if os.path.exists("response.json"):
-            with open("response.json", "r") as f:
-                result = json.load(f)
-                sql_result = result["response"]
+        if result is not None:
+            sql_result = result["response"]
             
             # Track final answer generation in step tracker
-            tracker = get_tracker()
+            tracker = sql_process.tracker
             tracker.start_step("FinalAnswerGeneration", {"query": query, "sql_result": sql_result})
             
-            # Generate the final answer
-            final_answer = await kernel.invoke(final_answer_fn, query=query, context=str(sql_result))
-            final_answer_text = str(final_answer)
+            # Stream the final answer, forwarding each token delta as it arrives
+            async def broadcast_delta(delta: str):
+                await manager.broadcast({
+                    "type": "final_answer_delta",
+                    "query": query,
+                    "delta": delta,
+                    **run_fields
+                })
+            
+            final_answer_text = await call_function_streaming(
+                kernel,
+                final_answer_fn,
+                on_delta=broadcast_delta,
+                tracker=tracker,
+                query=query,
+                context=encode_sql_result(sql_result)
+            )
             
             # Add the final answer to the result
             result["final_answer"] = final_answer_text
-            
-            # Update the response.json file with the final answer
-            with open("response.json", "w") as f:
-                json.dump(result, f, indent=4)
+            # Results cut at the row limit are flagged, the answer only covers the fetched rows
+            result["truncated"] = isinstance(sql_result, dict) and bool(sql_result.get("truncated"))
             
             # End final answer generation tracking
             tracker.end_step(next_step="Complete", next_event="AnswerGenerated", output_data=final_answer_text)
@@ -207,14 +187,17 @@ async def run_sql_process(query: str):
                 "type": "final_answer",
                 "query": query,
                 "answer": final_answer_text,
-                "timestamp": datetime.now().isoformat()
+                "truncated": result["truncated"],
+                "timestamp": datetime.now().isoformat(),
+                **run_fields
             })
         
         # Broadcast process completion
         await manager.broadcast({
             "type": "process_completed",
             "query": query,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now().isoformat(),
+            **run_fields
         })
         
         return result
@@ -223,10 +206,18 @@ async def run_sql_process(query: str):
         await manager.broadcast({
             "type": "error",
             "message": str(e),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now().isoformat(),
+            **run_fields
         })
         raise e
 
+async def execute_run(run_context: RunContext):
+    """Worker handler for runs submitted through the /api/runs endpoints."""
+    return await run_sql_process(run_context.user_query, run_context=run_context)
+
+# Bounded worker pool for concurrent runs
+run_manager = RunManager(handler=execute_run)
+
 # Register routes
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
@@ -260,12 +251,77 @@ async def submit_query(query_request: QueryRequest, background_tasks: Background
         "timestamp": datetime.now().isoformat()
     }
 
+@app.post("/api/runs", status_code=202)
+async def submit_run(query_request: QueryRequest):
+    """Queue a natural language query for concurrent execution and return its run ID."""
+    try:
+        record = run_manager.submit(query_request.query)
+    except RunQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return record.to_dict()
+
+@app.get("/api/runs")
+async def list_runs():
+    """List the queued, running and recently finished runs."""
+    result_cache = get_sql_backend().result_cache
+    return {
+        "stats": run_manager.get_stats(),
+        "transitions": get_transition_store().get_stats(),
+        "result_cache": result_cache.get_stats() if result_cache is not None else None,
+        "runs": [record.to_dict() for record in run_manager.list_runs()]
+    }
+
+@app.get("/api/runs/{run_id}")
+async def get_run(run_id: str):
+    """Get the status, result and step transitions of a run."""
+    record = run_manager.get(run_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found")
+    return record.to_dict(include_transitions=True)
+
+@app.get("/api/runs/{run_id}/metrics")
+async def get_run_metrics(run_id: str):
+    """Get the token usage, cost and latency of a run, per step."""
+    record = run_manager.get(run_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Run {run_id} not found")
+    return {
+        "run_id": run_id,
+        "status": record.status,
+        "usage": record.tracker.get_usage_metrics(),
+        "budget": record.tracker.get_budget_stats()
+    }
+
+@app.get("/api/runs/{run_id}/prompts")
+async def get_run_prompts(run_id: str):
+    """Get the prompts captured for a run, when PROMPT_CAPTURE="memory"."""
+    prompt_sink = get_prompt_sink()
+    if not isinstance(prompt_sink, MemoryPromptSink):
+        raise HTTPException(status_code=404, detail="In-memory prompt capture is not enabled")
+    return {"run_id": run_id, "prompts": prompt_sink.records(run_id)}
+
+@app.post("/api/result-cache/invalidate")
+async def invalidate_result_cache():
+    """Drop the cached SQL results, e.g. after the database was reloaded in place."""
+    result_cache = get_sql_backend().result_cache
+    if result_cache is None:
+        raise HTTPException(status_code=404, detail="The result cache is not enabled")
+    result_cache.invalidate()
+    return result_cache.get_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """LLM usage counters per step and model in the Prometheus text format."""
+    return PlainTextResponse(get_metrics_registry().render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    # Clients of concurrent runs can follow a run with /ws?run_id=<run_id> (or "*" for all runs)
+    run_id = websocket.query_params.get("run_id")
+    await manager.connect(websocket, run_ids=[run_id] if run_id else [])
     try:
         # Send initial steps configuration
-        await websocket.send_json({
+        manager.send_to(websocket, {
             "type": "steps_configuration",
             "steps": get_process_steps()
         })
@@ -277,13 +333,12 @@ async def websocket_endpoint(websocket: WebSocket):
         
         # Keep connection alive and listen for any messages
         while True:
-            # print(">>>>>>>>>>>>>>>>>>>>>>>>>>", manager.active_connections)
             try:
                 data = await websocket.receive_text()
             except  WebSocketDisconnect:
                 print("WebSocket disconnected")
                 tracker.reset()
-                manager.disconnect(websocket)
+                await manager.disconnect(websocket)
                 break
             # Process client messages
             if data == "get_history":
@@ -295,16 +350,28 @@ async def websocket_endpoint(websocket: WebSocket):
                     if command.get("type") == "reset" and command.get("command") == "clear_all_data":
                         print("Received reset command from client, clearing StepTracker state")
                         tracker.reset()
-                        await websocket.send_json({
+                        manager.send_to(websocket, {
                             "type": "reset",
                             "timestamp": datetime.now().isoformat(),
                             "message": "StepTracker state has been reset"
                         })
+                    elif command.get("type") == "subscribe" and command.get("run_id"):
+                        manager.subscribe(websocket, command["run_id"])
+                        record = run_manager.get(command["run_id"])
+                        if record is not None:
+                            # Catch up on the transitions the client missed
+                            manager.send_to(websocket, {
+                                "type": "transition_history",
+                                "transitions": record.tracker.get_transition_history_serializable(),
+                                "run_id": record.run_id
+                            })
+                    elif command.get("type") == "unsubscribe" and command.get("run_id"):
+                        manager.unsubscribe(websocket, command["run_id"])
                 except Exception as e:
                     print(f"Error processing client command: {e}")
     except WebSocketDisconnect:
         tracker.reset()
-        manager.disconnect(websocket)
+        await manager.disconnect(websocket)
 
 # Initialize patching on startup
 @app.on_event("startup")
@@ -317,6 +384,28 @@ async def startup_event():
     StepTracker.set_websocket_manager(manager)
     print("Connected WebSocket manager to StepTracker for real-time event broadcasting")
 
+    # Export the step spans when an OpenTelemetry exporter is configured
+    if exporter_configured():
+        set_up_tracing()
+
+    # Create the shared AI services and open the connection before the first query
+    await warm_up_services()
+
+    # Memory-map the schema retrieval index, if enabled
+    get_schema_retrieval_index()
+
+    # Start the worker pool for concurrent runs
+    run_manager.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await run_manager.stop()
+    close_sql_prevalidator()
+    get_transition_store().close()
+    shutdown_tracing()
+    # Flush the captured prompts
+    set_prompt_sink(None)
+
 if __name__ == "__main__":
     import uvicorn
     # Run on port 80
@@ -1,17 +1,21 @@
 from .table_name_step import TableNameStep
 from .column_name_step import ColumnNameStep
+from .schema_selection_step import SchemaSelectionStep
 from .sql_generation_step import SQLGenerationStep
 from .business_rules_step import BusinessRulesStep
 from .validation_step import ValidationStep
+from .sql_review_step import SQLReviewStep
 from .execution_result_evaluation_step import ExecutionResultEvaluationStep
 from .execution_step import ExecutionStep, ExecutionStep
 
 __all__ = [
     "TableNameStep",
     "ColumnNameStep", 
+    "SchemaSelectionStep",
     "SQLGenerationStep",
     "BusinessRulesStep",
     "ValidationStep",
+    "SQLReviewStep",
     "ExecutionStep",
     "ExecutionResultEvaluationStep"
 ]
\ No newline at end of file
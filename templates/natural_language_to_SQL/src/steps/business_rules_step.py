@@ -15,25 +15,25 @@ from src.models.step_models import (
 )
 from src.utils.chat_helpers import call_chat_completion_structured_outputs
 from src.utils.step_tracker import get_tracker
-from src.constants.data_model import json_rules
+from src.utils.run_context import get_run_context
 from src.constants.prompts import business_rules_prompt
+from src.utils.prompt_layout import render_prompt, render_rules
 
 console = Console()
-issue_history = []
-# Track retry attempts to prevent infinite loops
-br_retry_counter = 0
+# Maximum business rules retries per run to prevent infinite loops
 MAX_RETRIES = 3
 
 class BusinessRulesStep(KernelProcessStep):
 
     async def _apply_business_rules(self, kernel: Kernel, data: BusinessRulesStepInput) -> ValidationResult:
         """Apply business rules to the generated SQL statement."""
-        rules_with_query = json_rules.format(question=data.user_query)
-        
-        prompt = business_rules_prompt.format(
-            question=data.user_query,
-            rules=rules_with_query,
-            sql_query=data.sql_generation_result.sql_statement
+        prompt = render_prompt(
+            business_rules_prompt,
+            static=dict(rules=render_rules()),
+            dynamic=dict(
+                question=data.user_query,
+                sql_query=data.sql_generation_result.sql_statement
+            )
         )
         business_rules_result = await call_chat_completion_structured_outputs(kernel, prompt, ValidationResult)
         console.print(f"Applied business rules:\n", business_rules_result)
@@ -42,30 +42,32 @@ class BusinessRulesStep(KernelProcessStep):
     @kernel_function(name="apply_business_rules")
     async def apply_business_rules(self, context: KernelProcessStepContext, data: BusinessRulesStepInput, kernel: Kernel):
         """Kernel function to apply business rules to SQL and emit the appropriate event."""
-        global issue_history, br_retry_counter
+        # Retry accounting and notes are kept per run
+        run_context = get_run_context()
         
         # Start tracking this step
         tracker = get_tracker()
         tracker.start_step("BusinessRulesStep", data)
         
         print("Running BusinessRulesStep...")
-        print(f"Current business rules retry count: {br_retry_counter}")
+        print(f"Current business rules retry count: {run_context.business_rules_retries}")
 
         business_rules_result = await self._apply_business_rules(
             kernel=kernel,
             data=data
         )
 
-        if business_rules_result.status == "OK" or br_retry_counter >= MAX_RETRIES:
-            # Reset retry counter for future runs
-            previous_retry_count = br_retry_counter
-            br_retry_counter = 0
+        if business_rules_result.status == "OK" or run_context.business_rules_retries >= MAX_RETRIES:
+            # Reset retry counter in case the run loops back through business rules
+            previous_retry_count = run_context.business_rules_retries
+            run_context.business_rules_retries = 0
             
             # Business rules passed or max retries reached, proceed to validation
             result = ValidationStepInput(
                 user_query=data.user_query,
                 table_column_names=data.table_column_names,
-                sql_statement=data.sql_generation_result.sql_statement
+                sql_statement=data.sql_generation_result.sql_statement,
+                business_rules_passed=business_rules_result.status == "OK"
             )
             
             if previous_retry_count >= MAX_RETRIES:
@@ -78,16 +80,15 @@ class BusinessRulesStep(KernelProcessStep):
             tracker.end_step(next_step="ValidationStep", next_event=SQLEvents.BusinessRulesStepDone, output_data=result)
         else:
             # Business rules failed, but we'll retry only if under the max retry limit
-            br_retry_counter += 1
-            notes = f"Business rules validation failed (attempt {br_retry_counter}/{MAX_RETRIES}): {str(business_rules_result)}\nPrevious SQL Statement (need to improve):\n{data.sql_generation_result.sql_statement}"
-            issue_history.append(notes)
+            run_context.business_rules_retries += 1
+            notes = f"Business rules validation failed (attempt {run_context.business_rules_retries}/{MAX_RETRIES}): {str(business_rules_result)}\nPrevious SQL Statement (need to improve):\n{data.sql_generation_result.sql_statement}"
             result = SQLGenerationStepInput(
                 user_query=data.user_query, 
                 table_column_names=data.table_column_names,
-                notes="\n\n".join(issue_history)
+                notes=run_context.add_issue(notes)
             )
             await context.emit_event(process_event=SQLEvents.BusinessRulesFailed, data=result)
-            print(f"Emitted event: BusinessRulesFailed. Retry {br_retry_counter}/{MAX_RETRIES}")
+            print(f"Emitted event: BusinessRulesFailed. Retry {run_context.business_rules_retries}/{MAX_RETRIES}")
             
             # End tracking with transition back to SQLGenerationStep
             tracker.end_step(next_step="SQLGenerationStep", next_event=SQLEvents.BusinessRulesFailed, output_data=result)
\ No newline at end of file
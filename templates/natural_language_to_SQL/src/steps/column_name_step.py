@@ -1,7 +1,6 @@
 import sys
 sys.path.append("../../")
 
-import json
 from rich.console import Console
 from semantic_kernel.processes.kernel_process import KernelProcessStep, KernelProcessStepContext
 from semantic_kernel.kernel import Kernel
@@ -11,8 +10,9 @@ from src.models.events import SQLEvents
 from src.models.step_models import ColumnNamesStepInput, SQLGenerationStepInput, GetColumnNames
 from src.utils.chat_helpers import call_chat_completion_structured_outputs
 from src.utils.step_tracker import get_tracker
-from src.constants.data_model import json_rules, global_database_model
+from src.utils.schema_index import get_schema_index
 from src.constants.prompts import get_table_column_names_prompt_template
+from src.utils.prompt_layout import render_prompt, render_rules
 
 console = Console()
 
@@ -20,21 +20,19 @@ class ColumnNameStep(KernelProcessStep):
 
     async def _get_column_names(self, kernel: Kernel, data: ColumnNamesStepInput) -> SQLGenerationStepInput:
         """Process the table names and extract relevant column names."""
-        relevant_tables = []
-
-        for table in data.table_names.table_names:
-            for model_table in global_database_model:
-                if table.table_name == model_table['TableName']:
-                    relevant_tables.append(model_table)
-                    break
-        rules_with_query = json.dumps(json_rules, indent=4)
+        relevant_tables = get_schema_index().render_tables(
+            table.table_name for table in data.table_names.table_names
+        )
         
-        prompt = get_table_column_names_prompt_template.format(
-            user_query=data.user_query, 
-            table_column_list=relevant_tables,
-            previous_table_column_names=data.table_column_names,
-            notes=data.notes,
-            rules=rules_with_query
+        prompt = render_prompt(
+            get_table_column_names_prompt_template,
+            static=dict(rules=render_rules()),
+            dynamic=dict(
+                table_column_list=relevant_tables,
+                previous_table_column_names=data.table_column_names,
+                notes=data.notes,
+                user_query=data.user_query
+            )
         )
         
         table_column_names = await call_chat_completion_structured_outputs(kernel, prompt, GetColumnNames)
@@ -8,7 +8,7 @@ from semantic_kernel.functions import kernel_function
 
 from src.models.events import SQLEvents
 from src.models.step_models import ExecutionStepInput, Execution2TableNames
-from src.utils.db_helpers import SQLite_exec_sql
+from src.utils.db_helpers import get_sql_backend
 from src.utils.step_tracker import get_tracker
 
 console = Console()
@@ -26,7 +26,7 @@ class ExecutionResultEvaluationStep(KernelProcessStep):
         console.print("[bold blue]SQL statement to execute:[/bold blue]", data.sql_statement)
 
         # Execute the SQL statement
-        response = SQLite_exec_sql(data.sql_statement)
+        response = await get_sql_backend().execute_async(data.sql_statement)
         console.print("[bold green]Execution Result:[/bold green]")
         console.print(response)
 
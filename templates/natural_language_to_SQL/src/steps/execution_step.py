@@ -1,18 +1,23 @@
 import sys
 sys.path.append("../../")
-import json
+import os
 from rich.console import Console
 from semantic_kernel.processes.kernel_process import KernelProcessStep, KernelProcessStepContext
 from semantic_kernel.kernel import Kernel
 from semantic_kernel.functions import kernel_function
 
 from src.models.events import SQLEvents
-from src.models.step_models import ExecutionStepInput, Execution2TableNames
-from src.utils.db_helpers import SQLite_exec_sql
+from src.models.step_models import ExecutionStepInput, ExecutionResult, Execution2TableNames
+from src.utils.db_helpers import get_sql_backend
 from src.utils.step_tracker import get_tracker
+from src.utils.run_context import get_run_context
+from src.utils.example_store import get_example_store
 
 console = Console()
 
+# Per-query execution deadline in seconds, the statement is interrupted once it is exceeded
+SQL_EXECUTION_DEADLINE = float(os.environ.get("SQL_EXECUTION_DEADLINE", "30"))
+
 class ExecutionStep(KernelProcessStep):
     """Execute SQL statement and emit appropriate event."""
     @kernel_function(name="execute_sql")
@@ -25,24 +30,48 @@ class ExecutionStep(KernelProcessStep):
         print(f"SQL statement to execute: {data.sql_statement}")
 
         try:
-            response = SQLite_exec_sql(data.sql_statement)
+            # Runs on the executor's thread pool, the event loop stays free while the query runs
+            response = await get_sql_backend().execute_async(data.sql_statement, timeout=SQL_EXECUTION_DEADLINE)
             console.print(response)
             print("SQL execution succeeded.")
-            resp_dd = {"query": data.user_query, "response": response}
+            result = ExecutionResult(
+                user_query=data.user_query,
+                sql_statement=data.sql_statement,
+                response=response
+            )
 
-            console.print("resp_dd", resp_dd)
+            # The event payload is handed back to the caller of this run in memory
+            run_context = get_run_context()
+            run_context.result = result.model_dump()
+            run_context.budget.record_execution(data.sql_statement, response)
 
-            with open("response.json", "w") as f:
-                json.dump(resp_dd, f, indent=4)
+            # Cache the validated SQL so that repeat questions skip the LLM steps
+            query_cache = run_context.query_cache
+            if query_cache is not None:
+                if "error" in response:
+                    if data.from_cache:
+                        query_cache.discard(data.cache_key or data.user_query)
+                elif data.review_passed and not data.from_cache:
+                    # SQL let through after the retry limit is executed but never replayed to other users
+                    await query_cache.store(data.user_query, data.sql_statement, data.table_column_names)
 
+            # Reviewed question/SQL pairs become few-shot examples for similar questions
+            example_store = get_example_store()
+            if (example_store is not None and example_store.auto_append and data.review_passed
+                    and "error" not in response and not data.from_cache):
+                example_store.add(data.user_query, data.sql_statement)
+
+            await context.emit_event(process_event=SQLEvents.ExecutionSuccess, data=result)
             print("Emitted event: ExecutionSuccess.")
-            await context.emit_event(process_event=SQLEvents.ExecutionSuccess, data=response)
             
             # End tracking with process completion
-            tracker.end_step(next_step="Process End", next_event=SQLEvents.ExecutionSuccess, output_data=response)
+            tracker.end_step(next_step="Process End", next_event=SQLEvents.ExecutionSuccess, output_data=result)
 
         except Exception as e:
             error_description = f"Execution error: {str(e)}"
+            query_cache = get_run_context().query_cache
+            if query_cache is not None and data.from_cache:
+                query_cache.discard(data.cache_key or data.user_query)
             result = Execution2TableNames(
                 user_query=data.user_query,
                 table_names=data.table_names,
@@ -50,11 +79,12 @@ class ExecutionStep(KernelProcessStep):
                 sql_statement=data.sql_statement,
                 error_description=error_description
             )
+            get_run_context().result = ExecutionResult(
+                user_query=data.user_query,
+                sql_statement=data.sql_statement,
+                response=error_description
+            ).model_dump()
             await context.emit_event(process_event=SQLEvents.ExecutionError, data=result)
-            resp_dd = {"query": data.user_query, "response": error_description}
-                
-            with open("response.json", "w") as f:
-                json.dump(resp_dd, f, indent=4)
             print("Emitted event: ExecutionError.")
             
             # End tracking with error transition back to TableNameStep
@@ -0,0 +1,80 @@
+import sys
+sys.path.append("../../")
+
+from rich.console import Console
+from semantic_kernel.processes.kernel_process import KernelProcessStep, KernelProcessStepContext
+from semantic_kernel.kernel import Kernel
+from semantic_kernel.functions import kernel_function
+
+from src.models.events import SQLEvents
+from src.models.step_models import TableNamesStepInput, SQLGenerationStepInput, GetColumnNames
+from src.steps.table_name_step import get_candidate_tables
+from src.utils.chat_helpers import call_chat_completion_structured_outputs
+from src.utils.step_tracker import get_tracker
+from src.utils.run_context import get_run_context
+from src.utils.run_budget import give_up
+from src.utils.schema_index import get_schema_index
+from src.constants.prompts import get_schema_selection_prompt_template
+from src.utils.prompt_layout import render_prompt, render_rules
+
+console = Console()
+
+class SchemaSelectionStep(KernelProcessStep):
+    """Select the relevant tables and columns in a single LLM call, replacing TableNameStep and ColumnNameStep for small schemas."""
+
+    async def _get_table_column_names(self, kernel: Kernel, data: TableNamesStepInput) -> SQLGenerationStepInput:
+        """Extract the relevant tables and columns from the full schema of the candidate tables."""
+        candidate_tables = await get_candidate_tables(kernel, data)
+        schema_index = get_schema_index()
+
+        prompt = render_prompt(
+            get_schema_selection_prompt_template,
+            static=dict(
+                rules=render_rules(),
+                table_column_list=schema_index.render_tables(candidate_tables)
+            ),
+            dynamic=dict(
+                previous_table_column_names=data.table_column_names,
+                notes=data.notes,
+                user_query=data.user_query
+            )
+        )
+
+        table_column_names = await call_chat_completion_structured_outputs(kernel, prompt, GetColumnNames)
+        # Drop hallucinated tables, the two-stage selection restricts them in the response format instead
+        table_column_names.table_column_list = [
+            table for table in table_column_names.table_column_list if schema_index.has_table(table.table_name)
+        ]
+        console.print(f"Extracted table and column names:\n", table_column_names)
+
+        # Build model instance
+        result = SQLGenerationStepInput(
+            user_query=data.user_query,
+            table_column_names=table_column_names,
+            notes=data.notes
+        )
+        return result
+
+    @kernel_function(name="get_table_column_names")
+    async def get_table_column_names(self, context: KernelProcessStepContext, data: TableNamesStepInput, kernel: Kernel):
+        """Kernel function to extract table and column names from user query and emit the appropriate event."""
+        tracker = get_tracker()
+        await tracker.start_step_async("SchemaSelectionStep", data)
+
+        print("Running SchemaSelectionStep...")
+        print(f"Received user query: {data.user_query}")
+
+        # Every retry loop (including ExecutionError) comes back through here
+        run_context = get_run_context()
+        reason = run_context.budget.exceeded()
+        if reason:
+            result = await give_up(context, run_context, reason)
+            await tracker.end_step_async(next_step="Process End", next_event=SQLEvents.GiveUp, output_data=result)
+            return
+
+        result = await self._get_table_column_names(kernel=kernel, data=data)
+
+        await context.emit_event(process_event=SQLEvents.SchemaSelectionStepDone, data=result)
+        print("Emitted event: SchemaSelectionStepDone.")
+
+        await tracker.end_step_async(next_step="SQLGenerationStep", next_event=SQLEvents.SchemaSelectionStepDone, output_data=result)
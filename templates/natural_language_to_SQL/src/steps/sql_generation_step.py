@@ -1,7 +1,7 @@
 import sys
 sys.path.append("../../")
 
-import os
+import asyncio
 from rich.console import Console
 from semantic_kernel.processes.kernel_process import KernelProcessStep, KernelProcessStepContext
 from semantic_kernel.kernel import Kernel
@@ -10,91 +10,155 @@ from semantic_kernel.functions import kernel_function
 from src.models.events import SQLEvents
 from src.models.step_models import SQLGenerationStepInput, BusinessRulesStepInput, TableNamesStepInput, SQLGenerateResult
 from src.utils.chat_helpers import call_chat_completion_structured_outputs
-from src.utils.db_helpers import write_to_file
+from src.utils.db_helpers import get_sql_backend
 from src.utils.step_tracker import get_tracker
-from src.constants.data_model import json_rules, global_database_model
+from src.utils.run_context import get_run_context
+from src.utils.prompt_capture import get_prompt_sink
+from src.utils.example_store import get_example_store
+from src.utils.schema_index import get_schema_index
+from src.utils.sql_prevalidation import get_sql_prevalidator
+from src.utils.run_budget import give_up
+from src.utils.sql_voting import SQL_CANDIDATES, SQL_CANDIDATE_CONCURRENCY, SQL_CANDIDATE_MAX_ROWS, SQL_CANDIDATE_TIMEOUT, vote_candidates
 from src.constants.prompts import sql_generation_prompt, few_shot_examples
+from src.utils.prompt_layout import render_prompt, render_rules
 
 console = Console()
-
-# Global counter for prompt output files
-counter = 0
-# Track issues for retries
-issue_history = []
+# Maximum local precheck retries per run, afterwards the statement goes to the LLM review as is
+MAX_PRECHECK_RETRIES = 3
 
 class SQLGenerationStep(KernelProcessStep):
 
     async def _generate_sql(self, kernel: Kernel, user_query: str, data: SQLGenerationStepInput) -> SQLGenerateResult:
         """Generate SQL statement using LLM based on user query and selected tables/columns."""
-        global counter
-
-        relevant_tables = []
-
-        for table in data.table_column_names.table_column_list:
-            for model_table in global_database_model:
-                if table.table_name == model_table['TableName']:
-                    relevant_columns = []
-                    for column in table.column_names:
-                        for model_column in model_table['Columns']:
-                            if column == model_column['ColumnName']:
-                                relevant_columns.append(model_column)
-                    relevant_tables.append({
-                        'TableName': model_table['TableName'],
-                        'Description': model_table['Description'],
-                        'Columns': relevant_columns
-                        }
-                    )
-
-        rules_with_query = json_rules.format(question=user_query)
-        
-        prompt = sql_generation_prompt.format(
-            suggested_table_column_names=data.table_column_names,
-            data_model=relevant_tables,
-            rules=rules_with_query,
-            question=user_query,
-            examples=few_shot_examples,
-            notes=data.notes
+        run_context = get_run_context()
+
+        relevant_tables = get_schema_index().render_table_columns(
+            (table.table_name, table.column_names) for table in data.table_column_names.table_column_list
+        )
+
+        # Examples relevant to this question, or the static examples when retrieval is disabled
+        example_store = get_example_store()
+        examples = example_store.render(user_query) if example_store is not None else few_shot_examples
+
+        prompt = render_prompt(
+            sql_generation_prompt,
+            static=dict(rules=render_rules()),
+            dynamic=dict(
+                examples=examples,
+                data_model=relevant_tables,
+                suggested_table_column_names=data.table_column_names,
+                notes=data.notes,
+                question=user_query
+            )
         )
 
-        # Save prompt for debugging
-        os.makedirs("output_prompts", exist_ok=True)
-        write_to_file(prompt, f"output_prompts/prompt_{counter}.txt", "w")
-        counter += 1
+        # Capture the prompt for debugging, when enabled
+        prompt_sink = get_prompt_sink()
+        if prompt_sink is not None:
+            prompt_sink.capture(run_context.run_id, "SQLGenerationStep", prompt, run_context.prompt_counter)
+        run_context.prompt_counter += 1
 
-        sql_generation_result = await call_chat_completion_structured_outputs(kernel, prompt, SQLGenerateResult)
+        if SQL_CANDIDATES > 1:
+            sql_generation_result = await self._generate_candidates(kernel, prompt, data)
+        else:
+            sql_generation_result = await call_chat_completion_structured_outputs(kernel, prompt, SQLGenerateResult)
         console.print(f"Generated SQL statement:\n", sql_generation_result)
 
         return sql_generation_result
 
+    async def _generate_candidates(self, kernel: Kernel, prompt: str, data: SQLGenerationStepInput) -> SQLGenerateResult:
+        """Generate several candidates concurrently and keep the one whose result most candidates agree on."""
+        semaphore = asyncio.Semaphore(max(1, SQL_CANDIDATE_CONCURRENCY))
+
+        async def generate(sample: int) -> SQLGenerateResult:
+            async with semaphore:
+                return await call_chat_completion_structured_outputs(kernel, prompt, SQLGenerateResult, sample=sample)
+
+        results = await asyncio.gather(*(generate(i) for i in range(SQL_CANDIDATES)), return_exceptions=True)
+        candidates = [result for result in results if not isinstance(result, BaseException)]
+        if not candidates:
+            raise results[0]
+
+        # Candidates that are not OK or fail the local precheck don't take part in the vote
+        statements = [
+            candidate.sql_statement if candidate.status == "OK" and not self._precheck_sql(data, candidate.sql_statement) else None
+            for candidate in candidates
+        ]
+        backend = get_sql_backend()
+        vote = await vote_candidates(
+            statements,
+            lambda sql: backend.execute_async(sql, max_rows=SQL_CANDIDATE_MAX_ROWS, timeout=SQL_CANDIDATE_TIMEOUT)
+        )
+        console.print(
+            f"SQL candidate vote: candidate {vote.winner + 1}/{len(candidates)} with {vote.votes} votes, "
+            f"{len(vote.clusters)} distinct results, {len(vote.failed)} failed executions"
+        )
+        return candidates[vote.winner]
+
+    def _precheck_sql(self, data: SQLGenerationStepInput, sql_statement: str) -> list:
+        """Check the statement locally against the selected tables before spending an LLM call on it."""
+        prevalidator = get_sql_prevalidator()
+        if prevalidator is None or get_run_context().precheck_retries >= MAX_PRECHECK_RETRIES:
+            return []
+        return prevalidator.check(
+            sql_statement,
+            [table.table_name for table in data.table_column_names.table_column_list]
+        )
+
 
     @kernel_function(name="generate_sql")
     async def generate_sql(self, context: KernelProcessStepContext, data: SQLGenerationStepInput, kernel: Kernel):
         """Kernel function to generate SQL based on the selected tables/columns and emit the appropriate event."""
-        global issue_history
-        
         # Start tracking this step
         tracker = get_tracker()
         tracker.start_step("SQLGenerationStep", data)
         
         print("Running SQLGenerationStep...")
 
+        run_context = get_run_context()
+        budget = run_context.budget
+        reason = budget.exceeded()
+        if reason:
+            result = await give_up(context, run_context, reason)
+            tracker.end_step(next_step="Process End", next_event=SQLEvents.GiveUp, output_data=result)
+            return
+
         sql_generation_result = await self._generate_sql(kernel=kernel, user_query=data.user_query, data=data)
 
-        if sql_generation_result.status == "IMPOSSIBLE":
+        if reason := budget.check_loop(sql_generation_result.sql_statement):
+            result = await give_up(context, run_context, reason)
+            tracker.end_step(next_step="Process End", next_event=SQLEvents.GiveUp, output_data=result)
+        elif sql_generation_result.status == "IMPOSSIBLE":
             # Build model instance for retrying with better table selection
             notes = f"SQL Generation failed: {str(sql_generation_result.reason)}\nPrevious SQL Statement (need to improve):\n{sql_generation_result.sql_statement}"
-            issue_history.append(notes)
             result = TableNamesStepInput(
                 user_query=data.user_query, 
                 table_column_names=data.table_column_names,
-                notes="\n\n".join(issue_history)
+                notes=get_run_context().add_issue(notes)
             )
             await context.emit_event(process_event=SQLEvents.SQLGenerationStepFailed, data=result)
             print("Emitted event: SQLGenerationStepFailed.")
             
             # End tracking with transition back to TableNameStep
             tracker.end_step(next_step="TableNameStep", next_event=SQLEvents.SQLGenerationStepFailed, output_data=result)
+        elif issues := self._precheck_sql(data, sql_generation_result.sql_statement):
+            # Obvious failures go straight back to generation, without the LLM review
+            run_context = get_run_context()
+            run_context.precheck_retries += 1
+            notes = f"Local SQL check failed (attempt {run_context.precheck_retries}/{MAX_PRECHECK_RETRIES}): {'; '.join(issues)}\nPrevious SQL Statement (need to improve):\n{sql_generation_result.sql_statement}"
+            result = SQLGenerationStepInput(
+                user_query=data.user_query,
+                table_column_names=data.table_column_names,
+                notes=run_context.add_issue(notes)
+            )
+            await context.emit_event(process_event=SQLEvents.SQLPrecheckFailed, data=result)
+            print(f"Emitted event: SQLPrecheckFailed. Retry {run_context.precheck_retries}/{MAX_PRECHECK_RETRIES}")
+
+            # End tracking with transition back to SQLGenerationStep
+            tracker.end_step(next_step="SQLGenerationStep", next_event=SQLEvents.SQLPrecheckFailed, output_data=result)
         else: 
+            get_run_context().precheck_retries = 0
+
             # Build model instance for business rules validation
             result = BusinessRulesStepInput(
                 user_query=data.user_query, 
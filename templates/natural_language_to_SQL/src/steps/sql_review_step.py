@@ -0,0 +1,102 @@
+import sys
+sys.path.append("../../")
+
+import asyncio
+from rich.console import Console
+from semantic_kernel.processes.kernel_process import KernelProcessStep, KernelProcessStepContext
+from semantic_kernel.kernel import Kernel
+from semantic_kernel.functions import kernel_function
+
+from src.models.events import SQLEvents
+from src.models.step_models import (
+    BusinessRulesStepInput,
+    ValidationStepInput,
+    ExecutionStepInput,
+    SQLGenerationStepInput
+)
+from src.steps.business_rules_step import BusinessRulesStep, MAX_RETRIES as BUSINESS_RULES_MAX_RETRIES
+from src.steps.validation_step import ValidationStep, MAX_RETRIES as VALIDATION_MAX_RETRIES
+from src.utils.step_tracker import get_tracker
+from src.utils.run_context import get_run_context
+
+console = Console()
+
+
+class SQLReviewStep(KernelProcessStep):
+    """
+    Fan-out/fan-in review of the generated SQL.
+
+    The business rules check and the validation check are independent judgements of the same
+    statement, so both LLM calls run concurrently. Issues of the failing checks are merged into a
+    single notes payload for the SQLGenerationStep. Each check keeps its own retry budget, a check
+    that exhausted it no longer blocks execution.
+    """
+
+    @kernel_function(name="review_sql")
+    async def review_sql(self, context: KernelProcessStepContext, data: BusinessRulesStepInput, kernel: Kernel):
+        """Kernel function to run business rules and validation concurrently and emit the appropriate event."""
+        run_context = get_run_context()
+
+        # Start tracking this step
+        tracker = get_tracker()
+        tracker.start_step("SQLReviewStep", data)
+
+        sql_statement = data.sql_generation_result.sql_statement
+        print("Running SQLReviewStep...")
+        print(f"SQL statement to review: {sql_statement}")
+        print(f"Current retry counts: business rules {run_context.business_rules_retries}, validation {run_context.validation_retries}")
+
+        validation_input = ValidationStepInput(
+            user_query=data.user_query,
+            table_column_names=data.table_column_names,
+            sql_statement=sql_statement
+        )
+        business_rules_result, validation_result = await asyncio.gather(
+            BusinessRulesStep()._apply_business_rules(kernel=kernel, data=data),
+            ValidationStep()._validate_sql(kernel=kernel, user_query=data.user_query, data=validation_input)
+        )
+
+        issues = []
+        if business_rules_result.status != "OK":
+            if run_context.business_rules_retries < BUSINESS_RULES_MAX_RETRIES:
+                run_context.business_rules_retries += 1
+                issues.append(f"Business rules validation failed (attempt {run_context.business_rules_retries}/{BUSINESS_RULES_MAX_RETRIES}): {str(business_rules_result)}")
+            else:
+                console.print("[yellow]Warning: Ignoring business rule issues after maximum retries.[/yellow]")
+        if validation_result.status != "OK":
+            if run_context.validation_retries < VALIDATION_MAX_RETRIES:
+                run_context.validation_retries += 1
+                issues.append(f"Validation failed (attempt {run_context.validation_retries}/{VALIDATION_MAX_RETRIES}): {str(validation_result)}")
+            else:
+                console.print("[yellow]Warning: Ignoring validation issues after maximum retries.[/yellow]")
+
+        if not issues:
+            # Reset retry counters in case the run loops back through the review
+            run_context.business_rules_retries = 0
+            run_context.validation_retries = 0
+            run_context.budget.set_best_sql(sql_statement)
+
+            result = ExecutionStepInput(
+                user_query=data.user_query,
+                table_column_names=data.table_column_names,
+                sql_statement=sql_statement,
+                # False when a check was ignored after exhausting its retries
+                review_passed=business_rules_result.status == "OK" and validation_result.status == "OK"
+            )
+            await context.emit_event(process_event=SQLEvents.SQLReviewPassed, data=result)
+            print("Emitted event: SQLReviewPassed.")
+
+            # End tracking with transition to ExecutionStep
+            tracker.end_step(next_step="ExecutionStep", next_event=SQLEvents.SQLReviewPassed, output_data=result)
+        else:
+            notes = "\n".join(issues) + f"\nPrevious SQL Statement (need to improve):\n{sql_statement}"
+            result = SQLGenerationStepInput(
+                user_query=data.user_query,
+                table_column_names=data.table_column_names,
+                notes=run_context.add_issue(notes)
+            )
+            await context.emit_event(process_event=SQLEvents.SQLReviewFailed, data=result)
+            print(f"Emitted event: SQLReviewFailed ({len(issues)} failed checks).")
+
+            # End tracking with transition back to SQLGenerationStep
+            tracker.end_step(next_step="SQLGenerationStep", next_event=SQLEvents.SQLReviewFailed, output_data=result)
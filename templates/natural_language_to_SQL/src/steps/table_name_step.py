@@ -1,36 +1,64 @@
 import sys
 sys.path.append("../../")
 
-import json
 from rich.console import Console
 from semantic_kernel.processes.kernel_process import KernelProcessStep, KernelProcessStepContext
 from semantic_kernel.kernel import Kernel
 from semantic_kernel.functions import kernel_function
 
 from src.models.events import SQLEvents
-from src.models.step_models import TableNamesStepInput, ColumnNamesStepInput, GetTableNames
-from src.utils.chat_helpers import call_chat_completion_structured_outputs
+from typing import List
+from src.models.step_models import TableNamesStepInput, ColumnNamesStepInput, GetTableNames, get_table_names_response_format
+from src.utils.chat_helpers import call_chat_completion_structured_outputs, call_text_embedding, has_embedding_service
+from src.utils.schema_retrieval import get_schema_retrieval_index
 from src.utils.step_tracker import get_tracker
-from src.constants.data_model import json_rules, table_descriptions
+from src.utils.run_context import get_run_context
+from src.utils.run_budget import give_up
+from src.constants.data_model import table_descriptions
 from src.constants.prompts import get_table_names_prompt_template
+from src.utils.prompt_layout import render_prompt, render_rules
 
 console = Console()
 
+async def get_candidate_tables(kernel: Kernel, data: TableNamesStepInput) -> List[str]:
+    """Prefilter the tables with the schema retrieval index, or return all tables when retrieval is off."""
+    all_tables = [table["TableName"] for table in table_descriptions]
+    retrieval_index = get_schema_retrieval_index()
+    if retrieval_index is None or not has_embedding_service(kernel):
+        return all_tables
+
+    query_embedding = await call_text_embedding(kernel, data.user_query)
+    candidates = set(retrieval_index.search_tables(query_embedding))
+    # Keep the tables selected in previous rounds so that retries can refine them
+    if data.table_column_names is not None:
+        candidates.update(table.table_name for table in data.table_column_names.table_column_list)
+    console.print(f"Candidate tables from schema retrieval: {sorted(candidates)}")
+    return [table_name for table_name in all_tables if table_name in candidates]
+
+
 class TableNameStep(KernelProcessStep):
-    
+
     async def _get_table_names(self, kernel: Kernel, data: TableNamesStepInput) -> ColumnNamesStepInput:
         """Process the user query and extract relevant table names."""
-        rules_with_query = json.dumps(json_rules, indent=4)
+        candidate_tables = await get_candidate_tables(kernel, data)
         
-        prompt = get_table_names_prompt_template.format(
-            user_query=data.user_query, 
-            table_list=table_descriptions, 
-            previous_table_column_names=data.table_column_names,
-            notes=data.notes, 
-            rules=rules_with_query
+        prompt = render_prompt(
+            get_table_names_prompt_template,
+            static=dict(
+                rules=render_rules(),
+                table_list=[table for table in table_descriptions if table["TableName"] in candidate_tables]
+            ),
+            dynamic=dict(
+                previous_table_column_names=data.table_column_names,
+                notes=data.notes,
+                user_query=data.user_query
+            )
         )
         
-        table_names = await call_chat_completion_structured_outputs(kernel, prompt, GetTableNames)
+        # Table names are restricted to the candidates in the structured output schema
+        response_format = get_table_names_response_format(tuple(candidate_tables))
+        response = await call_chat_completion_structured_outputs(kernel, prompt, response_format)
+        table_names = GetTableNames.model_validate(response.model_dump())
         console.print(f"Extracted table names:\n", table_names)
 
         # Build model instance
@@ -50,6 +78,15 @@ class TableNameStep(KernelProcessStep):
         
         print("Running TableNameStep...")
         print(f"Received user query: {data.user_query}")
+
+        # Every retry loop (including ExecutionError) comes back through here
+        run_context = get_run_context()
+        reason = run_context.budget.exceeded()
+        if reason:
+            result = await give_up(context, run_context, reason)
+            await tracker.end_step_async(next_step="Process End", next_event=SQLEvents.GiveUp, output_data=result)
+            return
+
         result = await self._get_table_names(kernel=kernel, data=data)
 
         await context.emit_event(process_event=SQLEvents.TableNameStepDone, data=result)
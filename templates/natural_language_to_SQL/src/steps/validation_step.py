@@ -15,30 +15,31 @@ from src.models.step_models import (
 )
 from src.utils.chat_helpers import call_chat_completion_structured_outputs
 from src.utils.step_tracker import get_tracker
-from src.constants.data_model import global_database_model
+from src.utils.run_context import get_run_context
+from src.utils.schema_index import get_schema_index
 from src.constants.prompts import sql_validation_prompt
+from src.utils.prompt_layout import render_prompt
 
 console = Console()
-issue_history = []
-# Track retry attempts to prevent infinite loops
-retry_counter = 0
+# Maximum validation retries per run to prevent infinite loops
 MAX_RETRIES = 3
 
 class ValidationStep(KernelProcessStep):
 
     async def _validate_sql(self, kernel: Kernel, user_query: str, data: ValidationStepInput) -> ValidationResult:
         """Validate the SQL statement against database schema and query standards."""
-        relevant_tables = []
-        for table in data.table_column_names.table_column_list:
-            for model_table in global_database_model:
-                if table.table_name == model_table['TableName']:
-                    relevant_tables.append(model_table)
-                    break
+        relevant_tables = get_schema_index().render_tables(
+            table.table_name for table in data.table_column_names.table_column_list
+        )
                     
-        prompt = sql_validation_prompt.format(
-            question=user_query, 
-            sql_query=data.sql_statement, 
-            table_column_names=relevant_tables
+        prompt = render_prompt(
+            sql_validation_prompt,
+            static={},
+            dynamic=dict(
+                table_column_names=relevant_tables,
+                question=user_query,
+                sql_query=data.sql_statement
+            )
         )
         validation_result = await call_chat_completion_structured_outputs(kernel, prompt, ValidationResult)
         console.print(f"SQL validation results:\n", validation_result)
@@ -48,7 +49,8 @@ class ValidationStep(KernelProcessStep):
     @kernel_function(name="validate_sql")
     async def validate_sql(self, context: KernelProcessStepContext, data: ValidationStepInput, kernel: Kernel):
         """Kernel function to validate SQL and emit the appropriate event."""
-        global issue_history, retry_counter
+        # Retry accounting and notes are kept per run
+        run_context = get_run_context()
         
         # Start tracking this step
         tracker = get_tracker()
@@ -56,21 +58,23 @@ class ValidationStep(KernelProcessStep):
         
         print("Running ValidationStep...")
         print(f"SQL statement to validate: {data.sql_statement}")
-        print(f"Current retry count: {retry_counter}")
+        print(f"Current retry count: {run_context.validation_retries}")
 
         validation_result = await self._validate_sql(kernel=kernel, user_query=data.user_query, data=data)
 
         # Check if we should proceed or retry based on validation and retry count
-        if validation_result.status == "OK" or retry_counter >= MAX_RETRIES:
-            # Reset retry counter for future runs
-            previous_retry_count = retry_counter
-            retry_counter = 0
+        if validation_result.status == "OK" or run_context.validation_retries >= MAX_RETRIES:
+            # Reset retry counter in case the run loops back through validation
+            previous_retry_count = run_context.validation_retries
+            run_context.validation_retries = 0
+            run_context.budget.set_best_sql(data.sql_statement)
             
             # Either validation passed OR we've exceeded max retries, proceed to execution
             result = ExecutionStepInput(
                 user_query=data.user_query,
                 table_column_names=data.table_column_names,
-                sql_statement=data.sql_statement
+                sql_statement=data.sql_statement,
+                review_passed=validation_result.status == "OK" and data.business_rules_passed
             )
             
             if previous_retry_count >= MAX_RETRIES:
@@ -83,16 +87,15 @@ class ValidationStep(KernelProcessStep):
             tracker.end_step(next_step="ExecutionStep", next_event=SQLEvents.ValidationPassed, output_data=result)
         else:
             # Validation failed, but we'll retry only if under the max retry limit
-            retry_counter += 1
-            notes = f"Validation failed (attempt {retry_counter}/{MAX_RETRIES}): {str(validation_result)}\nPrevious SQL Statement (need to improve):\n{data.sql_statement}"
-            issue_history.append(notes)
+            run_context.validation_retries += 1
+            notes = f"Validation failed (attempt {run_context.validation_retries}/{MAX_RETRIES}): {str(validation_result)}\nPrevious SQL Statement (need to improve):\n{data.sql_statement}"
             result = SQLGenerationStepInput(
                 user_query=data.user_query, 
                 table_column_names=data.table_column_names,
-                notes="\n\n".join(issue_history)
+                notes=run_context.add_issue(notes)
             )
             await context.emit_event(process_event=SQLEvents.ValidationFailed, data=result)
-            print(f"Emitted event: ValidationFailed. Retry {retry_counter}/{MAX_RETRIES}")
+            print(f"Emitted event: ValidationFailed. Retry {run_context.validation_retries}/{MAX_RETRIES}")
             
             # End tracking with transition back to SQLGenerationStep
             tracker.end_step(next_step="SQLGenerationStep", next_event=SQLEvents.ValidationFailed, output_data=result)
\ No newline at end of file
@@ -1,12 +1,51 @@
 from .chat_helpers import call_chat_completion, call_chat_completion_structured_outputs
-from .db_helpers import SQLite_exec_sql, write_to_file
+from .db_helpers import SQLite_exec_sql, get_sql_backend, set_sql_backend, write_to_file
+from .sql_backends import SqlBackend, SQLiteBackend, DuckDBBackend, ColumnarResult
 from .step_tracker import StepTracker, get_tracker
+from .transition_store import TransitionStore, get_transition_store
+from .query_cache import QueryCache, get_query_cache, set_query_cache
+from .result_cache import ResultCache, sql_fingerprint
+from .run_context import RunContext, get_run_context
+from .schema_index import SchemaIndex, get_schema_index
+from .result_encoder import ResultEncoder, encode_sql_result
+from .sql_prevalidation import SqlPrevalidator, get_sql_prevalidator
+from .example_store import ExampleStore, get_example_store, set_example_store
+from .prompt_capture import PromptSink, MemoryPromptSink, JsonlPromptSink, get_prompt_sink, set_prompt_sink
 
 __all__ = [
     "call_chat_completion",
     "call_chat_completion_structured_outputs",
     "SQLite_exec_sql",
+    "get_sql_backend",
+    "set_sql_backend",
+    "SqlBackend",
+    "SQLiteBackend",
+    "DuckDBBackend",
+    "ColumnarResult",
     "write_to_file",
     "StepTracker",
-    "get_tracker"
+    "get_tracker",
+    "TransitionStore",
+    "get_transition_store",
+    "QueryCache",
+    "get_query_cache",
+    "set_query_cache",
+    "ResultCache",
+    "sql_fingerprint",
+    "RunContext",
+    "get_run_context",
+    "SchemaIndex",
+    "get_schema_index",
+    "ResultEncoder",
+    "encode_sql_result",
+    "SqlPrevalidator",
+    "get_sql_prevalidator",
+    "ExampleStore",
+    "get_example_store",
+    "set_example_store",
+    "PromptSink",
+    "MemoryPromptSink",
+    "JsonlPromptSink",
+    "get_prompt_sink",
+    "set_prompt_sink"
 ]
\ No newline at end of file
@@ -0,0 +1,188 @@
+import sys
+sys.path.append("../../")
+
+import os
+import json
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+# Maximum number of messages waiting to be sent to a single client
+WS_CLIENT_QUEUE_SIZE = int(os.environ.get("WS_CLIENT_QUEUE_SIZE", "256"))
+# Seconds allowed for a single send before the client is considered dead
+WS_SEND_TIMEOUT = float(os.environ.get("WS_SEND_TIMEOUT", "10"))
+
+# Subscription to every run
+ALL_RUNS = "*"
+
+
+class _Envelope:
+    """A broadcast message, serialized at most once no matter how many clients receive it."""
+
+    __slots__ = ("message", "_text")
+
+    def __init__(self, message: Dict[str, Any]):
+        self.message = message
+        self._text: Optional[str] = None
+
+    @property
+    def run_id(self) -> Optional[str]:
+        return self.message.get("run_id")
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            message = dict(self.message)
+            message['input_data'] = str(message.get('input_data', ''))
+            message['output_data'] = str(message.get('output_data', ''))
+            self._text = json.dumps(message, default=str)
+        return self._text
+
+
+class Subscriber:
+    """
+    A websocket client with its own bounded queue and writer task.
+
+    Messages are never awaited on the publisher's path: they are queued and sent by the writer.
+    When the queue is full the oldest message is dropped, and consecutive final answer deltas of
+    the same run are coalesced into one message.
+    """
+
+    def __init__(self, websocket, queue_size: int = WS_CLIENT_QUEUE_SIZE, run_ids: Iterable[str] = ()):
+        self.websocket = websocket
+        self.queue_size = queue_size
+        # Run IDs the client follows; events without a run ID (single-run mode) are always delivered
+        self.run_ids = set(run_ids)
+        self.dropped = 0
+        self.closed = False
+        self._pending: Deque[_Envelope] = deque()
+        self._ready = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    @property
+    def queued(self) -> int:
+        return len(self._pending)
+
+    def wants(self, envelope: _Envelope) -> bool:
+        return self.wants_run(envelope.run_id)
+
+    def wants_run(self, run_id: Optional[str]) -> bool:
+        return not self.closed and (run_id is None or ALL_RUNS in self.run_ids or run_id in self.run_ids)
+
+    def put(self, envelope: _Envelope):
+        if self.closed:
+            return
+        if self._pending and envelope.message.get("type") == "final_answer_delta":
+            last = self._pending[-1]
+            if last.message.get("type") == "final_answer_delta" and last.run_id == envelope.run_id:
+                merged = dict(last.message)
+                merged["delta"] = last.message["delta"] + envelope.message["delta"]
+                self._pending[-1] = _Envelope(merged)
+                return
+        if len(self._pending) >= self.queue_size:
+            self._pending.popleft()
+            self.dropped += 1
+        self._pending.append(envelope)
+        self._ready.set()
+
+    def start(self, on_close):
+        self._writer = asyncio.create_task(self._write_loop(on_close))
+        return self
+
+    async def _write_loop(self, on_close):
+        try:
+            while True:
+                if not self._pending:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                envelope = self._pending.popleft()
+                await asyncio.wait_for(self.websocket.send_text(envelope.text), WS_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error sending message, dropping client: {e}")
+        finally:
+            self.closed = True
+            self._pending.clear()
+            on_close(self)
+
+    async def stop(self):
+        self.closed = True
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+
+
+class ConnectionManager:
+    """
+    Fan-out websocket broadcaster.
+
+    Every connection gets a Subscriber with a bounded queue and a writer task, so a slow or dead
+    client never stalls step execution or the other clients. Dead clients are removed as soon as a
+    send fails. Clients receive the events of the runs they subscribed to (`?run_id=` on connect,
+    or a `{"type": "subscribe", "run_id": ...}` message, "*" for every run) plus untagged events.
+    """
+
+    def __init__(self, queue_size: int = WS_CLIENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.subscribers: Dict[Any, Subscriber] = {}
+
+    @property
+    def active_connections(self) -> List[Any]:
+        return list(self.subscribers)
+
+    async def connect(self, websocket, run_ids: Iterable[str] = ()) -> Subscriber:
+        await websocket.accept()
+        subscriber = Subscriber(websocket, self.queue_size, run_ids).start(self._on_close)
+        self.subscribers[websocket] = subscriber
+        print(f"WebSocket connected. Total connections: {len(self.subscribers)}")
+        return subscriber
+
+    def _on_close(self, subscriber: Subscriber):
+        if self.subscribers.get(subscriber.websocket) is subscriber:
+            del self.subscribers[subscriber.websocket]
+            print(f"WebSocket removed. Remaining connections: {len(self.subscribers)}")
+
+    async def disconnect(self, websocket):
+        subscriber = self.subscribers.pop(websocket, None)
+        if subscriber is not None:
+            await subscriber.stop()
+            print(f"WebSocket disconnected. Remaining connections: {len(self.subscribers)}")
+
+    def subscribe(self, websocket, run_id: str):
+        subscriber = self.subscribers.get(websocket)
+        if subscriber is not None:
+            subscriber.run_ids.add(run_id)
+
+    def unsubscribe(self, websocket, run_id: str):
+        subscriber = self.subscribers.get(websocket)
+        if subscriber is not None:
+            subscriber.run_ids.discard(run_id)
+
+    def has_subscribers(self, run_id: Optional[str] = None) -> bool:
+        """Whether any client would receive an event of the run, publishers skip building unwanted events."""
+        return any(subscriber.wants_run(run_id) for subscriber in self.subscribers.values())
+
+    def publish(self, message: Dict[str, Any]):
+        """Queue a message for every interested client without waiting for any send."""
+        envelope = _Envelope(message)
+        for subscriber in list(self.subscribers.values()):
+            if subscriber.wants(envelope):
+                subscriber.put(envelope)
+
+    async def broadcast(self, message: Dict[str, Any]):
+        self.publish(message)
+
+    def send_to(self, websocket, message: Dict[str, Any]):
+        """Queue a message for a single client, behind the messages already queued for it."""
+        subscriber = self.subscribers.get(websocket)
+        if subscriber is not None:
+            subscriber.put(_Envelope(message))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self.subscribers),
+            "queued": sum(s.queued for s in self.subscribers.values()),
+            "dropped": sum(s.dropped for s in self.subscribers.values()),
+        }
@@ -1,27 +1,201 @@
 import sys
 import os
+import time
+import asyncio
+from typing import Optional
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
 
 sys.path.append("../../")
+import httpx
+from openai import AsyncAzureOpenAI
 from semantic_kernel.contents import ChatHistory
 from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
-from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion, AzureTextEmbedding
 from semantic_kernel.kernel import Kernel
 
+from src.utils.usage_metrics import LLMCallUsage, record_llm_call, record_llm_usage
+from src.utils.llm_cache import get_llm_response_cache
+
 SERVICE_ID = "default"
+EMBEDDING_SERVICE_ID = "embedding"
 REASONING_EFFORT = os.environ.get("REASONING_EFFORT", "medium")
+# Maximum number of in-flight chat completion requests per deployment
+MAX_CONCURRENT_REQUESTS_PER_DEPLOYMENT = int(os.environ.get("MAX_CONCURRENT_REQUESTS_PER_DEPLOYMENT", "8"))
+# Connection pool limits of the shared HTTP client
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "120"))
+
+# Process-wide services, created once and shared by every kernel
+_async_client = None
+_chat_service = None
+_embedding_service = None
+_deployment_semaphores = {}
+
+
+def _create_http_client() -> httpx.AsyncClient:
+    """Create the HTTP client shared by all AI services, with keep-alive and HTTP/2 when available."""
+    try:
+        import h2  # noqa: F401 - HTTP/2 support is optional in httpx
+        http2 = True
+    except ImportError:
+        http2 = False
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(http2=http2, limits=limits, timeout=httpx.Timeout(600.0, connect=10.0))
+
+
+def get_async_client() -> AsyncAzureOpenAI:
+    """
+    Get the process-wide AsyncAzureOpenAI client.
+    
+    Returns None when no API key is configured, in which case the services build their own
+    client (e.g. for Entra ID authentication).
+    """
+    global _async_client
+    if _async_client is None and os.environ.get("AZURE_OPENAI_API_KEY"):
+        _async_client = AsyncAzureOpenAI(
+            api_key=os.environ["AZURE_OPENAI_API_KEY"],
+            azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+            api_version=os.environ.get("AZURE_OPENAI_API_VERSION"),
+            http_client=_create_http_client(),
+        )
+    return _async_client
+
+
+def get_chat_service() -> AzureChatCompletion:
+    """Get the process-wide chat completion service."""
+    global _chat_service
+    if _chat_service is None:
+        _chat_service = AzureChatCompletion(service_id=SERVICE_ID, async_client=get_async_client())
+        print("AzureChatCompletion service created.")
+    return _chat_service
+
+
+def get_embedding_service() -> AzureTextEmbedding:
+    """Get the process-wide embedding service, or None if no embedding deployment is configured."""
+    global _embedding_service
+    if _embedding_service is None and os.environ.get("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"):
+        _embedding_service = AzureTextEmbedding(service_id=EMBEDDING_SERVICE_ID, async_client=get_async_client())
+        print("AzureTextEmbedding service created.")
+    return _embedding_service
+
+
+def get_deployment_name(chat_service: ChatCompletionClientBase) -> str:
+    """Get the deployment (model) a chat service sends its requests to."""
+    return getattr(chat_service, "deployment_name", None) or chat_service.ai_model_id or ""
+
+
+def get_deployment_semaphore(deployment_name: str) -> asyncio.Semaphore:
+    """Get the semaphore bounding concurrent requests to a deployment."""
+    semaphore = _deployment_semaphores.get(deployment_name)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS_PER_DEPLOYMENT)
+        _deployment_semaphores[deployment_name] = semaphore
+    return semaphore
 
 
 async def initialize_kernel() -> Kernel:
-    """Initialize the kernel with the chat completion service."""
+    """Initialize a kernel backed by the shared, long-lived AI services."""
     kernel = Kernel()
-    chat_service = AzureChatCompletion(service_id=SERVICE_ID)
-    kernel.add_service(chat_service)
+    kernel.add_service(get_chat_service())
     print("AzureChatCompletion service registered with kernel.")
+
+    # The embedding service is optional, it enables the semantic tier of the query cache
+    embedding_service = get_embedding_service()
+    if embedding_service is not None:
+        kernel.add_service(embedding_service)
+        print("AzureTextEmbedding service registered with kernel.")
     return kernel
 
+
+async def warm_up_services():
+    """Create the shared services and open a connection to the endpoint ahead of the first request."""
+    get_chat_service()
+    get_embedding_service()
+    client = get_async_client()
+    if client is None:
+        return
+    start_time = time.perf_counter()
+    try:
+        await client.models.list()
+        print(f"Azure OpenAI connection warmed up in {time.perf_counter() - start_time:.3f}s")
+    except Exception as e:
+        # The connection is still established even if listing models is not allowed
+        print(f"Azure OpenAI warm-up request failed: {e}")
+
+
+def has_embedding_service(kernel) -> bool:
+    """Return True if an embedding service is registered with the kernel."""
+    return EMBEDDING_SERVICE_ID in kernel.services
+
+
+async def call_text_embedding(kernel, text: str) -> list:
+    """
+    Call the embedding service and return the embedding vector for the text.
+    
+    Args:
+        kernel: The Semantic Kernel instance
+        text: The text to embed
+        
+    Returns:
+        The embedding as a list of floats
+    """
+    embedding_service = kernel.get_service(service_id=EMBEDDING_SERVICE_ID)
+    embeddings = await embedding_service.generate_embeddings([text])
+    return [float(value) for value in embeddings[0]]
+
+async def _get_chat_response(chat_service: ChatCompletionClientBase, prompt: str, settings, sample: int = 0) -> str:
+    """
+    Send a single-message chat and return the content of the response.
+
+    The response is replayed from the LLM response cache when enabled, and the tokens and latency
+    of the call are attributed to the current step and run, with the prefix hash of the prompt.
+    """
+    deployment_name = get_deployment_name(chat_service)
+    prefix_hash = getattr(prompt, "prefix_hash", None)
+    response_cache = get_llm_response_cache()
+    cache_key = None
+    if response_cache is not None:
+        cache_key = response_cache.key(deployment_name, prompt, settings, sample)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            from src.utils.step_tracker import get_tracker
+            tracker = get_tracker()
+            usage = cached.get("usage", {})
+            record_llm_usage(LLMCallUsage(
+                step_name=tracker.current_step["step_name"] if tracker.current_step else "Unknown",
+                model=deployment_name,
+                prompt_tokens=usage.get("prompt_tokens", 0),
+                cached_prompt_tokens=usage.get("cached_prompt_tokens", 0),
+                completion_tokens=usage.get("completion_tokens", 0),
+                reasoning_tokens=usage.get("reasoning_tokens", 0),
+                prefix_hash=prefix_hash,
+                replayed=True,
+            ), tracker)
+            return cached["content"]
+
+    chat_history = ChatHistory()
+    chat_history.add_user_message(str(prompt))
+    async with get_deployment_semaphore(deployment_name):
+        start_time = time.perf_counter()
+        response = await chat_service.get_chat_message_contents(chat_history=chat_history, settings=settings)
+        latency = time.perf_counter() - start_time
+
+    if response is None:
+        raise ValueError("Failed to get a response from the chat completion service.")
+    # Attribute tokens and latency to the current step and run
+    usage = record_llm_call(response, deployment_name, latency, prefix_hash=prefix_hash)
+
+    answer = response[0].content
+    if response_cache is not None:
+        response_cache.put(cache_key, answer, usage)
+    return answer
+
 async def call_chat_completion(kernel, user_query: str, reasoning_effort=REASONING_EFFORT) -> str:
     """
     Call the chat completion service and return the response as a string.
@@ -37,23 +211,16 @@ async def call_chat_completion(kernel, user_query: str, reasoning_effort=REASONI
     chat_service: ChatCompletionClientBase = kernel.get_service(service_id=SERVICE_ID)
     settings = chat_service.instantiate_prompt_execution_settings(service_id=SERVICE_ID)
 
-    print(f"Model used: {os.environ['AZURE_OPENAI_CHAT_DEPLOYMENT_NAME']}")
-    if (os.environ['AZURE_OPENAI_CHAT_DEPLOYMENT_NAME'] == "o1") or \
-       (os.environ['AZURE_OPENAI_CHAT_DEPLOYMENT_NAME'] == "o3-mini"):
+    deployment_name = get_deployment_name(chat_service)
+    print(f"Model used: {deployment_name}")
+    if deployment_name in ("o1", "o3-mini"):
         settings.reasoning_effort = reasoning_effort
         print("Using reasoning effort:", settings.reasoning_effort)
 
-    chat_history = ChatHistory()
-    chat_history.add_user_message(user_query)
-    response = await chat_service.get_chat_message_contents(chat_history=chat_history, settings=settings)
-
-    if response is None:
-        raise ValueError("Failed to get a response from the chat completion service.")
-
-    answer = response[0].content
+    answer = await _get_chat_response(chat_service, user_query, settings)
     return answer
 
-async def call_chat_completion_structured_outputs(kernel, user_query: str, response_format: any, reasoning_effort=REASONING_EFFORT) -> any:
+async def call_chat_completion_structured_outputs(kernel, user_query: str, response_format: any, reasoning_effort=REASONING_EFFORT, sample: int = 0) -> any:
     """
     Call the chat completion service and return the response as a structured output.
     
@@ -61,6 +228,7 @@ async def call_chat_completion_structured_outputs(kernel, user_query: str, respo
         kernel: The Semantic Kernel instance
         user_query: The query to send to the chat completion service
         response_format: The Pydantic model to use for parsing the response
+        sample: Index of the sample when the same prompt is sent several times, keeps the replayed responses apart
         
     Returns:
         Structured output in the format specified by response_format
@@ -70,20 +238,68 @@ async def call_chat_completion_structured_outputs(kernel, user_query: str, respo
     settings = chat_service.instantiate_prompt_execution_settings(service_id=SERVICE_ID)
     settings.response_format = response_format
 
-    print(f"Model used: {os.environ['AZURE_OPENAI_CHAT_DEPLOYMENT_NAME']}")
-    if (os.environ['AZURE_OPENAI_CHAT_DEPLOYMENT_NAME'] == "o1") or \
-       (os.environ['AZURE_OPENAI_CHAT_DEPLOYMENT_NAME'] == "o3-mini"):
+    deployment_name = get_deployment_name(chat_service)
+    print(f"Model used: {deployment_name}")
+    if deployment_name in ("o1", "o3-mini"):
         settings.reasoning_effort = reasoning_effort
         print("Using reasoning effort:", settings.reasoning_effort)
 
-    chat_history = ChatHistory()
-    chat_history.add_user_message(user_query)
-    response = await chat_service.get_chat_message_contents(chat_history=chat_history, settings=settings)
-
-    if response is None:
-        raise ValueError("Failed to get a response from the chat completion service.")
-
-    answer = response[0].content
+    answer = await _get_chat_response(chat_service, user_query, settings, sample)
     # Parse the JSON response into the specified Pydantic model
     answer = response_format.model_validate_json(answer)
     return answer
+
+async def call_function_streaming(kernel, function, on_delta=None, tracker=None, **arguments) -> str:
+    """
+    Invoke a prompt function with streaming chat completion and return the full answer.
+    
+    Args:
+        kernel: The Semantic Kernel instance
+        function: The prompt function to invoke
+        on_delta: Optional async callback awaited with each text delta as it arrives
+        tracker: StepTracker the usage is attributed to, defaults to the tracker of the current run
+        arguments: The arguments of the prompt function
+        
+    Returns:
+        The complete answer text
+    """
+    deployment_name = get_deployment_name(kernel.get_service(service_id=SERVICE_ID))
+    parts = []
+    # The stream is read into a queue by its own task, so the deployment slot is released as soon as
+    # the model is done, however long the consumer of the deltas takes
+    deltas: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+
+    async def read_stream():
+        usage_message = None
+        time_to_first_token = None
+        try:
+            async with get_deployment_semaphore(deployment_name):
+                start_time = time.perf_counter()
+                async for chunk in kernel.invoke_stream(function, **arguments):
+                    message = chunk[0] if isinstance(chunk, list) and chunk else chunk
+                    if getattr(message, "metadata", None) and message.metadata.get("usage") is not None:
+                        usage_message = message
+                    delta = str(message) if message is not None else ""
+                    if not delta:
+                        continue
+                    if time_to_first_token is None:
+                        time_to_first_token = time.perf_counter() - start_time
+                        print(f"Time to first token: {time_to_first_token:.3f}s")
+                    parts.append(delta)
+                    deltas.put_nowait(delta)
+                latency = time.perf_counter() - start_time
+        finally:
+            deltas.put_nowait(None)
+        record_llm_call([usage_message] if usage_message is not None else None, deployment_name, latency, tracker=tracker)
+
+    reader = asyncio.create_task(read_stream())
+    try:
+        while (delta := await deltas.get()) is not None:
+            if on_delta is not None:
+                await on_delta(delta)
+        # Raises the error of the stream, if any
+        await reader
+    finally:
+        if not reader.done():
+            reader.cancel()
+    return "".join(parts)
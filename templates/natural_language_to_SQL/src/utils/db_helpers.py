@@ -1,12 +1,15 @@
 import sys
 sys.path.append("../../")
-import sqlite3
 import os
+from typing import Optional
+
+from src.utils.sql_backends import SqlBackend, SQLiteBackend, DuckDBBackend
+from src.utils.result_cache import RESULT_CACHE_ENABLED, ResultCache
 
 
 #####################################################
-## IMPORTANT: This is a SQLITE specific function. ##
-## Generate your own for other databases.         ##
+## IMPORTANT: SQLite is the default backend.       ##
+## Implement SqlBackend for other databases.       ##
 #####################################################
 
 # Run in SQLite the SQL statement
@@ -14,42 +17,48 @@ import os
 SQLite_DbName = 'healthcare_data.db'
 db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../")
 
+# Database engine: "sqlite" or "duckdb" (in-process, requires the duckdb package)
+SQL_BACKEND = os.environ.get("SQL_BACKEND", "sqlite").lower()
+# Database file of the DuckDB backend
+DUCKDB_DATABASE = os.environ.get("DUCKDB_DATABASE", os.path.join(db_path, "healthcare_data.duckdb"))
+# Limits of every backend, the SQLITE_* names of earlier versions are read as fallbacks
+# Number of pooled read-only connections, and of threads running queries off the event loop
+SQL_POOL_SIZE = int(os.environ.get("SQL_POOL_SIZE", os.environ.get("SQLITE_POOL_SIZE", "4")))
+# Maximum number of rows returned by a query, 0 for no limit; larger results are flagged "truncated"
+SQL_MAX_ROWS = int(os.environ.get("SQL_MAX_ROWS", os.environ.get("SQLITE_MAX_ROWS", "1000")))
+# Statement timeout in seconds, 0 for no timeout
+SQL_STATEMENT_TIMEOUT = float(os.environ.get("SQL_STATEMENT_TIMEOUT", os.environ.get("SQLITE_STATEMENT_TIMEOUT", "30")))
 
-def SQLite_exec_sql(sql):
-    """Execute SQL query and return results in a standardized format."""
-    if sql is None:
-        return None
 
-    print("Accesing Database", os.path.join(db_path, SQLite_DbName))
-    sql = sql.replace('REC.', 'REC_')  # SQLite does not support . in the column names
-    try:
-        conn = sqlite3.connect(os.path.join(db_path, SQLite_DbName))
-        cursor = conn.cursor()
+_sql_backend: Optional[SqlBackend] = None
+
 
-        print(f"* Running SQL in SQLite ['{sql}']...\n")
-        cursor.execute(sql)
-        rows = cursor.fetchall()
-        
-        # Get column names from cursor description
-        columns = [desc[0] for desc in cursor.description]
-        
-        # Convert rows to list of dicts
-        result = []
-        for row in rows:
-            row_dict = {}
-            for i, value in enumerate(row):
-                row_dict[columns[i]] = value
-            result.append(row_dict)
-            print(row)  # Print each row for debugging
-        
-        cursor.close()
-        conn.close()
-        
-        return {"result": result}
+def get_sql_backend() -> SqlBackend:
+    """Get the process-wide SQL backend for the configured database."""
+    global _sql_backend
+    if _sql_backend is None:
+        if SQL_BACKEND == "duckdb":
+            print("Accesing Database", DUCKDB_DATABASE)
+            _sql_backend = DuckDBBackend(DUCKDB_DATABASE, SQL_POOL_SIZE, SQL_MAX_ROWS, SQL_STATEMENT_TIMEOUT)
+        else:
+            db_file = os.path.join(db_path, SQLite_DbName)
+            print("Accesing Database", db_file)
+            _sql_backend = SQLiteBackend(db_file, SQL_POOL_SIZE, SQL_MAX_ROWS, SQL_STATEMENT_TIMEOUT)
+        # Repeated statements are answered from memory until the database changes
+        if RESULT_CACHE_ENABLED:
+            _sql_backend.result_cache = ResultCache()
+    return _sql_backend
 
-    except Exception as ex:
-        print(f'SQLite_exec_sql ERROR: {ex}')
-        return {"error": str(ex)}
+
+def set_sql_backend(backend: Optional[SqlBackend]):
+    """Replace the process-wide SQL backend (pass None to recreate it from the configuration)."""
+    global _sql_backend
+    _sql_backend = backend
+
+
+def SQLite_exec_sql(sql):
+    """Execute SQL query and return results in a standardized format."""
+    return get_sql_backend().execute(sql)
 
 
 def write_to_file(text, text_filename, mode='a'):
@@ -0,0 +1,208 @@
+import sys
+sys.path.append("../../")
+
+import os
+import re
+import json
+import math
+import time
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.constants.data_model import global_database_model, json_rules
+from src.constants.prompts import few_shot_example_template, few_shot_seed_examples
+from src.utils.query_cache import normalize_query, schema_fingerprint
+from src.utils.result_encoder import get_token_counter
+
+# Retrieve the few-shot examples of the SQL generation prompt per query, "false" for the static block
+FEW_SHOT_RETRIEVAL_ENABLED = os.environ.get("FEW_SHOT_RETRIEVAL_ENABLED", "true").lower() == "true"
+FEW_SHOT_TOP_K = int(os.environ.get("FEW_SHOT_TOP_K", "3"))
+# Token budget of the examples injected in a prompt
+FEW_SHOT_TOKEN_BUDGET = int(os.environ.get("FEW_SHOT_TOKEN_BUDGET", "1000"))
+# Add the question and SQL of runs whose SQL passed the business rules and validation review to the store
+FEW_SHOT_AUTO_APPEND = os.environ.get("FEW_SHOT_AUTO_APPEND", "false").lower() == "true"
+# JSONL file the examples added from runs are appended to and loaded from, empty to keep them in memory
+FEW_SHOT_EXAMPLES_FILE = os.environ.get("FEW_SHOT_EXAMPLES_FILE", "")
+FEW_SHOT_MAX_EXAMPLES = int(os.environ.get("FEW_SHOT_MAX_EXAMPLES", "1000"))
+
+_STOP_WORDS = frozenset(
+    "a an and are as at be by do does for from how i in is it me of on or our per show that the their "
+    "there these this to us was we what when where which who with".split()
+)
+
+
+def _stem(term: str) -> str:
+    # Plural forms only, enough to match "counties" with "county" and "providers" with "provider"
+    if len(term) > 4 and term.endswith("ies"):
+        return term[:-3] + "y"
+    if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+        return term[:-1]
+    return term
+
+
+def tokenize(text: str) -> List[str]:
+    """Split a question into lowercase, singular terms, without stop words."""
+    return [_stem(term) for term in re.findall(r"[a-z0-9_]+", text.lower()) if term not in _STOP_WORDS]
+
+
+@dataclass
+class FewShotExample:
+    """A question and the SQL statement that answered it."""
+    question: str
+    sql_statement: str
+    source: str = "seed"
+    schema_version: str = ""
+    created_at: float = field(default_factory=time.time)
+
+
+class ExampleStore:
+    """
+    Store of few-shot question/SQL examples with a local TF-IDF similarity index.
+
+    Examples are indexed by the terms of their question in an inverted index, so a lookup only
+    scores the examples sharing a term with the query. Examples are deduplicated on the normalized
+    question (the latest SQL wins), and the oldest examples added from runs are evicted once the
+    store is full. Examples recorded under another schema version are ignored when loading.
+    """
+
+    def __init__(self, seed_examples: Iterable[Dict] = (), path: str = FEW_SHOT_EXAMPLES_FILE,
+                 max_examples: int = FEW_SHOT_MAX_EXAMPLES, schema_version: str = "",
+                 auto_append: bool = FEW_SHOT_AUTO_APPEND):
+        self.path = path
+        # Whether the ExecutionStep adds the question and SQL of runs that passed the review
+        self.auto_append = auto_append
+        self.max_examples = max_examples
+        self.schema_version = schema_version
+        self._examples: "OrderedDict[str, FewShotExample]" = OrderedDict()
+        self._terms: Dict[str, Counter] = {}
+        self._postings: Dict[str, set] = defaultdict(set)
+        # TF-IDF norms of the examples, cleared whenever the document frequencies change
+        self._norms: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        for example in seed_examples:
+            self._add(FewShotExample(example["question"], example["sql_statement"], "seed", schema_version))
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._examples)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    example = FewShotExample(**json.loads(line))
+                    if example.schema_version == self.schema_version:
+                        self._add(example)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Error loading few-shot examples from {self.path}: {e}")
+
+    def _remove(self, key: str):
+        self._norms.clear()
+        self._examples.pop(key)
+        for term in self._terms.pop(key):
+            self._postings[term].discard(key)
+            if not self._postings[term]:
+                del self._postings[term]
+
+    def _add(self, example: FewShotExample):
+        key = normalize_query(example.question)
+        if key in self._examples:
+            self._remove(key)
+        self._norms.clear()
+        self._examples[key] = example
+        self._terms[key] = Counter(tokenize(example.question))
+        for term in self._terms[key]:
+            self._postings[term].add(key)
+        while self.max_examples and len(self._examples) > self.max_examples:
+            # Seed examples are kept, the oldest example added from a run goes first
+            oldest = next((k for k, e in self._examples.items() if e.source != "seed"), None)
+            if oldest is None:
+                break
+            self._remove(oldest)
+
+    def add(self, question: str, sql_statement: str, source: str = "run"):
+        """Add an example, and append it to the examples file when one is configured."""
+        example = FewShotExample(question, sql_statement, source, self.schema_version)
+        with self._lock:
+            self._add(example)
+            if not self.path:
+                return
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(asdict(example)) + "\n")
+            except OSError as e:
+                print(f"Error saving few-shot example to {self.path}: {e}")
+
+    def _idf(self, term: str) -> float:
+        return math.log((len(self._examples) + 1) / (len(self._postings.get(term, ())) + 1)) + 1.0
+
+    def search(self, question: str, top_k: int = FEW_SHOT_TOP_K) -> List[Tuple[float, FewShotExample]]:
+        """Return the examples most similar to the question (TF-IDF cosine), best first."""
+        query_terms = Counter(tokenize(question))
+        with self._lock:
+            idf = {term: self._idf(term) for term in query_terms}
+            query_norm = math.sqrt(sum((count * idf[term]) ** 2 for term, count in query_terms.items()))
+            candidates = set().union(*(self._postings.get(term, ()) for term in query_terms)) if query_terms else set()
+            scored = []
+            for key in candidates:
+                terms = self._terms[key]
+                dot = sum(count * idf[term] * terms[term] * idf[term] for term, count in query_terms.items() if term in terms)
+                norm = self._norms.get(key)
+                if norm is None:
+                    norm = self._norms[key] = math.sqrt(sum((count * self._idf(term)) ** 2 for term, count in terms.items()))
+                if dot and norm and query_norm:
+                    scored.append((dot / (norm * query_norm), self._examples[key]))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:top_k]
+
+    def render(self, question: str, top_k: int = FEW_SHOT_TOP_K, token_budget: int = FEW_SHOT_TOKEN_BUDGET) -> str:
+        """Render the most similar examples that fit the token budget for the SQL generation prompt."""
+        count_tokens = get_token_counter()
+        fragments = []
+        used = 0
+        for _, example in self.search(question, top_k):
+            fragment = few_shot_example_template.format(
+                index=len(fragments) + 1, question=example.question, sql_statement=example.sql_statement
+            )
+            tokens = count_tokens(fragment)
+            if token_budget and used + tokens > token_budget:
+                continue
+            fragments.append(fragment)
+            used += tokens
+        return "".join(fragments) if fragments else "No examples available for this question."
+
+    def get_stats(self) -> Dict:
+        sources = Counter(example.source for example in self._examples.values())
+        return {"examples": len(self._examples), "terms": len(self._postings), **sources}
+
+
+_example_store: Optional[ExampleStore] = None
+
+
+def get_example_store() -> Optional[ExampleStore]:
+    """Get the process-wide few-shot example store, None when example retrieval is disabled."""
+    global _example_store
+    if not FEW_SHOT_RETRIEVAL_ENABLED:
+        return None
+    if _example_store is None:
+        _example_store = ExampleStore(
+            few_shot_seed_examples,
+            schema_version=schema_fingerprint(global_database_model, json_rules)
+        )
+    return _example_store
+
+
+def set_example_store(store: Optional[ExampleStore]):
+    """Replace the process-wide few-shot example store."""
+    global _example_store
+    _example_store = store
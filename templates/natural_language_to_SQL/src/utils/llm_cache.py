@@ -0,0 +1,92 @@
+import sys
+sys.path.append("../../")
+
+import os
+import json
+import hashlib
+from typing import Any, Dict, Optional
+
+# Directory of the on-disk LLM response cache, empty to disable it (used for deterministic replays)
+LLM_RESPONSE_CACHE_DIR = os.environ.get("LLM_RESPONSE_CACHE_DIR", "")
+
+
+class LLMResponseCache:
+    """
+    On-disk cache of chat completion responses, keyed by model, prompt and response format.
+
+    Each response is stored as a JSON file holding the content and the token usage of the original
+    call, so replayed runs produce the same SQL and the same token accounting without calling the
+    model. Entries are never invalidated: changing a prompt or the model changes the key.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(model: str, prompt: str, settings: Any = None, sample: int = 0) -> str:
+        response_format = getattr(settings, "response_format", None)
+        if hasattr(response_format, "model_json_schema"):
+            response_format = json.dumps(response_format.model_json_schema(), sort_keys=True)
+        parts = [
+            model,
+            str(getattr(settings, "reasoning_effort", None)),
+            str(response_format),
+            str(prompt),
+        ]
+        # Independent samples of the same prompt (e.g. SQL candidates) are stored separately
+        if sample:
+            parts.append(f"sample={sample}")
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, content: str, usage: Any = None):
+        """Store a response with the usage of the call (an LLMCallUsage)."""
+        entry = {
+            "content": content,
+            "usage": {
+                "prompt_tokens": getattr(usage, "prompt_tokens", 0),
+                "cached_prompt_tokens": getattr(usage, "cached_prompt_tokens", 0),
+                "completion_tokens": getattr(usage, "completion_tokens", 0),
+                "reasoning_tokens": getattr(usage, "reasoning_tokens", 0),
+                "latency": getattr(usage, "latency", 0.0),
+            },
+        }
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so concurrent runs never read a partial entry
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"directory": self.directory, "hits": self.hits, "misses": self.misses}
+
+
+_llm_response_cache: Optional[LLMResponseCache] = LLMResponseCache(LLM_RESPONSE_CACHE_DIR) if LLM_RESPONSE_CACHE_DIR else None
+
+
+def get_llm_response_cache() -> Optional[LLMResponseCache]:
+    """Get the process-wide LLM response cache, or None when it is disabled."""
+    return _llm_response_cache
+
+
+def set_llm_response_cache(cache: Optional[LLMResponseCache]):
+    """Replace the process-wide LLM response cache (pass None to disable it)."""
+    global _llm_response_cache
+    _llm_response_cache = cache
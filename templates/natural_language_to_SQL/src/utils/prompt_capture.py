@@ -0,0 +1,176 @@
+import sys
+sys.path.append("../../")
+
+import os
+import json
+import queue
+import random
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+# Where generated prompts are captured for debugging: "off", "memory" (sampled ring) or "file" (rotating JSONL)
+PROMPT_CAPTURE = os.environ.get("PROMPT_CAPTURE", "off").lower()
+# Share of the prompts that are captured, between 0 and 1
+PROMPT_CAPTURE_SAMPLE_RATE = float(os.environ.get("PROMPT_CAPTURE_SAMPLE_RATE", "1.0"))
+# Number of prompts kept by the in-memory sink
+PROMPT_CAPTURE_CAPACITY = int(os.environ.get("PROMPT_CAPTURE_CAPACITY", "100"))
+# JSONL file of the file sink, rolled over to .1, .2, ... once it exceeds the size limit
+PROMPT_CAPTURE_FILE = os.environ.get("PROMPT_CAPTURE_FILE", "output_prompts/prompts.jsonl")
+PROMPT_CAPTURE_MAX_BYTES = int(os.environ.get("PROMPT_CAPTURE_MAX_BYTES", str(10 * 1024 * 1024)))
+PROMPT_CAPTURE_BACKUPS = int(os.environ.get("PROMPT_CAPTURE_BACKUPS", "3"))
+
+
+class PromptSink(ABC):
+    """Base class of the prompt capture sinks, sampling the prompts before they are stored."""
+
+    def __init__(self, sample_rate: float = PROMPT_CAPTURE_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.captured = 0
+        self.dropped = 0
+
+    def capture(self, run_id: str, step_name: str, prompt: str, index: int = 0):
+        """Capture a prompt, never blocking the caller on I/O."""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self._store({
+            "timestamp": datetime.now().isoformat(),
+            "run_id": run_id,
+            "step_name": step_name,
+            "index": index,
+            "prompt": str(prompt),
+        })
+
+    @abstractmethod
+    def _store(self, entry: Dict[str, Any]):
+        """Store a sampled prompt entry."""
+
+    def close(self):
+        """Flush the pending prompts."""
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"sink": type(self).__name__, "captured": self.captured, "dropped": self.dropped}
+
+
+class MemoryPromptSink(PromptSink):
+    """Keep the latest sampled prompts in a ring buffer."""
+
+    def __init__(self, capacity: int = PROMPT_CAPTURE_CAPACITY, sample_rate: float = PROMPT_CAPTURE_SAMPLE_RATE):
+        super().__init__(sample_rate)
+        self._entries: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+
+    def _store(self, entry: Dict[str, Any]):
+        self._entries.append(entry)
+        self.captured += 1
+
+    def records(self, run_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return the captured prompts oldest first, optionally for a single run."""
+        return [entry for entry in self._entries if run_id is None or entry["run_id"] == run_id]
+
+
+class JsonlPromptSink(PromptSink):
+    """
+    Append the sampled prompts to a JSONL file from a background thread.
+
+    Prompts are handed over through a bounded queue (dropped when it is full), and the file is
+    rolled over to `<path>.1` ... `<path>.<backups>` once it exceeds `max_bytes`.
+    """
+
+    def __init__(self, path: str = PROMPT_CAPTURE_FILE, max_bytes: int = PROMPT_CAPTURE_MAX_BYTES,
+                 backups: int = PROMPT_CAPTURE_BACKUPS, sample_rate: float = PROMPT_CAPTURE_SAMPLE_RATE,
+                 queue_size: int = 1000):
+        super().__init__(sample_rate)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._writer, name="prompt-capture", daemon=True)
+        self._thread.start()
+
+    def _store(self, entry: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _rollover(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _write(self, entries: List[Dict[str, Any]]):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            f = open(self.path, "a", encoding="utf-8")
+            try:
+                for entry in entries:
+                    line = json.dumps(entry) + "\n"
+                    # Counted in bytes, like the limit and the size of the existing file
+                    line_bytes = len(line.encode("utf-8"))
+                    if self.max_bytes and size and size + line_bytes > self.max_bytes:
+                        f.close()
+                        self._rollover()
+                        f = open(self.path, "a", encoding="utf-8")
+                        size = 0
+                    f.write(line)
+                    size += line_bytes
+                    self.captured += 1
+            finally:
+                f.close()
+        except OSError as e:
+            self.dropped += len(entries)
+            print(f"Error capturing prompts to {self.path}: {e}")
+
+    def _writer(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            # Write everything that is already queued in one go
+            entries = [entry]
+            while True:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    self._write(entries)
+                    return
+                entries.append(entry)
+            self._write(entries)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+_prompt_sink: Optional[PromptSink] = None
+
+
+def get_prompt_sink() -> Optional[PromptSink]:
+    """Get the configured prompt capture sink, None when prompt capture is off."""
+    global _prompt_sink
+    if _prompt_sink is None:
+        if PROMPT_CAPTURE == "memory":
+            _prompt_sink = MemoryPromptSink()
+        elif PROMPT_CAPTURE == "file":
+            _prompt_sink = JsonlPromptSink()
+    return _prompt_sink
+
+
+def set_prompt_sink(sink: Optional[PromptSink]):
+    """Replace the prompt capture sink, closing the previous one."""
+    global _prompt_sink
+    if _prompt_sink is not None and _prompt_sink is not sink:
+        _prompt_sink.close()
+    _prompt_sink = sink
@@ -0,0 +1,46 @@
+import sys
+sys.path.append("../../")
+
+import hashlib
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from src.constants.data_model import json_rules
+
+
+class PromptText(str):
+    """A rendered prompt, carrying the hash of its static prefix for the usage metrics."""
+    prefix_hash: Optional[str] = None
+
+
+@lru_cache(maxsize=1)
+def render_rules() -> str:
+    """
+    Render the business rules once for every query.
+
+    The rule conditions refer to the user question, which is placed at the end of each prompt,
+    instead of inlining the question in every rule.
+    """
+    return json_rules.replace("'{question}'", "below").format()
+
+
+@lru_cache(maxsize=256)
+def _render_prefix(template: str, split: int, static_items: Tuple[Tuple[str, Any], ...]) -> Tuple[str, str]:
+    prefix = template[:split].format(**dict(static_items))
+    return prefix, hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+
+
+def render_prompt(template: str, static: Dict[str, Any], dynamic: Dict[str, Any]) -> PromptText:
+    """
+    Render a prompt template whose static placeholders come before the per-query ones.
+
+    The prefix up to the first per-query placeholder is rendered and hashed once per distinct set
+    of static values, the hash identifies the prefix the provider can cache.
+    """
+    positions = [template.find("{" + name + "}") for name in dynamic]
+    split = min((position for position in positions if position >= 0), default=len(template))
+    static = {name: str(value) for name, value in static.items()}
+    prefix, prefix_hash = _render_prefix(template, split, tuple(sorted(static.items())))
+    prompt = PromptText(prefix + template[split:].format(**static, **dynamic))
+    prompt.prefix_hash = prefix_hash
+    return prompt
@@ -0,0 +1,217 @@
+import sys
+sys.path.append("../../")
+
+import os
+import re
+import json
+import math
+import time
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, List, Optional
+
+from rich.console import Console
+
+from src.models.step_models import GetColumnNames
+
+console = Console()
+
+QUERY_CACHE_ENABLED = os.environ.get("QUERY_CACHE_ENABLED", "true").lower() == "true"
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", "256"))
+QUERY_CACHE_TTL_SECONDS = float(os.environ.get("QUERY_CACHE_TTL_SECONDS", "3600"))
+QUERY_CACHE_SIMILARITY_THRESHOLD = float(os.environ.get("QUERY_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+
+EmbeddingFunction = Callable[[str], Awaitable[List[float]]]
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a user query for exact-match lookups (case, whitespace, trailing punctuation)."""
+    normalized = re.sub(r"\s+", " ", query.strip().lower())
+    return normalized.rstrip(" ?!.;")
+
+
+def schema_fingerprint(database_model: Any, rules: Any) -> str:
+    """Hash the database model and business rules so cached entries can be invalidated when either changes."""
+    payload = json.dumps({"model": database_model, "rules": rules}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = math.sqrt(sum(x * x for x in a))
+    norm_b = math.sqrt(sum(y * y for y in b))
+    if norm_a == 0 or norm_b == 0:
+        return 0.0
+    return dot / (norm_a * norm_b)
+
+
+@dataclass
+class CachedQueryResult:
+    """Validated SQL and the table/column selection that produced it."""
+    user_query: str
+    sql_statement: str
+    table_column_names: GetColumnNames
+    schema_version: str
+    # Normalized query the entry is stored under
+    key: str = ""
+    embedding: Optional[List[float]] = None
+    created_at: float = field(default_factory=time.monotonic)
+    hits: int = 0
+
+
+class QueryCache:
+    """
+    Two-tier cache placed in front of the SQL process.
+
+    The first tier matches the normalized query text exactly. The second tier, enabled when an
+    embedding function is supplied, returns the closest cached query whose cosine similarity is
+    above the configured threshold. Entries expire after a TTL, the least recently used entry is
+    evicted once the cache is full, and every entry is tied to the schema/rules fingerprint that
+    was current when it was stored.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = QUERY_CACHE_TTL_SECONDS,
+        similarity_threshold: float = QUERY_CACHE_SIMILARITY_THRESHOLD,
+        embed_fn: Optional[EmbeddingFunction] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.embed_fn = embed_fn
+        self._entries: "OrderedDict[str, CachedQueryResult]" = OrderedDict()
+        self._pending_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._schema_version: Optional[str] = None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def set_schema_version(self, schema_version: str) -> "QueryCache":
+        """Record the current schema/rules fingerprint, dropping all entries if it changed."""
+        if self._schema_version is not None and schema_version != self._schema_version:
+            console.print("[yellow]Database model or business rules changed, invalidating query cache[/yellow]")
+            self.invalidate()
+        self._schema_version = schema_version
+        return self
+
+    def invalidate(self):
+        """Drop every cached entry."""
+        self._entries.clear()
+        self._pending_embeddings.clear()
+
+    def discard(self, user_query: str):
+        """Drop the entry for a single query or entry key, e.g. when its cached SQL failed to execute."""
+        self._entries.pop(normalize_query(user_query), None)
+
+    def _is_expired(self, entry: CachedQueryResult) -> bool:
+        return self.ttl_seconds > 0 and (time.monotonic() - entry.created_at) > self.ttl_seconds
+
+    def _evict_expired(self):
+        expired = [key for key, entry in self._entries.items() if self._is_expired(entry)]
+        for key in expired:
+            del self._entries[key]
+
+    async def _embed(self, text: str) -> Optional[List[float]]:
+        if self.embed_fn is None:
+            return None
+        try:
+            return await self.embed_fn(text)
+        except Exception as e:
+            console.print(f"[bold red]Query cache embedding failed, skipping semantic tier: {e}[/bold red]")
+            return None
+
+    async def lookup(self, user_query: str) -> Optional[CachedQueryResult]:
+        """Look up a cached result for the query, trying the exact tier before the semantic tier."""
+        self._evict_expired()
+        key = normalize_query(user_query)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            self.hits += 1
+            return entry
+
+        embedding = await self._embed(key)
+        if embedding is not None:
+            best_key, best_score = None, -1.0
+            for candidate_key, candidate in self._entries.items():
+                if candidate.embedding is None:
+                    continue
+                score = _cosine_similarity(embedding, candidate.embedding)
+                if score > best_score:
+                    best_key, best_score = candidate_key, score
+
+            if best_key is not None and best_score >= self.similarity_threshold:
+                self._entries.move_to_end(best_key)
+                entry = self._entries[best_key]
+                entry.hits += 1
+                self.semantic_hits += 1
+                console.print(f"[green]Semantic cache hit (similarity {best_score:.3f}):[/green] {entry.user_query}")
+                return entry
+
+        self.misses += 1
+        if embedding is not None:
+            # Keep the embedding around so that storing the result of this run does not embed again
+            self._pending_embeddings[key] = embedding
+            while len(self._pending_embeddings) > self.max_entries:
+                self._pending_embeddings.popitem(last=False)
+        return None
+
+    async def store(
+        self,
+        user_query: str,
+        sql_statement: str,
+        table_column_names: GetColumnNames,
+        embedding: Optional[List[float]] = None,
+    ) -> CachedQueryResult:
+        """Store the validated SQL and table/column selection for the query."""
+        key = normalize_query(user_query)
+        if embedding is None:
+            embedding = self._pending_embeddings.pop(key, None)
+        if embedding is None:
+            embedding = await self._embed(key)
+
+        entry = CachedQueryResult(
+            user_query=user_query,
+            sql_statement=sql_statement,
+            table_column_names=table_column_names,
+            schema_version=self._schema_version,
+            key=key,
+            embedding=embedding,
+        )
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def get_stats(self) -> dict:
+        """Return hit/miss counters for monitoring."""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+        }
+
+
+_query_cache: Optional[QueryCache] = QueryCache() if QUERY_CACHE_ENABLED else None
+
+
+def get_query_cache() -> Optional[QueryCache]:
+    """Get the process-wide query cache, or None when caching is disabled."""
+    return _query_cache
+
+
+def set_query_cache(cache: Optional[QueryCache]):
+    """Replace the process-wide query cache (pass None to disable caching)."""
+    global _query_cache
+    _query_cache = cache
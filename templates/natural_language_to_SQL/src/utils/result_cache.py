@@ -0,0 +1,135 @@
+import sys
+sys.path.append("../../")
+
+import os
+import re
+import copy
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+# Cache the results of executed SQL statements, keyed by their normalized text
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "true").lower() == "true"
+# Memory budget of the cached results (estimated from their JSON size), least recently used are evicted
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# String literals and quoted identifiers are kept verbatim, comments are dropped
+_SQL_TOKENS = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\])|(--[^\n]*|/\*.*?\*/)|(\s+)", re.DOTALL)
+
+
+def sql_fingerprint(sql: str) -> str:
+    """
+    Normalize a SQL statement so that equivalent spellings share a cache entry.
+
+    Comments are removed, whitespace is collapsed, a trailing semicolon is dropped and everything
+    outside quotes is lowercased (keywords and unquoted identifiers are case-insensitive).
+    """
+    parts = []
+    unquoted = []
+    position = 0
+    for match in _SQL_TOKENS.finditer(sql):
+        quoted, comment, _ = match.groups()
+        unquoted.append(sql[position:match.start()])
+        position = match.end()
+        if not quoted:
+            unquoted.append(" ")
+            continue
+        # Literals and quoted identifiers are appended untouched, 'a , b' and 'a,b' are different values
+        parts.append(_normalize_segment("".join(unquoted)))
+        parts.append(quoted)
+        unquoted = []
+    unquoted.append(sql[position:])
+    parts.append(_normalize_segment("".join(unquoted)))
+    return "".join(parts).strip().rstrip("; ")
+
+
+def _normalize_segment(segment: str) -> str:
+    segment = re.sub(r"\s+", " ", segment.lower())
+    return re.sub(r" ?([(),=<>]) ?", r"\1", segment)
+
+
+class ResultCache:
+    """
+    LRU cache of successful execution responses, bounded by an estimated memory budget.
+
+    Entries are keyed by the SQL fingerprint and the row limit, and tagged with the data version of
+    the database when the statement started (see `SqlBackend.data_version`). An entry recorded under
+    another data version is dropped on lookup, so results are never served after the data changed.
+    `invalidate()` drops everything explicitly.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[str, Tuple[Hashable, Dict[str, Any], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(sql: str, max_rows: int) -> str:
+        return hashlib.sha256(f"{max_rows}\x1f{sql_fingerprint(sql)}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str, data_version: Hashable) -> Optional[Dict[str, Any]]:
+        """
+        Return a deep copy of the cached response, None when missing or recorded under another data version.
+
+        Callers own the returned rows, so changes to them never reach the cached entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != data_version:
+                self._drop(key)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            response = entry[1]
+        return copy.deepcopy(response)
+
+    def put(self, key: str, data_version: Hashable, response: Dict[str, Any]):
+        """Store a successful response, responses larger than the whole budget are not cached."""
+        if not isinstance(response, dict) or "error" in response:
+            return
+        size = len(json.dumps(response, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            # Copied so that later changes to the caller's response do not reach the cache
+            self._entries[key] = (data_version, copy.deepcopy(response), size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self.size -= size
+
+    def invalidate(self):
+        """Drop every cached result, e.g. after loading new data."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.invalidations += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for monitoring."""
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
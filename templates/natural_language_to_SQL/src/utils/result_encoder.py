@@ -0,0 +1,146 @@
+import sys
+sys.path.append("../../")
+
+import os
+import json
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+# Encoding of SQL results in the final answer prompt: "columnar" (header once, one JSON array per row),
+# "markdown" (markdown table) or "raw" (the str() of the result, as before)
+RESULT_ENCODING = os.environ.get("RESULT_ENCODING", "columnar").lower()
+# Token budget of the encoded result, rows that do not fit are summarized instead, 0 for no limit
+RESULT_TOKEN_BUDGET = int(os.environ.get("RESULT_TOKEN_BUDGET", "3000"))
+# Add per-column summary statistics when rows are left out of the prompt
+RESULT_SUMMARY_STATS = os.environ.get("RESULT_SUMMARY_STATS", "true").lower() == "true"
+# Number of most frequent values listed for non-numeric columns in the summary
+RESULT_TOP_K = int(os.environ.get("RESULT_TOP_K", "3"))
+RESULT_TOKENIZER_ENCODING = os.environ.get("RESULT_TOKENIZER_ENCODING", "o200k_base")
+
+_token_counter: Optional[Callable[[str], int]] = None
+
+
+def get_token_counter() -> Callable[[str], int]:
+    """Count tokens with tiktoken when available, otherwise estimate them as 4 characters per token."""
+    global _token_counter
+    if _token_counter is None:
+        try:
+            import tiktoken
+            encoding = tiktoken.get_encoding(RESULT_TOKENIZER_ENCODING)
+            _token_counter = lambda text: len(encoding.encode(text, disallowed_special=()))
+        except Exception as e:
+            print(f"tiktoken unavailable ({e}), estimating token counts from the text length")
+            _token_counter = lambda text: (len(text) + 3) // 4
+    return _token_counter
+
+
+def _truncation_note(row_count: int) -> str:
+    return f"(result truncated: the query returned more than {row_count} rows, only the first {row_count} were fetched)"
+
+
+def _format_value(value: Any) -> str:
+    if value is None:
+        return ""
+    return str(value).replace("|", "\\|").replace("\n", " ")
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def summarize_columns(columns: List[str], rows: List[Dict[str, Any]], top_k: int = RESULT_TOP_K) -> Dict[str, Dict[str, Any]]:
+    """Compute per-column statistics locally: count, min/max for numeric columns, top-k values otherwise."""
+    summary = {}
+    for column in columns:
+        values = [row.get(column) for row in rows]
+        present = [value for value in values if value is not None]
+        stats: Dict[str, Any] = {"count": len(present)}
+        if present and all(_is_number(value) for value in present):
+            stats["min"] = min(present)
+            stats["max"] = max(present)
+        elif present:
+            counts = Counter(str(value) for value in present)
+            stats["distinct"] = len(counts)
+            stats["top"] = [value for value, _ in counts.most_common(top_k)]
+        summary[column] = stats
+    return summary
+
+
+class ResultEncoder:
+    """
+    Compact encoding of SQL results for the final answer prompt.
+
+    A list of row dicts repeats every column name on every row; the encoder writes the column
+    header once followed by the row values, keeps as many rows as fit in the token budget, and
+    replaces the rows left out with locally computed summary statistics.
+    """
+
+    def __init__(self, mode: str = RESULT_ENCODING, token_budget: int = RESULT_TOKEN_BUDGET,
+                 summary_stats: bool = RESULT_SUMMARY_STATS, top_k: int = RESULT_TOP_K):
+        self.mode = mode
+        self.token_budget = token_budget
+        self.summary_stats = summary_stats
+        self.top_k = top_k
+
+    def _header(self, columns: List[str]) -> str:
+        if self.mode == "markdown":
+            return "| " + " | ".join(columns) + " |\n|" + "---|" * len(columns)
+        return "columns: " + json.dumps(columns, ensure_ascii=False)
+
+    def _row(self, columns: List[str], row: Dict[str, Any]) -> str:
+        if self.mode == "markdown":
+            return "| " + " | ".join(_format_value(row.get(column)) for column in columns) + " |"
+        return json.dumps([row.get(column) for column in columns], ensure_ascii=False, default=str)
+
+    def encode(self, sql_result: Any) -> str:
+        """Encode an executor response ({"result": [...]} or {"error": ...}) or a list of row dicts."""
+        if isinstance(sql_result, dict) and "result" in sql_result:
+            rows, truncated = sql_result["result"], sql_result.get("truncated", False)
+        elif isinstance(sql_result, list):
+            rows, truncated = sql_result, False
+        else:
+            return str(sql_result)
+        if self.mode == "raw" or not rows or not isinstance(rows[0], dict):
+            return str(sql_result) + (f"\n{_truncation_note(len(rows))}" if truncated else "")
+
+        columns = list(rows[0].keys())
+        count_tokens = get_token_counter()
+        lines = [self._header(columns)]
+        used = count_tokens(lines[0])
+        included = 0
+        for row in rows:
+            line = self._row(columns, row)
+            if self.token_budget:
+                # One extra token for the newline
+                used += count_tokens(line) + 1
+                if used > self.token_budget:
+                    break
+            lines.append(line)
+            included += 1
+
+        omitted = len(rows) - included
+        if omitted or truncated:
+            note = f"({included} of {len(rows)}{'+' if truncated else ''} rows shown)"
+            lines.append(note)
+            if truncated:
+                lines.append(_truncation_note(len(rows)))
+            if self.summary_stats:
+                summary = summarize_columns(columns, rows, self.top_k)
+                lines.append("summary of all returned rows: " + json.dumps(summary, ensure_ascii=False, default=str))
+        return "\n".join(lines)
+
+
+_result_encoder: Optional[ResultEncoder] = None
+
+
+def get_result_encoder() -> ResultEncoder:
+    """Get the result encoder configured from the environment."""
+    global _result_encoder
+    if _result_encoder is None:
+        _result_encoder = ResultEncoder()
+    return _result_encoder
+
+
+def encode_sql_result(sql_result: Any) -> str:
+    """Encode a SQL result for the final answer prompt."""
+    return get_result_encoder().encode(sql_result)
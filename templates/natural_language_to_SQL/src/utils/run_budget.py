@@ -0,0 +1,143 @@
+import sys
+sys.path.append("../../")
+
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from rich.console import Console
+
+from src.models.events import SQLEvents
+from src.models.step_models import ExecutionResult
+from src.utils.db_helpers import get_sql_backend
+from src.utils.query_cache import normalize_query
+
+console = Console()
+
+# Per-run caps, 0 disables a cap
+RUN_MAX_LLM_CALLS = int(os.environ.get("RUN_MAX_LLM_CALLS", "40"))
+RUN_MAX_SECONDS = float(os.environ.get("RUN_MAX_SECONDS", "300"))
+RUN_MAX_TOKENS = int(os.environ.get("RUN_MAX_TOKENS", "250000"))
+# Give up once the same SQL statement has been generated this many times
+RUN_MAX_REPEATED_SQL = int(os.environ.get("RUN_MAX_REPEATED_SQL", "3"))
+
+
+@dataclass
+class RunBudget:
+    """
+    Resource budget of a single run: LLM calls, wall-clock time and tokens.
+
+    Also tracks the SQL statements generated across iterations to detect loops, and the best
+    statement and execution response so far, returned when the run gives up.
+    """
+    max_llm_calls: int = RUN_MAX_LLM_CALLS
+    max_seconds: float = RUN_MAX_SECONDS
+    max_tokens: int = RUN_MAX_TOKENS
+    max_repeated_sql: int = RUN_MAX_REPEATED_SQL
+    started_at: float = field(default_factory=time.monotonic)
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    iterations: int = 0
+    sql_counts: Counter = field(default_factory=Counter)
+    last_sql: Optional[str] = None
+    # Last statement that passed the review, and the response of the last execution
+    best_sql: Optional[str] = None
+    best_response: Optional[Any] = None
+    gave_up_reason: Optional[str] = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def record_llm_call(self, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.llm_calls += 1
+        self.prompt_tokens += prompt_tokens or 0
+        self.completion_tokens += completion_tokens or 0
+
+    def record_sql(self, sql_statement: str) -> int:
+        """Record a generated statement and return how many times it has been generated in this run."""
+        self.iterations += 1
+        self.last_sql = sql_statement
+        key = normalize_query(sql_statement or "")
+        self.sql_counts[key] += 1
+        return self.sql_counts[key]
+
+    def exceeded(self) -> Optional[str]:
+        """Return the reason the run is over budget, None while it is within budget."""
+        if self.max_llm_calls and self.llm_calls >= self.max_llm_calls:
+            return f"LLM call budget exhausted ({self.llm_calls}/{self.max_llm_calls} calls)"
+        if self.max_tokens and self.total_tokens >= self.max_tokens:
+            return f"Token budget exhausted ({self.total_tokens}/{self.max_tokens} tokens)"
+        if self.max_seconds and self.elapsed >= self.max_seconds:
+            return f"Time budget exhausted ({self.elapsed:.1f}/{self.max_seconds:.0f}s)"
+        return None
+
+    def check_loop(self, sql_statement: str) -> Optional[str]:
+        """Record the statement and return a reason when the run keeps generating the same SQL."""
+        count = self.record_sql(sql_statement)
+        if self.max_repeated_sql and count >= self.max_repeated_sql:
+            return f"Loop detected: the same SQL statement was generated {count} times"
+        return None
+
+    def set_best_sql(self, sql_statement: str):
+        """Record a statement that passed the review, it has not been executed yet."""
+        self.best_sql = sql_statement
+        self.best_response = None
+
+    def record_execution(self, sql_statement: str, response: Any):
+        self.best_sql = sql_statement
+        self.best_response = response
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the budget usage as a serializable dict."""
+        return {
+            "llm_calls": self.llm_calls,
+            "max_llm_calls": self.max_llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "max_tokens": self.max_tokens,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "max_seconds": self.max_seconds,
+            "iterations": self.iterations,
+            "distinct_sql": len(self.sql_counts),
+            "gave_up_reason": self.gave_up_reason,
+        }
+
+
+async def give_up(context, run_context, reason: str):
+    """
+    Stop the run with the best answer so far and emit the terminal GiveUp event.
+
+    The best answer is the last statement that passed the review (or else the last generated one),
+    executed once if it was not executed yet, otherwise the response of the last execution. The
+    RunContext of the run is passed in, as it holds this budget (run_context imports this module).
+    """
+    budget = run_context.budget
+    budget.gave_up_reason = reason
+    console.print(f"[bold red]Giving up: {reason}[/bold red]")
+
+    sql_statement = budget.best_sql or budget.last_sql
+    response = budget.best_response
+    if response is None and sql_statement:
+        response = await get_sql_backend().execute_async(sql_statement)
+    if response is None:
+        response = {"error": f"No answer could be produced: {reason}"}
+
+    result = ExecutionResult(
+        user_query=run_context.user_query,
+        sql_statement=sql_statement or "",
+        response=response,
+        gave_up_reason=reason
+    )
+    run_context.result = result.model_dump()
+    await context.emit_event(process_event=SQLEvents.GiveUp, data=result)
+    print("Emitted event: GiveUp.")
+    return result
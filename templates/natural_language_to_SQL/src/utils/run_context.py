@@ -0,0 +1,71 @@
+import sys
+sys.path.append("../../")
+
+import os
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional
+
+from src.utils.run_budget import RunBudget
+
+# Maximum number of notes from failed attempts that are kept and forwarded to the next generation round
+MAX_ISSUE_HISTORY = int(os.environ.get("MAX_ISSUE_HISTORY", "5"))
+
+
+@dataclass
+class RunContext:
+    """
+    Per-run state shared by the steps of a single SqlProcess run.
+
+    The local process runtime executes steps as tasks spawned from `SqlProcess.start`, so a
+    context variable set there is visible to every step of that run and to no other run.
+    """
+    run_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    user_query: str = ""
+    validation_retries: int = 0
+    business_rules_retries: int = 0
+    precheck_retries: int = 0
+    prompt_counter: int = 0
+    issue_history: Deque[str] = field(default_factory=lambda: deque(maxlen=MAX_ISSUE_HISTORY))
+    # LLM call, time and token budget of the run, with loop detection
+    budget: RunBudget = field(default_factory=RunBudget)
+    # StepTracker dedicated to this run, None to use the process-wide tracker
+    tracker: Any = None
+    # QueryCache the run was started with, None when query caching is disabled
+    query_cache: Any = None
+    # Execution result handed back to the caller in memory: {"query": ..., "response": ...}
+    result: Optional[Dict[str, Any]] = None
+
+    def add_issue(self, note: str) -> str:
+        """Record a note from a failed attempt and return the notes to forward to the next round."""
+        self.issue_history.append(note)
+        return "\n\n".join(self.issue_history)
+
+
+_current_run: ContextVar[Optional[RunContext]] = ContextVar("sql_process_run", default=None)
+
+
+def get_run_context() -> RunContext:
+    """Get the context of the current run, creating one if the steps are used outside SqlProcess."""
+    run_context = _current_run.get()
+    if run_context is None:
+        run_context = RunContext()
+        _current_run.set(run_context)
+    return run_context
+
+
+def peek_run_context() -> Optional[RunContext]:
+    """Get the context of the current run without creating one."""
+    return _current_run.get()
+
+
+def set_run_context(run_context: RunContext):
+    """Bind the run context to the current task and the tasks it spawns."""
+    return _current_run.set(run_context)
+
+
+def reset_run_context(token):
+    """Restore the run context that was active before `set_run_context`."""
+    _current_run.reset(token)
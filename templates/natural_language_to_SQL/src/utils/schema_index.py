@@ -0,0 +1,83 @@
+import sys
+sys.path.append("../../")
+
+import json
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.constants.data_model import global_database_model
+
+
+class SchemaIndex:
+    """
+    Lookup structure over the database model, built once.
+
+    Tables and columns are indexed by name, and each table and column is rendered to its prompt
+    fragment up front, so assembling the schema section of a prompt only costs the number of
+    selected tables and columns instead of scanning the whole model.
+    """
+
+    def __init__(self, database_model: List[Dict]):
+        self.tables: Dict[str, Dict] = {}
+        self.columns: Dict[Tuple[str, str], Dict] = {}
+        self._table_fragments: Dict[str, str] = {}
+        self._table_headers: Dict[str, str] = {}
+        self._column_fragments: Dict[Tuple[str, str], str] = {}
+
+        for table in database_model:
+            table_name = table["TableName"]
+            self.tables[table_name] = table
+            self._table_fragments[table_name] = json.dumps(table, ensure_ascii=False)
+            # Header of the table object without the closing brace, the selected columns are appended to it
+            header = {"TableName": table_name, "Description": table.get("Description", "")}
+            self._table_headers[table_name] = json.dumps(header, ensure_ascii=False)[:-1]
+            for column in table.get("Columns", []):
+                key = (table_name, column["ColumnName"])
+                self.columns[key] = column
+                self._column_fragments[key] = json.dumps(column, ensure_ascii=False)
+
+        # Cache rendered column subsets per table, the same selections come back across retries
+        self._render_table_subset = lru_cache(maxsize=1024)(self._render_table_subset_uncached)
+
+    def has_table(self, table_name: str) -> bool:
+        return table_name in self.tables
+
+    def has_column(self, table_name: str, column_name: str) -> bool:
+        return (table_name, column_name) in self.columns
+
+    def get_table(self, table_name: str) -> Optional[Dict]:
+        return self.tables.get(table_name)
+
+    def get_column(self, table_name: str, column_name: str) -> Optional[Dict]:
+        return self.columns.get((table_name, column_name))
+
+    def render_tables(self, table_names: Iterable[str]) -> str:
+        """Render the full definition of the given tables, skipping unknown ones."""
+        fragments = [self._table_fragments[name] for name in table_names if name in self._table_fragments]
+        return "[" + ", ".join(fragments) + "]"
+
+    def _render_table_subset_uncached(self, table_name: str, column_names: Tuple[str, ...]) -> str:
+        columns = [
+            self._column_fragments[(table_name, column_name)]
+            for column_name in column_names
+            if (table_name, column_name) in self._column_fragments
+        ]
+        return self._table_headers[table_name] + ', "Columns": [' + ", ".join(columns) + "]}"
+
+    def render_table_columns(self, table_columns: Iterable[Tuple[str, Iterable[str]]]) -> str:
+        """Render the given tables restricted to the selected columns, skipping unknown tables and columns."""
+        fragments = [
+            self._render_table_subset(table_name, tuple(column_names))
+            for table_name, column_names in table_columns
+            if table_name in self._table_headers
+        ]
+        return "[" + ", ".join(fragments) + "]"
+
+
+# Built once at import time
+schema_index = SchemaIndex(global_database_model)
+
+
+def get_schema_index() -> SchemaIndex:
+    """Get the schema index of the database model."""
+    return schema_index
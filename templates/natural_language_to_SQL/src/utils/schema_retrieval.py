@@ -0,0 +1,143 @@
+import sys
+sys.path.append("./")
+sys.path.append("../")
+sys.path.append("../../")
+
+import os
+import json
+import asyncio
+from typing import Dict, List, Optional
+
+import numpy as np
+from rich.console import Console
+
+from src.constants.data_model import global_database_model, json_rules, table_descriptions
+from src.utils.query_cache import schema_fingerprint
+
+console = Console()
+
+SCHEMA_RETRIEVAL_ENABLED = os.environ.get("SCHEMA_RETRIEVAL_ENABLED", "false").lower() == "true"
+SCHEMA_RETRIEVAL_TOP_K = int(os.environ.get("SCHEMA_RETRIEVAL_TOP_K", "5"))
+SCHEMA_RETRIEVAL_INDEX_PATH = os.environ.get(
+    "SCHEMA_RETRIEVAL_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../schema_retrieval_index")
+)
+
+
+def _index_documents(database_model: List[Dict], descriptions: List[Dict]) -> List[Dict]:
+    """One document per table description and one per column description, each pointing to its table."""
+    documents = []
+    for table in descriptions:
+        documents.append({"table_name": table["TableName"], "text": f"{table['TableName']}: {table['Description']}"})
+    for table in database_model:
+        for column in table.get("Columns", []):
+            text = f"{table['TableName']}.{column['ColumnName']}: {column.get('Description', '')}"
+            documents.append({"table_name": table["TableName"], "text": text})
+    return documents
+
+
+class SchemaRetrievalIndex:
+    """
+    Local vector index over table and column descriptions, used to prefilter candidate tables.
+
+    The index is built offline (see `build_index`), persisted as a `.npy` matrix of normalized
+    embeddings plus a `.json` metadata file, and memory-mapped when loaded.
+    """
+
+    def __init__(self, embeddings: np.ndarray, table_names: List[str], schema_version: str):
+        self.embeddings = embeddings
+        self.table_names = table_names
+        self.schema_version = schema_version
+
+    @staticmethod
+    def _paths(path: str):
+        return f"{path}.npy", f"{path}.json"
+
+    def save(self, path: str = SCHEMA_RETRIEVAL_INDEX_PATH):
+        matrix_path, metadata_path = self._paths(path)
+        np.save(matrix_path, np.ascontiguousarray(self.embeddings, dtype=np.float32))
+        with open(metadata_path, "w", encoding="utf-8") as f:
+            json.dump({"schema_version": self.schema_version, "table_names": self.table_names}, f)
+        console.print(f"[green]Schema retrieval index saved to {matrix_path}[/green]")
+
+    @classmethod
+    def load(cls, path: str = SCHEMA_RETRIEVAL_INDEX_PATH) -> "SchemaRetrievalIndex":
+        matrix_path, metadata_path = cls._paths(path)
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        embeddings = np.load(matrix_path, mmap_mode="r")
+        return cls(embeddings, metadata["table_names"], metadata["schema_version"])
+
+    def search_tables(self, query_embedding: List[float], top_k: int = SCHEMA_RETRIEVAL_TOP_K) -> List[str]:
+        """Return the top-k tables, each scored by its best matching table or column document."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = self.embeddings @ (query / norm)
+
+        best_scores: Dict[str, float] = {}
+        for table_name, score in zip(self.table_names, scores.tolist()):
+            if score > best_scores.get(table_name, -1.0):
+                best_scores[table_name] = score
+        ranked = sorted(best_scores.items(), key=lambda item: item[1], reverse=True)
+        return [table_name for table_name, _ in ranked[:top_k]]
+
+
+async def build_index(kernel, path: str = SCHEMA_RETRIEVAL_INDEX_PATH) -> SchemaRetrievalIndex:
+    """Embed every table and column description with the kernel's embedding service and persist the index."""
+    from src.utils.chat_helpers import EMBEDDING_SERVICE_ID
+
+    documents = _index_documents(global_database_model, table_descriptions)
+    embedding_service = kernel.get_service(service_id=EMBEDDING_SERVICE_ID)
+    embeddings = await embedding_service.generate_embeddings([doc["text"] for doc in documents])
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.where(norms == 0, 1.0, norms)
+
+    index = SchemaRetrievalIndex(
+        embeddings,
+        [doc["table_name"] for doc in documents],
+        schema_fingerprint(global_database_model, json_rules)
+    )
+    index.save(path)
+    return index
+
+
+_retrieval_index: Optional[SchemaRetrievalIndex] = None
+_retrieval_index_loaded = False
+
+
+def get_schema_retrieval_index() -> Optional[SchemaRetrievalIndex]:
+    """
+    Get the persisted retrieval index, loading it on first use.
+
+    Returns None when retrieval is disabled, the index has not been built, or it was built
+    for a different version of the database model.
+    """
+    global _retrieval_index, _retrieval_index_loaded
+    if not SCHEMA_RETRIEVAL_ENABLED:
+        return None
+    if not _retrieval_index_loaded:
+        _retrieval_index_loaded = True
+        try:
+            index = SchemaRetrievalIndex.load()
+        except FileNotFoundError:
+            console.print("[yellow]Schema retrieval index not found, run `python src/utils/schema_retrieval.py` to build it[/yellow]")
+            return None
+        if index.schema_version != schema_fingerprint(global_database_model, json_rules):
+            console.print("[yellow]Schema retrieval index is stale, rebuild it to enable table prefiltering[/yellow]")
+            return None
+        _retrieval_index = index
+        console.print(f"[green]Schema retrieval index loaded ({len(index.table_names)} documents)[/green]")
+    return _retrieval_index
+
+
+async def main():
+    from src.utils.chat_helpers import initialize_kernel
+    kernel = await initialize_kernel()
+    await build_index(kernel)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
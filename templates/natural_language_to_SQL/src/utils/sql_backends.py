@@ -0,0 +1,409 @@
+import sys
+sys.path.append("../../")
+
+import os
+import time
+import queue
+import asyncio
+import pathlib
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+# Number of SQLite virtual machine instructions between two timeout checks
+SQLITE_PROGRESS_INTERVAL = 10000
+# Polling interval of the watchdog interrupting engines without a progress handler
+WATCHDOG_INTERVAL = 0.05
+# Extra time an async caller waits for a query stuck behind busy threads before cancelling it
+QUEUE_GRACE = 1.0
+# Identifier rewrites applied to every statement, e.g. nested 'INSURANCE_REC.X' fields are stored as 'INSURANCE_REC_X'
+DEFAULT_IDENTIFIER_REWRITES = {"REC.": "REC_"}
+
+
+@dataclass
+class ColumnarResult:
+    """Column-major query result: the column names once, and one list of values per column."""
+    columns: List[str]
+    data: Dict[str, List[Any]] = field(default_factory=dict)
+    num_rows: int = 0
+    truncated: bool = False
+
+    def rows(self) -> Iterator[Tuple[Any, ...]]:
+        return zip(*(self.data[column] for column in self.columns))
+
+
+class ConnectionPool:
+    """Thread-safe pool of connections created lazily by `connect`."""
+
+    def __init__(self, connect: Callable[[], Any], size: int):
+        self._connect = connect
+        self.size = size
+        self._connections: queue.Queue = queue.Queue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._connections.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                return self._connect()
+            return self._connections.get()
+
+    def release(self, conn):
+        self._connections.put_nowait(conn)
+
+    def close(self):
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+        self._created = 0
+
+
+class RowStream:
+    """
+    Streaming cursor over the result of a query.
+
+    Used as a context manager: the connection is held until the stream is closed, rows are
+    fetched in batches and iteration stops once `max_rows` rows have been produced.
+    """
+
+    def __init__(self, backend: "SqlBackend", sql: str, max_rows: int, timeout: float,
+                 cancel_event: Optional[threading.Event] = None, batch_size: int = 256):
+        self.backend = backend
+        self.sql = sql
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self.cancel_event = cancel_event
+        self.batch_size = batch_size
+        self.columns: List[str] = []
+        self.truncated = False
+        self._conn = None
+        self._cursor = None
+        self._stop_interrupt: Optional[Callable[[], None]] = None
+
+    def __enter__(self) -> "RowStream":
+        cancel_event = self.cancel_event
+        if cancel_event is not None and cancel_event.is_set():
+            raise RuntimeError("cancelled before start")
+        deadline = time.monotonic() + self.timeout if self.timeout > 0 else None
+
+        def should_interrupt() -> bool:
+            if cancel_event is not None and cancel_event.is_set():
+                return True
+            return deadline is not None and time.monotonic() > deadline
+
+        self._conn = self.backend.pool.acquire()
+        if deadline is not None or cancel_event is not None:
+            self._stop_interrupt = self.backend.install_interrupt(self._conn, should_interrupt)
+        try:
+            self._cursor = self._conn.execute(self.sql)
+        except Exception:
+            self.__exit__(None, None, None)
+            raise
+        self.columns = [desc[0] for desc in self._cursor.description or []]
+        return self
+
+    def fetch_batches(self) -> Iterator[List[Tuple[Any, ...]]]:
+        """Yield batches of rows until `max_rows` rows have been produced."""
+        produced = 0
+        while True:
+            rows = self._cursor.fetchmany(self.batch_size)
+            if not rows:
+                return
+            if self.max_rows and produced + len(rows) > self.max_rows:
+                rows = rows[:self.max_rows - produced]
+                self.truncated = True
+            produced += len(rows)
+            if rows:
+                yield rows
+            if self.truncated:
+                return
+
+    def __iter__(self) -> Iterator[Tuple[Any, ...]]:
+        for batch in self.fetch_batches():
+            yield from batch
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._stop_interrupt is not None:
+            self._stop_interrupt()
+            self._stop_interrupt = None
+        if self._cursor is not None:
+            # Some engines (DuckDB) return the connection itself as the cursor, it goes back to the pool
+            if self._cursor is not self._conn:
+                self._cursor.close()
+            self._cursor = None
+        if self._conn is not None:
+            self.backend.pool.release(self._conn)
+            self._conn = None
+
+
+class SqlBackend(ABC):
+    """
+    Pooled, read-only SQL execution backend.
+
+    Queries run on a dedicated thread pool so async callers never block the event loop. Results are
+    limited to `max_rows` rows while fetching (the statement itself is never rewritten into a
+    subquery), and statements are interrupted after `timeout` seconds or when cancelled.
+    Subclasses provide the connection factory, the interrupt mechanism and the dialect hook.
+    """
+
+    name = "sql"
+
+    def __init__(self, pool_size: int, max_rows: int, timeout: float,
+                 identifier_rewrites: Optional[Dict[str, str]] = None):
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self.identifier_rewrites = DEFAULT_IDENTIFIER_REWRITES if identifier_rewrites is None else identifier_rewrites
+        self.pool = ConnectionPool(self.connect, pool_size)
+        self._thread_pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix=self.name)
+        # ResultCache of successful responses, set by get_sql_backend when result caching is enabled
+        self.result_cache = None
+
+    @abstractmethod
+    def connect(self):
+        """Open a new read-only connection usable from any thread."""
+
+    def install_interrupt(self, conn, should_interrupt: Callable[[], bool]) -> Callable[[], None]:
+        """
+        Interrupt the statement running on `conn` once `should_interrupt` returns True.
+
+        The default implementation polls from a watchdog thread and calls `conn.interrupt()`.
+        Returns a callable that uninstalls the interrupt.
+        """
+        stopped = threading.Event()
+
+        def watchdog():
+            while not stopped.wait(WATCHDOG_INTERVAL):
+                if should_interrupt():
+                    conn.interrupt()
+                    return
+
+        threading.Thread(target=watchdog, daemon=True).start()
+        return stopped.set
+
+    def data_version(self) -> Hashable:
+        """Token that changes whenever the data changes, cached results are only served for the same token."""
+        return None
+
+    def _file_version(self, path: str) -> Hashable:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def rewrite_sql(self, sql: str) -> str:
+        """Dialect hook: rewrite identifiers of the generated SQL for this engine."""
+        for old, new in self.identifier_rewrites.items():
+            sql = sql.replace(old, new)
+        return sql
+
+    def is_interrupted_error(self, ex: Exception) -> bool:
+        return "interrupt" in str(ex).lower()
+
+    def stream(self, sql: str, max_rows: Optional[int] = None, timeout: Optional[float] = None,
+               cancel_event: Optional[threading.Event] = None) -> RowStream:
+        """Return a streaming cursor over the rows of the query, to be used as a context manager."""
+        max_rows = self.max_rows if max_rows is None else max_rows
+        # The row limit is enforced while fetching, the statement is sent to the engine as generated
+        return RowStream(
+            self,
+            self.rewrite_sql(sql),
+            max_rows,
+            self.timeout if timeout is None else timeout,
+            cancel_event,
+        )
+
+    def fetch_columnar(self, sql: str, max_rows: Optional[int] = None, timeout: Optional[float] = None,
+                       cancel_event: Optional[threading.Event] = None) -> ColumnarResult:
+        """Fetch the result column by column, batch after batch, without building a dict per row."""
+        with self.stream(sql, max_rows, timeout, cancel_event) as rows:
+            return self._collect_columnar(rows)
+
+    @staticmethod
+    def _collect_columnar(rows: "RowStream") -> ColumnarResult:
+        # A name returned twice (e.g. a.id, b.id) keeps its first position and its last value, as with row dicts
+        positions = {column: i for i, column in enumerate(rows.columns)}
+        result = ColumnarResult(columns=list(positions), data={column: [] for column in positions})
+        for batch in rows.fetch_batches():
+            batch_columns = list(zip(*batch))
+            for column, i in positions.items():
+                result.data[column].extend(batch_columns[i])
+            result.num_rows += len(batch)
+        result.truncated = rows.truncated
+        return result
+
+    def _error_response(self, ex: Exception, timeout: Optional[float], cancel_event: Optional[threading.Event]) -> Dict[str, Any]:
+        print(f'{self.name}_exec_sql ERROR: {ex}')
+        if cancel_event is not None and cancel_event.is_set():
+            return {"error": "Query cancelled"}
+        if self.is_interrupted_error(ex):
+            return {"error": f"Query exceeded the {self.timeout if timeout is None else timeout}s deadline"}
+        return {"error": str(ex)}
+
+    def _lookup_result(self, sql: str, max_rows: Optional[int]) -> Tuple[Optional[str], Hashable, Optional[Dict[str, Any]]]:
+        """Look the statement up in the result cache, returning the cache key, the data version and the cached response."""
+        if self.result_cache is None:
+            return None, None, None
+        cache_key = self.result_cache.key(sql, self.max_rows if max_rows is None else max_rows)
+        # Read before executing: a change during the execution invalidates the stored response
+        version = self.data_version()
+        cached = self.result_cache.get(cache_key, version)
+        if cached is not None:
+            print(f"* Result cache hit in {self.name} ['{sql}']\n")
+        return cache_key, version, cached
+
+    def _store_result(self, cache_key: Optional[str], version: Hashable, response: Dict[str, Any]):
+        if cache_key is not None:
+            self.result_cache.put(cache_key, version, response)
+
+    def execute(self, sql: str, max_rows: Optional[int] = None, timeout: Optional[float] = None,
+                cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """Execute SQL query and return results in a standardized format, served from the result cache when possible."""
+        if sql is None:
+            return None
+        cache_key, version, cached = self._lookup_result(sql, max_rows)
+        if cached is not None:
+            return cached
+        response = self._execute(sql, max_rows, timeout, cancel_event)
+        self._store_result(cache_key, version, response)
+        return response
+
+    def _execute(self, sql: str, max_rows: Optional[int] = None, timeout: Optional[float] = None,
+                 cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        print(f"* Running SQL in {self.name} ['{sql}']...\n")
+        try:
+            columnar = self.fetch_columnar(sql, max_rows, timeout, cancel_event)
+        except Exception as ex:
+            return self._error_response(ex, timeout, cancel_event)
+        response = {"result": [dict(zip(columnar.columns, row)) for row in columnar.rows()]}
+        if columnar.truncated:
+            response["truncated"] = True
+        return response
+
+    async def _run_in_thread_pool(self, fn, sql: str, max_rows: Optional[int], timeout: Optional[float]):
+        timeout = self.timeout if timeout is None else timeout
+        cancel_event = threading.Event()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._thread_pool, fn, sql, max_rows, timeout, cancel_event)
+        try:
+            if timeout > 0:
+                return await asyncio.wait_for(future, timeout + QUEUE_GRACE)
+            return await future
+        except asyncio.TimeoutError:
+            cancel_event.set()
+            raise
+        except asyncio.CancelledError:
+            # Interrupt the statement still running on the worker thread
+            cancel_event.set()
+            raise
+
+    async def execute_async(self, sql: str, max_rows: Optional[int] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Execute the query on the backend's thread pool without blocking the event loop.
+
+        The query is interrupted if the calling task is cancelled, or if it has not completed
+        within the statement timeout (plus a short grace period for time spent waiting for a thread).
+        """
+        if sql is None:
+            return None
+        try:
+            # The result cache lookup reads the data version (file stats, a pragma), so it runs on the thread pool too
+            return await self._run_in_thread_pool(self.execute, sql, max_rows, timeout)
+        except asyncio.TimeoutError:
+            timeout = self.timeout if timeout is None else timeout
+            print(f"{self.name}_exec_sql ERROR: query exceeded the {timeout}s deadline")
+            return {"error": f"Query exceeded the {timeout}s deadline"}
+
+    async def fetch_columnar_async(self, sql: str, max_rows: Optional[int] = None, timeout: Optional[float] = None) -> ColumnarResult:
+        """Async version of fetch_columnar, raising on errors and timeouts."""
+        return await self._run_in_thread_pool(self.fetch_columnar, sql, max_rows, timeout)
+
+
+class SQLiteBackend(SqlBackend):
+    """SQLite backend using read-only URI connections and a progress handler for timeouts."""
+
+    name = "SQLite"
+
+    def __init__(self, db_file: str, pool_size: int, max_rows: int, timeout: float,
+                 identifier_rewrites: Optional[Dict[str, str]] = None):
+        self.db_file = db_file
+        self._version_conn: Optional[sqlite3.Connection] = None
+        self._version_lock = threading.Lock()
+        super().__init__(pool_size, max_rows, timeout, identifier_rewrites)
+
+    def connect(self) -> sqlite3.Connection:
+        # Read-only URI mode: generated SQL can never modify the database
+        uri = pathlib.Path(os.path.abspath(self.db_file)).as_uri() + "?mode=ro"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def data_version(self) -> Hashable:
+        """
+        Modification time and size of the database and WAL files, and `PRAGMA data_version`.
+
+        The pragma is read on a dedicated connection, on which it changes whenever another
+        connection (e.g. an ETL process) commits to the database.
+        """
+        with self._version_lock:
+            try:
+                if self._version_conn is None:
+                    self._version_conn = self.connect()
+                pragma_version = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+            except sqlite3.Error:
+                self._version_conn = None
+                pragma_version = None
+        return (self._file_version(self.db_file), self._file_version(self.db_file + "-wal"), pragma_version)
+
+    def install_interrupt(self, conn: sqlite3.Connection, should_interrupt: Callable[[], bool]) -> Callable[[], None]:
+        # A non-zero return value of the progress handler interrupts the running statement
+        conn.set_progress_handler(lambda: int(should_interrupt()), SQLITE_PROGRESS_INTERVAL)
+        return lambda: conn.set_progress_handler(None, 0)
+
+
+class DuckDBBackend(SqlBackend):
+    """In-process DuckDB backend, for analytical data too large for row-at-a-time processing."""
+
+    name = "DuckDB"
+
+    def __init__(self, db_file: str, pool_size: int, max_rows: int, timeout: float,
+                 identifier_rewrites: Optional[Dict[str, str]] = None):
+        try:
+            import duckdb
+        except ImportError:
+            raise ImportError("The DuckDB backend requires the 'duckdb' package: pip install duckdb")
+        self.db_file = db_file
+        self._root = duckdb.connect(db_file, read_only=True)
+        super().__init__(pool_size, max_rows, timeout, identifier_rewrites)
+
+    def connect(self):
+        # Cursors of one read-only connection can be used concurrently from different threads
+        return self._root.cursor()
+
+    def data_version(self) -> Hashable:
+        """Modification time and size of the database file, the database is opened read-only."""
+        return self._file_version(self.db_file)
+
+    def fetch_columnar(self, sql: str, max_rows: Optional[int] = None, timeout: Optional[float] = None,
+                       cancel_event: Optional[threading.Event] = None) -> ColumnarResult:
+        """Fetch the result in columnar form, through DuckDB's NumPy export when the rows are not limited."""
+        max_rows = self.max_rows if max_rows is None else max_rows
+        if max_rows:
+            # Limited results are fetched batch after batch, like the other engines
+            return super().fetch_columnar(sql, max_rows, timeout, cancel_event)
+        timeout = self.timeout if timeout is None else timeout
+        with RowStream(self, self.rewrite_sql(sql), max_rows, timeout, cancel_event) as rows:
+            columns = rows.columns
+            if len(set(columns)) != len(columns):
+                # The NumPy export keys the arrays by name and would keep the first of a duplicated name
+                return self._collect_columnar(rows)
+            arrays = rows._cursor.fetchnumpy()
+            data = {column: arrays[column].tolist() for column in columns}
+        num_rows = len(data[columns[0]]) if columns else 0
+        return ColumnarResult(columns=columns, data=data, num_rows=num_rows)
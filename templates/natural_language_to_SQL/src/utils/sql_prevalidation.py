@@ -0,0 +1,128 @@
+import sys
+sys.path.append("../../")
+
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.constants.data_model import global_database_model
+
+# Check generated SQL locally (unknown tables and columns, syntax) before the LLM review
+SQL_PRECHECK_ENABLED = os.environ.get("SQL_PRECHECK_ENABLED", "true").lower() == "true"
+
+# Number of schema connections kept open, one per set of selected tables
+SQL_PRECHECK_MAX_SCHEMAS = int(os.environ.get("SQL_PRECHECK_MAX_SCHEMAS", "64"))
+
+# Leading "-- line" and "/* block */" comments, skipped before looking at the statement keyword
+_LEADING_COMMENTS = re.compile(r"^(?:\s+|--[^\n]*(?:\n|$)|/\*.*?\*/)*", re.DOTALL)
+_READ_STATEMENT = re.compile(r"(select|with)\b", re.IGNORECASE)
+# Errors that do not depend on the SQL dialect
+_SCHEMA_ERRORS = ("no such table", "no such column")
+
+
+class SqlPrevalidator:
+    """
+    Deterministic SQL checks against the database model, without touching the database.
+
+    The statement is compiled with `EXPLAIN` on an empty in-memory SQLite schema that only
+    contains the tables selected for the query, so unknown tables, unknown columns and syntax
+    errors are caught in microseconds. With `strict_dialect=False` (backends that do not speak
+    SQLite's dialect) only unknown tables and columns are reported. The schema connections are
+    kept in a bounded LRU, the least recently used one is closed when it is evicted, and `close`
+    closes them all.
+    """
+
+    def __init__(self, database_model: List[Dict], rewrite_sql: Optional[Callable[[str], str]] = None,
+                 strict_dialect: bool = True, max_schemas: int = SQL_PRECHECK_MAX_SCHEMAS):
+        self.rewrite_sql = rewrite_sql or (lambda sql: sql)
+        self.strict_dialect = strict_dialect
+        self._table_ddl: Dict[str, str] = {}
+        for table in database_model:
+            columns = ", ".join(
+                f'"{self.rewrite_sql(column["ColumnName"])}" {column.get("DataType", "")}'.rstrip()
+                for column in table.get("Columns", [])
+            )
+            self._table_ddl[table["TableName"]] = f'CREATE TABLE "{table["TableName"]}" ({columns})'
+        # One schema connection per set of selected tables, the same selections come back across retries
+        self.max_schemas = max_schemas
+        self._connections: "OrderedDict[Tuple[str, ...], sqlite3.Connection]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _create_schema_connection(self, table_names: Tuple[str, ...]) -> sqlite3.Connection:
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        if hasattr(sqlite3, "SQLITE_DBCONFIG_DQS_DML"):
+            # Don't let SQLite read unknown "double quoted" identifiers as string literals (Python 3.12+)
+            conn.setconfig(sqlite3.SQLITE_DBCONFIG_DQS_DML, False)
+            conn.setconfig(sqlite3.SQLITE_DBCONFIG_DQS_DDL, False)
+        for table_name in table_names:
+            conn.execute(self._table_ddl[table_name])
+        return conn
+
+    def _schema_connection(self, table_names: Tuple[str, ...]) -> sqlite3.Connection:
+        # Called with the lock held, so that no check is running on a connection when it is closed
+        conn = self._connections.get(table_names)
+        if conn is not None:
+            self._connections.move_to_end(table_names)
+            return conn
+        conn = self._connections[table_names] = self._create_schema_connection(table_names)
+        while len(self._connections) > max(1, self.max_schemas):
+            _, evicted = self._connections.popitem(last=False)
+            evicted.close()
+        return conn
+    def close(self):
+        """Close the schema connections, they are created again on demand."""
+        with self._lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+
+    def check(self, sql: str, table_names: Iterable[str]) -> List[str]:
+        """Return the issues found in the statement, an empty list when it compiles against the selected tables."""
+        if not sql or not sql.strip():
+            return ["The SQL statement is empty."]
+        if not _READ_STATEMENT.match(sql, _LEADING_COMMENTS.match(sql).end()):
+            return ["Only read-only SELECT (or WITH ... SELECT) statements are allowed."]
+
+        selected = tuple(sorted({name for name in table_names if name in self._table_ddl}))
+        try:
+            with self._lock:
+                self._schema_connection(selected).execute("EXPLAIN " + self.rewrite_sql(sql.strip().rstrip(";")))
+        except (sqlite3.Error, sqlite3.Warning) as e:
+            error = str(e)
+            if error.startswith("no such table"):
+                table_name = error.split(":", 1)[-1].strip()
+                if table_name in self._table_ddl:
+                    return [f"{error} (the table exists but was not selected for this query, selected tables: {', '.join(selected)})"]
+                return [f"{error} (selected tables: {', '.join(selected)})"]
+            if self.strict_dialect or error.startswith(_SCHEMA_ERRORS):
+                return [error]
+        return []
+
+
+_sql_prevalidator: Optional[SqlPrevalidator] = None
+
+
+def get_sql_prevalidator() -> Optional[SqlPrevalidator]:
+    """Get the prevalidator matching the configured SQL backend, None when the precheck is disabled."""
+    global _sql_prevalidator
+    if not SQL_PRECHECK_ENABLED:
+        return None
+    if _sql_prevalidator is None:
+        from src.utils.db_helpers import get_sql_backend
+        from src.utils.sql_backends import SQLiteBackend
+        backend = get_sql_backend()
+        _sql_prevalidator = SqlPrevalidator(
+            global_database_model,
+            rewrite_sql=backend.rewrite_sql,
+            strict_dialect=isinstance(backend, SQLiteBackend)
+        )
+    return _sql_prevalidator
+
+
+def close_sql_prevalidator():
+    """Close the schema connections of the prevalidator, if one was created."""
+    if _sql_prevalidator is not None:
+        _sql_prevalidator.close()
@@ -0,0 +1,77 @@
+import sys
+sys.path.append("../../")
+
+import os
+import asyncio
+import hashlib
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Number of SQL candidates generated per round, 1 disables candidate voting
+SQL_CANDIDATES = int(os.environ.get("SQL_CANDIDATES", "1"))
+# Maximum number of candidate generations running at once for a run
+SQL_CANDIDATE_CONCURRENCY = int(os.environ.get("SQL_CANDIDATE_CONCURRENCY", "3"))
+# Rows fetched and statement timeout in seconds when executing the candidates for the vote
+SQL_CANDIDATE_MAX_ROWS = int(os.environ.get("SQL_CANDIDATE_MAX_ROWS", "200"))
+SQL_CANDIDATE_TIMEOUT = float(os.environ.get("SQL_CANDIDATE_TIMEOUT", "5"))
+
+
+def _normalize_value(value: Any) -> str:
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return repr(value)
+
+
+def result_fingerprint(response: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Fingerprint an execution response by its rows, None when the execution failed.
+
+    Row order, column names and column order are ignored, so equivalent statements that alias or
+    order their columns differently land in the same cluster.
+    """
+    if not isinstance(response, dict) or "error" in response:
+        return None
+    rows = sorted(
+        "\x1f".join(sorted(_normalize_value(value) for value in row.values()))
+        for row in response.get("result", [])
+    )
+    digest = hashlib.sha1("\x1e".join(rows).encode("utf-8"))
+    digest.update(b"truncated" if response.get("truncated") else b"")
+    return digest.hexdigest()
+
+
+@dataclass
+class CandidateVote:
+    """Outcome of the vote: the index of the winning candidate and the size of each cluster."""
+    winner: int
+    votes: int
+    clusters: Dict[str, List[int]]
+    failed: List[int]
+
+
+async def vote_candidates(sql_statements: List[Optional[str]],
+                          execute: Callable[[str], Awaitable[Dict[str, Any]]]) -> CandidateVote:
+    """
+    Execute the candidate statements concurrently and pick the one of the largest result cluster.
+
+    Candidates that are None are skipped, and ties go to the earliest candidate. When no
+    candidate executes successfully, the first one wins with no votes.
+    """
+    indexes = [i for i, sql in enumerate(sql_statements) if sql]
+    responses = await asyncio.gather(*(execute(sql_statements[i]) for i in indexes), return_exceptions=True)
+
+    clusters: Dict[str, List[int]] = defaultdict(list)
+    failed = []
+    for i, response in zip(indexes, responses):
+        fingerprint = None if isinstance(response, BaseException) else result_fingerprint(response)
+        if fingerprint is None:
+            failed.append(i)
+        else:
+            clusters[fingerprint].append(i)
+
+    if not clusters:
+        return CandidateVote(winner=indexes[0] if indexes else 0, votes=0, clusters={}, failed=failed)
+    # Largest cluster first, then the cluster holding the earliest candidate
+    best = max(clusters.values(), key=lambda members: (len(members), -members[0]))
+    return CandidateVote(winner=best[0], votes=len(best), clusters=dict(clusters), failed=failed)
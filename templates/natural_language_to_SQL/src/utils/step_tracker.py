@@ -1,41 +1,104 @@
 import sys
+import os
+import time
+import uuid
 from typing import Dict, List, Any
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
 from datetime import datetime
 import json
-import asyncio
 
 sys.path.append("../../")
 
+from src.utils.run_context import peek_run_context
+from src.utils.usage_metrics import UsageStats
+from src.utils.transition_store import TransitionRecord, get_transition_store, serialize_payload, to_datetime
+from src.utils.tracing import get_step_tracer
+
 console = Console()
 
+# Console rendering of the steps: "full" (with input/output panels), "compact" (one line per event) or "off"
+STEP_TRACKER_CONSOLE = os.environ.get("STEP_TRACKER_CONSOLE", "full").lower()
+
+
+class ConsoleStepListener:
+    """
+    Tracker listener rendering steps on the console.
+
+    Rendering is the most expensive part of tracking (pretty JSON and Rich panels), so it runs as
+    an optional listener instead of inside the tracker. `compact` prints one line per event.
+    """
+
+    def __init__(self, compact: bool = False):
+        self.compact = compact
+
+    def __call__(self, event: str, step_name: str, *args):
+        if event == "step_start":
+            data = args[0] if args else None
+            console.print(f"[bold blue]STEP START: {step_name}[/bold blue] at {datetime.now().strftime('%H:%M:%S.%f')[:-3]}")
+            if data and not self.compact:
+                console.print(Panel(self._format_pretty(data), title="Input Data", border_style="blue"))
+        elif event == "step_end":
+            next_step, next_event, output_data, duration = args
+            console.print(f"[bold green]STEP END: {step_name}[/bold green] (Duration: {duration:.3f}s)")
+            if next_step:
+                console.print(f"[bold yellow]TRANSITION: {step_name} -> {next_step} via {next_event}[/bold yellow]")
+            if output_data and not self.compact:
+                console.print(Panel(self._format_pretty(output_data), title="Output Data", border_style="green"))
+
+    @staticmethod
+    def _format_pretty(data: Any) -> str:
+        """Format data for pretty console printing."""
+        try:
+            # For objects with __dict__, show as pretty JSON
+            if hasattr(data, '__dict__'):
+                return json.dumps(data.__dict__, indent=2, default=str)
+            # For dict objects, pretty print
+            elif isinstance(data, dict):
+                return json.dumps(data, indent=2, default=str)
+            # For other objects, use str representation
+            return str(data)
+        except Exception:
+            return f"<Object of type {type(data).__name__}>"
+
+
 class StepTracker:
     """
-    A singleton class that tracks step transitions in the SQL process.
+    A class that tracks step transitions in the SQL process.
     This allows monitoring the flow of data and transitions between steps.
+
+    A process-wide default tracker is returned by `get_tracker()`. Concurrent runs get their
+    own tracker, tagged with the run ID, which `get_tracker()` returns inside that run.
+
+    Completed steps are kept as compact `TransitionRecord` tuples holding the raw payloads, in a
+    bounded ring of the process-wide TransitionStore (one partition per run, newest first).
+    Payloads are only serialized when a WebSocket client listens or the history is requested,
+    and console rendering is an optional listener (`STEP_TRACKER_CONSOLE`).
+
+    With `OTEL_TRACING_ENABLED` (or an explicit `tracer`), every step is also emitted as an
+    OpenTelemetry span, child of the span of the run opened by `start_run_span`.
     """
-    _instance = None
     _websocket_manager = None  # Will be set by server.py
-
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(StepTracker, cls).__new__(cls)
-            cls._instance._initialized = False
-        return cls._instance
     
-    def __init__(self):
-        if self._initialized:
-            return
-        
-        self._initialized = True
-        self.transitions = []
+    def __init__(self, run_id: str = None, console_output: str = None, tracer=None):
+        self.run_id = run_id
+        self.transitions = self._open_partition()
         self.current_step = None
         self.process = None
         self.start_time = None
+        self.budget = None
+        # LLM usage aggregated per step name
+        self.llm_usage: Dict[str, UsageStats] = {}
         self._listener_callbacks = []
-        console.print("[bold purple]Step Tracker initialized[/bold purple]")
+        console_output = (console_output or STEP_TRACKER_CONSOLE).lower()
+        if console_output != "off":
+            self.add_listener(ConsoleStepListener(compact=console_output == "compact"))
+        self._tracer = tracer or get_step_tracer()
+        self._run_span = None
+        self._run_span_context = None
+        if run_id is None:
+            console.print("[bold purple]Step Tracker initialized[/bold purple]")
     
     @classmethod
     def set_websocket_manager(cls, manager):
@@ -43,12 +106,17 @@ class StepTracker:
         cls._websocket_manager = manager
         console.print("[bold cyan]WebSocket manager connected to StepTracker[/bold cyan]")
     
+    def _open_partition(self):
+        """Start a new partition of the transition store, the default tracker opens one per reset."""
+        return get_transition_store().open(self.run_id or f"default-{uuid.uuid4().hex}")
+    
     def reset(self):
         """Reset the tracker state."""
-        self.transitions = []
+        self.transitions = self._open_partition()
         self.current_step = None
         self.process = None
         self.start_time = datetime.now()
+        self.llm_usage = {}
         console.print("[bold purple]Step Tracker reset[/bold purple]")
         
         # Broadcast reset event if WebSocket manager is available
@@ -70,54 +138,137 @@ class StepTracker:
         console.print(f"[bold green]Process tracking started at {self.start_time}[/bold green]")
         return self
     
+    def set_budget(self, budget):
+        """Set the RunBudget of the tracked run, its usage is reported with each transition."""
+        self.budget = budget
+        return self
+    
+    def get_budget_stats(self) -> Dict:
+        """Return the budget usage of the tracked run."""
+        return self.budget.to_dict() if self.budget is not None else {}
+    
+    def record_llm_usage(self, usage):
+        """Add the usage of an LLM call to its step, and to the current step invocation."""
+        stats = self.llm_usage.get(usage.step_name)
+        if stats is None:
+            stats = self.llm_usage[usage.step_name] = UsageStats()
+        stats.add(usage)
+        if self.current_step is not None and self.current_step["step_name"] == usage.step_name:
+            self.current_step.setdefault("llm_usage", UsageStats()).add(usage)
+        return self
+    
+    def get_usage_metrics(self) -> Dict:
+        """Return the LLM usage per step and in total."""
+        total = UsageStats()
+        for stats in self.llm_usage.values():
+            total.merge(stats)
+        return {
+            "steps": {step_name: stats.to_dict() for step_name, stats in self.llm_usage.items()},
+            "total": total.to_dict(),
+        }
+    
+    def _has_subscribers(self) -> bool:
+        """Whether a WebSocket client would receive the events of this tracker."""
+        return self._websocket_manager is not None and self._websocket_manager.has_subscribers(self.run_id)
+    
     def _broadcast_event_async(self, event_data):
         """Broadcast an event to all connected WebSocket clients asynchronously."""
         if self._websocket_manager:
+            if self.run_id is not None:
+                event_data["run_id"] = self.run_id
             try:
-                # Create a task without waiting for it
-                loop = asyncio.get_event_loop()
-                loop.create_task(self._websocket_manager.broadcast(event_data))
-                # print(">>>>>>>>>>>> Broadcasting event function:", event_data)
+                # Queued per client by the broadcaster, never awaited on the step's path
+                self._websocket_manager.publish(event_data)
             except Exception as e:
                 console.print(f"[bold red]Error broadcasting event: {e}[/bold red]")
     
+    def _notify_listeners(self, *args):
+        for callback in self._listener_callbacks:
+            if callable(callback):
+                try:
+                    callback(*args)
+                except Exception as e:
+                    console.print(f"[bold red]Error notifying listener: {e}[/bold red]")
+    
+    def start_run_span(self, user_query: str = None):
+        """Open the span of a run, parent of the spans of its steps. No-op when tracing is disabled."""
+        if self._tracer is None:
+            return self
+        from opentelemetry import trace
+        run_context = peek_run_context()
+        self._run_span = self._tracer.start_span("nl2sql.run")
+        self._run_span.set_attribute("nl2sql.run_id", run_context.run_id if run_context else (self.run_id or ""))
+        if user_query:
+            self._run_span.set_attribute("nl2sql.user_query", user_query)
+        # Kept after the run span ends, so the final answer step still links to its run
+        self._run_span_context = trace.set_span_in_context(self._run_span)
+        return self
+    
+    def end_run_span(self, error: Exception = None):
+        """Close the span of the run with its budget usage."""
+        span, self._run_span = self._run_span, None
+        if span is None:
+            return self
+        from opentelemetry.trace import Status, StatusCode
+        stats = self.get_budget_stats()
+        for key in ("llm_calls", "prompt_tokens", "completion_tokens", "iterations", "distinct_sql"):
+            if key in stats:
+                span.set_attribute(f"nl2sql.budget.{key}", stats[key])
+        if error is not None:
+            span.record_exception(error)
+            span.set_status(Status(StatusCode.ERROR, str(error)))
+        elif stats.get("gave_up_reason"):
+            span.set_attribute("nl2sql.gave_up_reason", stats["gave_up_reason"])
+            span.set_status(Status(StatusCode.ERROR, stats["gave_up_reason"]))
+        span.end()
+        return self
+    
+    def _start_step_span(self, step_name: str):
+        span = self._tracer.start_span(step_name, context=self._run_span_context)
+        span.set_attribute("nl2sql.step", step_name)
+        if self.run_id is not None:
+            span.set_attribute("nl2sql.run_id", self.run_id)
+        return span
+    
+    def _end_step_span(self, span, record: TransitionRecord):
+        span.set_attribute("nl2sql.next_step", record.next_step or "")
+        span.set_attribute("nl2sql.event", str(getattr(record.next_event, "value", record.next_event) or ""))
+        run_context = peek_run_context()
+        if run_context is not None:
+            span.set_attribute("nl2sql.retries.validation", run_context.validation_retries)
+            span.set_attribute("nl2sql.retries.business_rules", run_context.business_rules_retries)
+            span.set_attribute("nl2sql.retries.precheck", run_context.precheck_retries)
+            span.set_attribute("nl2sql.iteration", run_context.budget.iterations)
+        if record.llm_usage:
+            for key in ("calls", "prompt_tokens", "cached_prompt_tokens", "completion_tokens", "reasoning_tokens", "cost"):
+                span.set_attribute(f"nl2sql.llm.{key}", record.llm_usage[key])
+        span.end()
+    
     def start_step(self, step_name: str, data: Any = None):
         """Signal the start of a step with optional data arguments."""
-        timestamp = datetime.now()
+        started = time.monotonic()
+        if self.current_step is not None and self.current_step.get("span") is not None:
+            # The previous step was never ended
+            self.current_step["span"].end()
         self.current_step = {
             "step_name": step_name,
-            "start_time": timestamp,
-            "input_data": self._format_data(data),
-            "status": "started"
+            "started": started,
+            "input_data": data,
+            "span": self._start_step_span(step_name) if self._tracer is not None else None,
         }
         
-        console.print(f"[bold blue]STEP START: {step_name}[/bold blue] at {timestamp.strftime('%H:%M:%S.%f')[:-3]}")
-        if data:
-            console.print(Panel(self._format_data_pretty(data), title="Input Data", border_style="blue"))
-        
-        # Broadcast step start event to WebSocket clients
-        step_id = step_name.replace(" ", "_").lower()
-        self._broadcast_event_async({
-            "type": "step_start",
-            "step_id": step_id,
-            "step_name": step_name,
-            "timestamp": timestamp.isoformat(),
-            "input_data": self._format_data(data)
-        })
-        # print(">>>>>>>>>>>> Broadcasting event start:", {"type": "step_start", 
-        #                                            "step_id": step_id, 
-        #                                            "step_name": step_name, 
-        #                                            "timestamp": timestamp.isoformat(), 
-        #                                            "input_data": self._format_data(data)})
+        # Broadcast step start event to WebSocket clients, the payload is only serialized for listeners
+        if self._has_subscribers():
+            self._broadcast_event_async({
+                "type": "step_start",
+                "step_id": step_name.replace(" ", "_").lower(),
+                "step_name": step_name,
+                "timestamp": to_datetime(started).isoformat(),
+                "input_data": serialize_payload(data)
+            })
         
         # Notify all listeners
-        for callback in self._listener_callbacks:
-            if callable(callback):
-                try:
-                    callback("step_start", step_name, data)
-                except Exception as e:
-                    console.print(f"[bold red]Error notifying listener: {e}[/bold red]")
-        
+        self._notify_listeners("step_start", step_name, data)
         return self
     
     async def start_step_async(self, step_name: str, data: Any = None):
@@ -130,70 +281,41 @@ class StepTracker:
         if not self.current_step:
             console.print("[bold red]Error: Cannot end step, no step currently active[/bold red]")
             return self
-            
-        timestamp = datetime.now()
-        duration = timestamp - self.current_step["start_time"]
-        
-        transition = {
-            **self.current_step,
-            "end_time": timestamp,
-            "duration": duration.total_seconds(),
-            "next_step": next_step,
-            "next_event": next_event,
-            "output_data": self._format_data(output_data),
-            "status": "completed"
-        }
         
-        # Insert at the beginning of the list instead of appending to the end
-        self.transitions.insert(0, transition)
-        
-        console.print(f"[bold green]STEP END: {self.current_step['step_name']}[/bold green] " +
-                    f"(Duration: {duration.total_seconds():.3f}s)")
-        
-        if next_step:
-            console.print(f"[bold yellow]TRANSITION: {self.current_step['step_name']} -> {next_step} via {next_event}[/bold yellow]")
+        step_usage = self.current_step.get("llm_usage")
+        record = TransitionRecord(
+            self.current_step["step_name"],
+            self.current_step["started"],
+            time.monotonic(),
+            self.current_step["input_data"],
+            output_data,
+            next_step,
+            next_event,
+            step_usage.to_dict() if step_usage else None,
+        )
+        self.transitions.append(record)
+        if self.current_step["span"] is not None:
+            self._end_step_span(self.current_step["span"], record)
+        self.current_step = None
         
-        if output_data:
-            console.print(Panel(self._format_data_pretty(output_data), title="Output Data", border_style="green"))
-            
         # Broadcast step transition event to WebSocket clients
-        current_step_id = self.current_step["step_name"].replace(" ", "_").lower()
-        next_step_id = next_step.replace(" ", "_").lower() if next_step else None
+        if self._has_subscribers():
+            self._broadcast_event_async({
+                "type": "step_transition",
+                "from_step_id": record.step_name.replace(" ", "_").lower(),
+                "to_step_id": next_step.replace(" ", "_").lower() if next_step else None,
+                "from_step": record.step_name,
+                "to_step": next_step,
+                "event": next_event,
+                "timestamp": to_datetime(record.ended).isoformat(),
+                "duration": record.duration,
+                "output_data": serialize_payload(output_data),
+                "llm_usage": record.llm_usage,
+                "budget": self.get_budget_stats()
+            })
         
-        self._broadcast_event_async({
-            "type": "step_transition",
-            "from_step_id": current_step_id,
-            "to_step_id": next_step_id,
-            "from_step": self.current_step["step_name"],
-            "to_step": next_step,
-            "event": next_event,
-            "timestamp": timestamp.isoformat(),
-            "duration": duration.total_seconds(),
-            "output_data": self._format_data(output_data)
-        })
-
-        # print(">>>>>>>>>>>> Broadcasting event end:", {
-        #     "type": "step_transition",
-        #     "from_step_id": current_step_id,
-        #     "to_step_id": next_step_id,
-        #     "from_step": self.current_step["step_name"],
-        #     "to_step": next_step,
-        #     "event": next_event,
-        #     "timestamp": timestamp.isoformat(), 
-        #     "duration": duration.total_seconds(),
-        #     "output_data": self._format_data(output_data)
-        # })
-
-            
         # Notify all listeners
-        for callback in self._listener_callbacks:
-            if callable(callback):
-                try:
-                    callback("step_end", self.current_step['step_name'], next_step, next_event, output_data, duration.total_seconds())
-                except Exception as e:
-                    console.print(f"[bold red]Error notifying listener: {e}[/bold red]")
-            
-        self.current_step = None
+        self._notify_listeners("step_end", record.step_name, next_step, next_event, output_data, record.duration)
         return self
     
     async def end_step_async(self, next_step: str = None, next_event: str = None, output_data: Any = None):
@@ -201,40 +323,6 @@ class StepTracker:
         self.end_step(next_step, next_event, output_data)
         return self
     
-    def _format_data(self, data):
-        """Format data to be serializable in JSON."""
-        if data is None:
-            return None
-        
-        try:
-            # Try to convert the data to a basic type for JSON serialization
-            if hasattr(data, "to_dict"):
-                return data.to_dict()
-            elif hasattr(data, "__dict__"):
-                return data.__dict__
-            else:
-                # Try to convert to string if all else fails
-                return str(data)
-        except Exception:
-            return str(data)
-    
-    def _format_data_pretty(self, data: Any) -> str:
-        """Format data for pretty console printing."""
-        if data is None:
-            return "None"
-            
-        try:
-            # For objects with __dict__, show as pretty JSON
-            if hasattr(data, '__dict__'):
-                return json.dumps(data.__dict__, indent=2, default=str)
-            # For dict objects, pretty print
-            elif isinstance(data, dict):
-                return json.dumps(data, indent=2, default=str)
-            # For other objects, use str representation
-            return str(data)
-        except:
-            return f"<Object of type {type(data).__name__}>"
-    
     def print_transition_history(self):
         """Print the complete transition history of the process."""
         if not self.transitions:
@@ -250,14 +338,14 @@ class StepTracker:
         table.add_column("Next Step")
         table.add_column("Event")
         
-        # Transitions are already in reverse order (newest first)
+        # Transitions iterate newest first
         for t in self.transitions:
             table.add_row(
-                t["step_name"],
-                t["status"],
-                f"{t['duration']:.3f}",
-                t["next_step"] or "End",
-                t["next_event"] or "-"
+                t.step_name,
+                "completed",
+                f"{t.duration:.3f}",
+                t.next_step or "End",
+                t.next_event or "-"
             )
         
         console.print(table)
@@ -266,34 +354,56 @@ class StepTracker:
         if self.start_time:
             total_duration = (datetime.now() - self.start_time).total_seconds()
             console.print(f"[bold green]Total process duration: {total_duration:.3f}s[/bold green]")
+        
+        if self.llm_usage:
+            usage_table = Table(show_header=True, header_style="bold", title="LLM Usage per Step")
+            usage_table.add_column("Step", style="dim")
+            usage_table.add_column("Calls")
+            usage_table.add_column("Prompt Tokens")
+            usage_table.add_column("Completion Tokens")
+            usage_table.add_column("Reasoning Tokens")
+            usage_table.add_column("Latency (s)")
+            usage_table.add_column("Cost ($)")
+            for step_name, stats in self.llm_usage.items():
+                usage_table.add_row(
+                    step_name,
+                    str(stats.calls),
+                    str(stats.prompt_tokens),
+                    str(stats.completion_tokens),
+                    str(stats.reasoning_tokens),
+                    f"{stats.latency_total:.3f}",
+                    f"{stats.cost:.4f}"
+                )
+            console.print(usage_table)
+        
+        if self.budget is not None:
+            stats = self.get_budget_stats()
+            console.print(f"[bold green]Budget: {stats['llm_calls']} LLM calls, {stats['total_tokens']} tokens, "
+                          f"{stats['iterations']} SQL iterations[/bold green]")
+            if stats["gave_up_reason"]:
+                console.print(f"[bold red]Run gave up: {stats['gave_up_reason']}[/bold red]")
     
     def get_transition_history(self) -> List[Dict]:
-        """Return the transition history as a list of dictionaries."""
-        return self.transitions
+        """Return the transition history as a list of dictionaries, newest first, with the raw payloads."""
+        return [
+            {
+                "step_name": record.step_name,
+                "start_time": to_datetime(record.started),
+                "end_time": to_datetime(record.ended),
+                "duration": record.duration,
+                "next_step": record.next_step,
+                "next_event": record.next_event,
+                "input_data": record.input_data,
+                "output_data": record.output_data,
+                "llm_usage": record.llm_usage,
+                "status": "completed"
+            }
+            for record in self.transitions
+        ]
     
     def get_transition_history_serializable(self):
-        """Return a serializable version of the transition history."""
-        serializable_transitions = []
-        for transition in self.transitions:
-            serializable_transition = {
-                "step_name": transition.get("step_name"),
-                "next_step": transition.get("next_step"),
-                "next_event": transition.get("next_event"),
-                "timestamp": transition.get("start_time").isoformat() if transition.get("start_time") else None,
-                "duration": transition.get("duration"),
-                "status": transition.get("status", "completed"),
-            }
-            
-            # Handle input and output data serialization
-            if "input_data" in transition:
-                serializable_transition["input_data"] = self._format_data(transition["input_data"])
-            
-            if "output_data" in transition:
-                serializable_transition["output_data"] = self._format_data(transition["output_data"])
-                
-            serializable_transitions.append(serializable_transition)
-        
-        return serializable_transitions
+        """Return a serializable version of the transition history, newest first."""
+        return [record.to_dict() for record in self.transitions]
     
     async def broadcast_transition_history(self):
         """Broadcast the full transition history to all connected WebSocket clients."""
@@ -302,10 +412,21 @@ class StepTracker:
                 "type": "transition_history",
                 "transitions": self.get_transition_history_serializable()
             }
+            if self.run_id is not None:
+                message["run_id"] = self.run_id
             await self._websocket_manager.broadcast(message)
 
 
-# Factory function to get the singleton instance
+_default_tracker = None
+
+
+# Factory function to get the tracker for the current run
 def get_tracker() -> StepTracker:
-    """Get the StepTracker singleton instance."""
-    return StepTracker()
\ No newline at end of file
+    """Get the StepTracker of the current run, or the process-wide default instance."""
+    global _default_tracker
+    run_context = peek_run_context()
+    if run_context is not None and run_context.tracker is not None:
+        return run_context.tracker
+    if _default_tracker is None:
+        _default_tracker = StepTracker()
+    return _default_tracker
\ No newline at end of file
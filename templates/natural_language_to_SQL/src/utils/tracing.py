@@ -0,0 +1,80 @@
+import sys
+sys.path.append("../../")
+
+import os
+from typing import Optional
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    # Tracing is optional, the step tracker runs without spans when opentelemetry-api is missing
+    trace = None
+
+# Emit one OpenTelemetry span per step, children of a span per run
+OTEL_TRACING_ENABLED = os.environ.get("OTEL_TRACING_ENABLED", "false").lower() == "true"
+OTEL_SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "nl2sql")
+# Exporters configured by set_up_tracing(), an application can also install its own tracer provider
+APPLICATIONINSIGHTS_CONNECTION_STRING = os.environ.get("APPLICATIONINSIGHTS_CONNECTION_STRING", "")
+OTEL_EXPORTER_OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+
+TRACER_NAME = "nl2sql.step_tracker"
+
+
+def set_up_tracing(exporter=None, batch: bool = True):
+    """
+    Install a global tracer provider exporting the step spans.
+
+    Pass any span exporter (e.g. an InMemorySpanExporter with `batch=False` in tests). Without one,
+    Azure Monitor is used when APPLICATIONINSIGHTS_CONNECTION_STRING is set and OTLP when
+    OTEL_EXPORTER_OTLP_ENDPOINT is set, both exporters being optional packages.
+    Returns None when opentelemetry-sdk is not installed.
+    """
+    try:
+        from opentelemetry.sdk.resources import Resource, SERVICE_NAME
+    except ImportError:
+        print("opentelemetry-sdk is not installed, OpenTelemetry tracing disabled")
+        return None
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+
+    if exporter is None and APPLICATIONINSIGHTS_CONNECTION_STRING:
+        try:
+            from azure.monitor.opentelemetry.exporter import AzureMonitorTraceExporter
+            exporter = AzureMonitorTraceExporter(connection_string=APPLICATIONINSIGHTS_CONNECTION_STRING)
+        except ImportError:
+            print("azure-monitor-opentelemetry-exporter is not installed, Azure Monitor tracing disabled")
+    if exporter is None and OTEL_EXPORTER_OTLP_ENDPOINT:
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter()
+        except ImportError:
+            print("opentelemetry-exporter-otlp is not installed, OTLP tracing disabled")
+
+    tracer_provider = TracerProvider(resource=Resource.create({SERVICE_NAME: OTEL_SERVICE_NAME}))
+    if exporter is not None:
+        processor = BatchSpanProcessor(exporter) if batch else SimpleSpanProcessor(exporter)
+        tracer_provider.add_span_processor(processor)
+    trace.set_tracer_provider(tracer_provider)
+    return tracer_provider
+
+
+def exporter_configured() -> bool:
+    """Whether set_up_tracing() has an exporter to install from the environment."""
+    return OTEL_TRACING_ENABLED and trace is not None and bool(APPLICATIONINSIGHTS_CONNECTION_STRING or OTEL_EXPORTER_OTLP_ENDPOINT)
+
+
+def shutdown_tracing():
+    """Flush the pending spans of the global tracer provider."""
+    if trace is None:
+        return
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+def get_step_tracer() -> Optional["trace.Tracer"]:
+    """Get the tracer of the step spans, None when tracing is disabled or OpenTelemetry is not installed."""
+    if not OTEL_TRACING_ENABLED or trace is None:
+        return None
+    # Resolved through the global provider, so spans go to whichever exporter the application installed
+    return trace.get_tracer(TRACER_NAME)
@@ -0,0 +1,230 @@
+import sys
+sys.path.append("../../")
+
+import os
+import json
+import time
+import queue
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# Maximum number of transitions kept in memory per run, older transitions are spilled
+STEP_TRACKER_CAPACITY = int(os.environ.get("STEP_TRACKER_CAPACITY", "500"))
+# Maximum number of runs kept in memory, the transitions of older runs are spilled
+STEP_TRACKER_MAX_RUNS = int(os.environ.get("STEP_TRACKER_MAX_RUNS", "100"))
+# Append-only JSONL file receiving the spilled transitions, empty to discard them
+STEP_TRACKER_SPILL_FILE = os.environ.get("STEP_TRACKER_SPILL_FILE", "")
+
+# Anchor to convert monotonic timestamps to wall-clock time
+_WALL_ANCHOR = (time.time(), time.monotonic())
+
+
+def to_datetime(monotonic_time: float) -> datetime:
+    """Convert a time.monotonic() timestamp to a wall-clock datetime."""
+    wall, mono = _WALL_ANCHOR
+    return datetime.fromtimestamp(wall + monotonic_time - mono)
+
+
+def serialize_payload(data: Any):
+    """Convert a step payload to JSON-friendly data, only called when the payload is actually needed."""
+    if data is None or isinstance(data, (str, int, float, bool, list, dict)):
+        return data
+    try:
+        if hasattr(data, "model_dump"):
+            return data.model_dump()
+        if hasattr(data, "to_dict"):
+            return data.to_dict()
+        if hasattr(data, "__dict__"):
+            return dict(data.__dict__)
+        return str(data)
+    except Exception:
+        return str(data)
+
+
+class TransitionRecord(NamedTuple):
+    """A completed step, with monotonic timestamps and the raw (unserialized) payloads."""
+    step_name: str
+    started: float
+    ended: float
+    input_data: Any
+    output_data: Any
+    next_step: Optional[str]
+    next_event: Optional[str]
+    llm_usage: Optional[Dict]
+
+    @property
+    def duration(self) -> float:
+        return self.ended - self.started
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the transition with serialized payloads."""
+        return {
+            "step_name": self.step_name,
+            "next_step": self.next_step,
+            "next_event": self.next_event,
+            "timestamp": to_datetime(self.started).isoformat(),
+            "duration": self.duration,
+            "status": "completed",
+            "llm_usage": self.llm_usage,
+            "input_data": serialize_payload(self.input_data),
+            "output_data": serialize_payload(self.output_data),
+        }
+
+
+class TransitionRing:
+    """Fixed-capacity ring buffer of the transitions of one run, iterated newest first."""
+
+    def __init__(self, run_id: str, store: "TransitionStore", capacity: int):
+        self.run_id = run_id
+        self.capacity = capacity
+        self._store = store
+        self._records: Deque[TransitionRecord] = deque()
+        # Transitions of the run that were spilled because the ring was full
+        self.spilled = 0
+
+    def append(self, record: TransitionRecord):
+        if self.capacity and len(self._records) >= self.capacity:
+            # Spill the oldest tenth of the ring at once, so the spill file is not opened on every step
+            evicted = [self._records.popleft() for _ in range(max(1, self.capacity // 10))]
+            self.spilled += len(evicted)
+            self._store.spill(self.run_id, evicted)
+        self._records.append(record)
+
+    def records(self) -> List[TransitionRecord]:
+        """Return the transitions oldest first."""
+        return list(self._records)
+
+    def __iter__(self) -> Iterator[TransitionRecord]:
+        return reversed(self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+class TransitionStore:
+    """
+    Process-wide store of step transitions, partitioned per run.
+
+    Each run gets a bounded TransitionRing, and at most `max_runs` runs are kept in memory. When a
+    ring is full or a run is evicted, its oldest transitions are appended to the JSONL spill file
+    (one serialized transition per line, tagged with the run ID) for later analysis. Spilled
+    transitions are serialized and written by a background thread, so the steps running on the
+    event loop never wait for the file; batches are dropped when its bounded queue is full.
+    """
+
+    def __init__(self, capacity: int = STEP_TRACKER_CAPACITY, max_runs: int = STEP_TRACKER_MAX_RUNS,
+                 spill_path: str = STEP_TRACKER_SPILL_FILE, queue_size: int = 1000):
+        self.capacity = capacity
+        self.max_runs = max_runs
+        self.spill_path = spill_path
+        self.spilled = 0
+        # Spilled transitions that could not be written (queue full or file error)
+        self.dropped = 0
+        self._partitions: "OrderedDict[str, TransitionRing]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Tuple[str, List[TransitionRecord]]]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+
+    def open(self, run_id: str) -> TransitionRing:
+        """Start a new partition for the run, replacing (and spilling) a previous one with the same ID."""
+        ring = TransitionRing(run_id, self, self.capacity)
+        with self._lock:
+            evicted = [self._partitions.pop(run_id)] if run_id in self._partitions else []
+            self._partitions[run_id] = ring
+            while self.max_runs and len(self._partitions) > self.max_runs:
+                evicted.append(self._partitions.popitem(last=False)[1])
+        for old_ring in evicted:
+            self.spill(old_ring.run_id, old_ring.records())
+        return ring
+
+    def get(self, run_id: str) -> Optional[TransitionRing]:
+        return self._partitions.get(run_id)
+
+    def run_ids(self) -> List[str]:
+        """Return the IDs of the runs kept in memory, newest first."""
+        return list(reversed(self._partitions))
+
+    def spill(self, run_id: str, records: List[TransitionRecord]):
+        """Queue transitions for the spill file, they are written by the background writer."""
+        if not records:
+            return
+        self.spilled += len(records)
+        if not self.spill_path:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer, name="transition-spill", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((run_id, records))
+        except queue.Full:
+            self.dropped += len(records)
+
+    def _write(self, batches: List[Tuple[str, List[TransitionRecord]]]):
+        lines = "".join(
+            json.dumps({"run_id": run_id, **record.to_dict()}, default=str) + "\n"
+            for run_id, records in batches
+            for record in records
+        )
+        try:
+            spill_dir = os.path.dirname(self.spill_path)
+            if spill_dir:
+                os.makedirs(spill_dir, exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError as e:
+            self.dropped += sum(len(records) for _, records in batches)
+            print(f"Error spilling transitions to {self.spill_path}: {e}")
+
+    def _writer(self):
+        while True:
+            batch = self._queue.get()
+            # Write everything that is already queued in one go
+            batches = [] if batch is None else [batch]
+            while batch is not None:
+                try:
+                    batch = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if batch is not None:
+                    batches.append(batch)
+            if batches:
+                self._write(batches)
+            for _ in range(len(batches) + (batch is None)):
+                self._queue.task_done()
+            if batch is None:
+                return
+
+    def flush(self):
+        """Wait until the queued transitions are written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Write the queued transitions and stop the background writer."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "runs": len(self._partitions),
+            "transitions": sum(len(ring) for ring in self._partitions.values()),
+            "spilled": self.spilled,
+            "dropped": self.dropped,
+        }
+
+
+_transition_store: Optional[TransitionStore] = None
+
+
+def get_transition_store() -> TransitionStore:
+    """Get the process-wide transition store."""
+    global _transition_store
+    if _transition_store is None:
+        _transition_store = TransitionStore()
+    return _transition_store
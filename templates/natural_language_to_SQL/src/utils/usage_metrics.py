@@ -0,0 +1,195 @@
+import sys
+sys.path.append("../../")
+
+import os
+import threading
+from dataclasses import dataclass, asdict, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# Prices in USD per 1,000 tokens, used to estimate the cost of each call (0 to report tokens only)
+LLM_PRICE_PER_1K_PROMPT_TOKENS = float(os.environ.get("LLM_PRICE_PER_1K_PROMPT_TOKENS", "0"))
+LLM_PRICE_PER_1K_CACHED_PROMPT_TOKENS = float(os.environ.get("LLM_PRICE_PER_1K_CACHED_PROMPT_TOKENS", str(LLM_PRICE_PER_1K_PROMPT_TOKENS)))
+LLM_PRICE_PER_1K_COMPLETION_TOKENS = float(os.environ.get("LLM_PRICE_PER_1K_COMPLETION_TOKENS", "0"))
+
+
+@dataclass
+class LLMCallUsage:
+    """Token usage and latency of a single chat completion call."""
+    step_name: str
+    model: str
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Reasoning tokens are part of the completion tokens
+    reasoning_tokens: int = 0
+    latency: float = 0.0
+    # Hash of the static prompt prefix, to relate cached prompt tokens to prompt layouts
+    prefix_hash: Optional[str] = None
+    # Replayed from the LLM response cache instead of calling the model
+    replayed: bool = False
+
+    @property
+    def cost(self) -> float:
+        uncached = self.prompt_tokens - self.cached_prompt_tokens
+        return (
+            uncached * LLM_PRICE_PER_1K_PROMPT_TOKENS
+            + self.cached_prompt_tokens * LLM_PRICE_PER_1K_CACHED_PROMPT_TOKENS
+            + self.completion_tokens * LLM_PRICE_PER_1K_COMPLETION_TOKENS
+        ) / 1000
+
+    @classmethod
+    def from_response(cls, response: Any, step_name: str, model: str, latency: float,
+                      prefix_hash: Optional[str] = None) -> "LLMCallUsage":
+        """Read the usage metadata of a chat completion response (a list of ChatMessageContent)."""
+        usage = None
+        if response:
+            metadata = getattr(response[0], "metadata", None) or {}
+            usage = metadata.get("usage")
+        prompt_details = getattr(usage, "prompt_tokens_details", None)
+        completion_details = getattr(usage, "completion_tokens_details", None)
+        return cls(
+            step_name=step_name,
+            model=model,
+            prompt_tokens=getattr(usage, "prompt_tokens", None) or 0,
+            cached_prompt_tokens=getattr(prompt_details, "cached_tokens", None) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", None) or 0,
+            reasoning_tokens=getattr(completion_details, "reasoning_tokens", None) or 0,
+            latency=latency,
+            prefix_hash=prefix_hash,
+        )
+
+
+@dataclass
+class UsageStats:
+    """Aggregated usage of a group of calls."""
+    calls: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+    reasoning_tokens: int = 0
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+    cost: float = 0.0
+    replayed_calls: int = 0
+    # Calls per static prompt prefix hash
+    prefix_hashes: Dict[str, int] = field(default_factory=dict)
+
+    def add(self, usage: LLMCallUsage):
+        self.calls += 1
+        self.prompt_tokens += usage.prompt_tokens
+        self.cached_prompt_tokens += usage.cached_prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+        self.reasoning_tokens += usage.reasoning_tokens
+        self.latency_total += usage.latency
+        self.latency_max = max(self.latency_max, usage.latency)
+        self.cost += usage.cost
+        self.replayed_calls += int(usage.replayed)
+        if usage.prefix_hash:
+            self.prefix_hashes[usage.prefix_hash] = self.prefix_hashes.get(usage.prefix_hash, 0) + 1
+
+    def merge(self, other: "UsageStats"):
+        self.calls += other.calls
+        self.prompt_tokens += other.prompt_tokens
+        self.cached_prompt_tokens += other.cached_prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.reasoning_tokens += other.reasoning_tokens
+        self.latency_total += other.latency_total
+        self.latency_max = max(self.latency_max, other.latency_max)
+        self.cost += other.cost
+        self.replayed_calls += other.replayed_calls
+        for prefix_hash, calls in other.prefix_hashes.items():
+            self.prefix_hashes[prefix_hash] = self.prefix_hashes.get(prefix_hash, 0) + calls
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["total_tokens"] = self.prompt_tokens + self.completion_tokens
+        data["latency_avg"] = self.latency_total / self.calls if self.calls else 0.0
+        data["cached_prompt_ratio"] = round(self.cached_prompt_tokens / self.prompt_tokens, 4) if self.prompt_tokens else 0.0
+        data["latency_total"] = round(self.latency_total, 4)
+        data["latency_max"] = round(self.latency_max, 4)
+        data["cost"] = round(self.cost, 6)
+        return data
+
+
+class MetricsRegistry:
+    """Process-wide LLM usage counters, labelled by step and model, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._stats: Dict[Tuple[str, str], UsageStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, usage: LLMCallUsage):
+        with self._lock:
+            key = (usage.step_name, usage.model)
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = UsageStats()
+            stats.add(usage)
+
+    def render_prometheus(self) -> str:
+        """Render the counters in the Prometheus text exposition format."""
+        metrics = [
+            ("nl2sql_llm_calls_total", "counter", "Chat completion calls.", lambda s: s.calls),
+            ("nl2sql_llm_prompt_tokens_total", "counter", "Prompt tokens.", lambda s: s.prompt_tokens),
+            ("nl2sql_llm_cached_prompt_tokens_total", "counter", "Prompt tokens served from the provider prompt cache.", lambda s: s.cached_prompt_tokens),
+            ("nl2sql_llm_completion_tokens_total", "counter", "Completion tokens, including reasoning tokens.", lambda s: s.completion_tokens),
+            ("nl2sql_llm_reasoning_tokens_total", "counter", "Reasoning tokens.", lambda s: s.reasoning_tokens),
+            ("nl2sql_llm_latency_seconds_sum", "counter", "Total chat completion latency.", lambda s: s.latency_total),
+            ("nl2sql_llm_latency_seconds_max", "gauge", "Maximum chat completion latency.", lambda s: s.latency_max),
+            ("nl2sql_llm_cost_usd_total", "counter", "Estimated cost in USD.", lambda s: s.cost),
+        ]
+        with self._lock:
+            items = sorted(self._stats.items())
+            lines: List[str] = []
+            for name, metric_type, help_text, value in metrics:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for (step_name, model), stats in items:
+                    lines.append(f'{name}{{step="{_escape_label(step_name)}",model="{_escape_label(model)}"}} {value(stats)}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_metrics_registry: Optional[MetricsRegistry] = None
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Get the process-wide metrics registry."""
+    global _metrics_registry
+    if _metrics_registry is None:
+        _metrics_registry = MetricsRegistry()
+    return _metrics_registry
+
+
+def record_llm_call(response: Any, model: str, latency: float, step_name: Optional[str] = None,
+                    tracker=None, prefix_hash: Optional[str] = None) -> LLMCallUsage:
+    """
+    Attribute the usage of a chat completion to the current step and run.
+
+    The call is added to the tracker of the current run (per step), to the run budget and to the
+    process-wide metrics registry. Pass `tracker` for calls made outside the run (final answer).
+    """
+    from src.utils.step_tracker import get_tracker
+
+    tracker = tracker or get_tracker()
+    if step_name is None:
+        step_name = tracker.current_step["step_name"] if tracker.current_step else "Unknown"
+    usage = LLMCallUsage.from_response(response, step_name, model, latency, prefix_hash=prefix_hash)
+    return record_llm_usage(usage, tracker)
+
+
+def record_llm_usage(usage: LLMCallUsage, tracker=None) -> LLMCallUsage:
+    """Add a call to the tracker of the current run, the run budget and the metrics registry."""
+    from src.utils.run_context import peek_run_context
+    from src.utils.step_tracker import get_tracker
+
+    tracker = tracker or get_tracker()
+    tracker.record_llm_usage(usage)
+    run_context = peek_run_context()
+    if run_context is not None:
+        run_context.budget.record_llm_call(usage.prompt_tokens, usage.completion_tokens)
+    get_metrics_registry().record(usage)
+    return usage
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modules import each other as `src.…`, relative to the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("STEP_TRACKER_CONSOLE", "off")
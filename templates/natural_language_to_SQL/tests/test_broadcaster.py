@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+from src.utils.broadcaster import ALL_RUNS, ConnectionManager, Subscriber, _Envelope
+
+
+class FakeWebSocket:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.sent = []
+        # Cleared to make the client slow
+        self.can_send = asyncio.Event()
+        self.can_send.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        await self.can_send.wait()
+        if self.fail:
+            raise ConnectionError("client went away")
+        self.sent.append(json.loads(text))
+
+
+def pending(subscriber: Subscriber) -> list:
+    return [envelope.message for envelope in subscriber._pending]
+
+
+def delta(text: str, run_id: str = "a") -> dict:
+    return {"type": "final_answer_delta", "delta": text, "run_id": run_id}
+
+
+async def drain():
+    # Let the writer tasks send what they can
+    await asyncio.sleep(0.05)
+
+
+def test_full_queue_drops_the_oldest_message():
+    subscriber = Subscriber(websocket=None, queue_size=2)
+    for i in range(4):
+        subscriber.put(_Envelope({"type": "step_transition", "index": i}))
+    assert [message["index"] for message in pending(subscriber)] == [2, 3]
+    assert subscriber.dropped == 2
+
+
+def test_consecutive_deltas_of_a_run_are_coalesced():
+    subscriber = Subscriber(websocket=None, queue_size=10)
+    for envelope in (delta("There "), delta("are "), delta("other", run_id="b"), delta("42"),
+                     {"type": "final_answer", "run_id": "a"}, delta("!")):
+        subscriber.put(_Envelope(envelope))
+    assert [(message["type"], message.get("delta")) for message in pending(subscriber)] == [
+        ("final_answer_delta", "There are "),
+        ("final_answer_delta", "other"),
+        ("final_answer_delta", "42"),
+        ("final_answer", None),
+        ("final_answer_delta", "!"),
+    ]
+    assert subscriber.dropped == 0
+
+
+def test_clients_only_receive_the_runs_they_follow():
+    async def run():
+        manager = ConnectionManager()
+        follows_a, follows_all, follows_none = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await manager.connect(follows_a, run_ids=["a"])
+        await manager.connect(follows_all, run_ids=[ALL_RUNS])
+        await manager.connect(follows_none)
+        assert manager.has_subscribers("a") and manager.has_subscribers("c")
+        manager.publish({"type": "step_transition", "run_id": "a"})
+        manager.publish({"type": "step_transition", "run_id": "b"})
+        # Untagged events (single-run mode) go to every client
+        manager.publish({"type": "step_transition"})
+        manager.subscribe(follows_none, "b")
+        manager.publish({"type": "process_completed", "run_id": "b"})
+        await drain()
+        received = [[message.get("run_id") for message in websocket.sent]
+                    for websocket in (follows_a, follows_all, follows_none)]
+        for websocket in (follows_a, follows_all, follows_none):
+            await manager.disconnect(websocket)
+        return received, manager.get_stats()
+
+    received, stats = asyncio.run(run())
+    assert received == [["a", None], ["a", "b", None, "b"], [None, "b"]]
+    assert stats == {"connections": 0, "queued": 0, "dropped": 0}
+
+
+def test_slow_and_dead_clients_do_not_hold_up_the_others():
+    async def run():
+        manager = ConnectionManager(queue_size=2)
+        fast, slow, dead = FakeWebSocket(), FakeWebSocket(), FakeWebSocket(fail=True)
+        slow.can_send.clear()
+        for websocket in (fast, slow, dead):
+            await manager.connect(websocket, run_ids=[ALL_RUNS])
+        for i in range(5):
+            manager.publish({"type": "step_transition", "index": i, "input_data": {"i": i}})
+            await drain()
+        # The dead client is removed as soon as its send fails
+        assert manager.active_connections == [fast, slow]
+        stats = manager.get_stats()
+        slow.can_send.set()
+        await drain()
+        await manager.disconnect(fast)
+        await manager.disconnect(slow)
+        return fast.sent, slow.sent, stats
+
+    fast_sent, slow_sent, stats = asyncio.run(run())
+    assert [message["index"] for message in fast_sent] == [0, 1, 2, 3, 4]
+    # Step data is sent as text
+    assert fast_sent[0]["input_data"] == "{'i': 0}"
+    # The slow client's writer holds the first message, its queue keeps the newest two
+    assert [message["index"] for message in slow_sent] == [0, 3, 4]
+    assert stats["dropped"] == 2
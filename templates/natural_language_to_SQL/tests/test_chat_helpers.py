@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+import pytest
+from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatPromptExecutionSettings
+from semantic_kernel.contents import AuthorRole, ChatMessageContent, StreamingChatMessageContent
+from semantic_kernel.kernel import Kernel
+
+from src.models.step_models import ValidationResult
+from src.utils import chat_helpers
+
+
+class StubChat(ChatCompletionClientBase):
+    def get_prompt_execution_settings_class(self):
+        return OpenAIChatPromptExecutionSettings
+
+    async def _inner_get_chat_message_contents(self, chat_history, settings):
+        content = json.dumps({"status": "OK", "list_of_issues": []})
+        return [ChatMessageContent(role=AuthorRole.ASSISTANT, content=content)]
+
+    async def _inner_get_streaming_chat_message_contents(self, chat_history, settings, function_invoke_attempt=0):
+        for text in ("The answer ", "is ", "42."):
+            yield [StreamingChatMessageContent(role=AuthorRole.ASSISTANT, content=text, choice_index=0)]
+
+
+def test_requests_are_bounded_per_deployment_of_the_service(monkeypatch):
+    # The deployment comes from the service, not from the environment
+    monkeypatch.delenv("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME", raising=False)
+    monkeypatch.setattr(chat_helpers, "_deployment_semaphores", {})
+    kernel = Kernel()
+    kernel.add_service(StubChat(service_id=chat_helpers.SERVICE_ID, ai_model_id="deployment-a"))
+
+    answer = asyncio.run(chat_helpers.call_chat_completion_structured_outputs(kernel, "question", ValidationResult))
+
+    assert answer.status == "OK"
+    assert list(chat_helpers._deployment_semaphores) == ["deployment-a"]
+
+
+def test_streaming_releases_the_deployment_slot_before_the_deltas_are_consumed(monkeypatch):
+    monkeypatch.delenv("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME", raising=False)
+    monkeypatch.setattr(chat_helpers, "_deployment_semaphores", {})
+    monkeypatch.setattr(chat_helpers, "MAX_CONCURRENT_REQUESTS_PER_DEPLOYMENT", 1)
+    kernel = Kernel()
+    kernel.add_service(StubChat(service_id=chat_helpers.SERVICE_ID, ai_model_id="deployment-a"))
+    function = kernel.add_function(prompt="{{$query}}", function_name="answer", plugin_name="test")
+
+    async def run():
+        received = []
+        slot_free = []
+
+        async def slow_consumer(delta: str):
+            # A slow WebSocket client: the model call must not keep the deployment slot meanwhile
+            if not received:
+                for _ in range(100):
+                    if not chat_helpers.get_deployment_semaphore("deployment-a").locked():
+                        break
+                    await asyncio.sleep(0.01)
+                slot_free.append(not chat_helpers.get_deployment_semaphore("deployment-a").locked())
+            received.append(delta)
+
+        answer = await chat_helpers.call_function_streaming(kernel, function, on_delta=slow_consumer, query="question")
+        return answer, received, slot_free
+
+    answer, received, slot_free = asyncio.run(run())
+    assert answer == "The answer is 42."
+    assert received == ["The answer ", "is ", "42."]
+    assert slot_free == [True]
+
+
+def test_streaming_errors_reach_the_caller(monkeypatch):
+    monkeypatch.setattr(chat_helpers, "_deployment_semaphores", {})
+
+    class FailingChat(StubChat):
+        async def _inner_get_streaming_chat_message_contents(self, chat_history, settings, function_invoke_attempt=0):
+            yield [StreamingChatMessageContent(role=AuthorRole.ASSISTANT, content="partial", choice_index=0)]
+            raise RuntimeError("connection reset")
+
+    kernel = Kernel()
+    kernel.add_service(FailingChat(service_id=chat_helpers.SERVICE_ID, ai_model_id="deployment-a"))
+    function = kernel.add_function(prompt="{{$query}}", function_name="answer", plugin_name="test")
+    received = []
+
+    async def on_delta(delta: str):
+        received.append(delta)
+
+    with pytest.raises(Exception) as error:
+        asyncio.run(chat_helpers.call_function_streaming(kernel, function, on_delta=on_delta, query="question"))
+    # The kernel may wrap the error of the service
+    assert "connection reset" in str(error.value) + str(error.value.__cause__)
+    assert received == ["partial"]
@@ -0,0 +1,31 @@
+import importlib
+
+import pytest
+
+from src.utils import db_helpers
+
+
+@pytest.fixture
+def reload_db_helpers(monkeypatch):
+    for name in ("SQL_POOL_SIZE", "SQL_MAX_ROWS", "SQL_STATEMENT_TIMEOUT",
+                 "SQLITE_POOL_SIZE", "SQLITE_MAX_ROWS", "SQLITE_STATEMENT_TIMEOUT"):
+        monkeypatch.delenv(name, raising=False)
+    yield lambda: importlib.reload(db_helpers)
+    monkeypatch.undo()
+    importlib.reload(db_helpers)
+
+
+def test_backend_neutral_limits(reload_db_helpers, monkeypatch):
+    monkeypatch.setenv("SQL_POOL_SIZE", "2")
+    monkeypatch.setenv("SQL_MAX_ROWS", "0")
+    monkeypatch.setenv("SQL_STATEMENT_TIMEOUT", "5")
+    module = reload_db_helpers()
+    assert (module.SQL_POOL_SIZE, module.SQL_MAX_ROWS, module.SQL_STATEMENT_TIMEOUT) == (2, 0, 5.0)
+
+
+def test_sqlite_names_are_fallbacks(reload_db_helpers, monkeypatch):
+    monkeypatch.setenv("SQLITE_POOL_SIZE", "3")
+    monkeypatch.setenv("SQLITE_MAX_ROWS", "50")
+    monkeypatch.setenv("SQL_MAX_ROWS", "100")
+    module = reload_db_helpers()
+    assert (module.SQL_POOL_SIZE, module.SQL_MAX_ROWS, module.SQL_STATEMENT_TIMEOUT) == (3, 100, 30.0)
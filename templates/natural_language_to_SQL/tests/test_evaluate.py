@@ -0,0 +1,77 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from src import evaluate
+from src.utils.db_helpers import set_sql_backend
+from src.utils.example_store import ExampleStore, get_example_store, set_example_store
+from src.utils.query_cache import QueryCache, get_query_cache, set_query_cache
+from src.utils.result_cache import ResultCache
+from src.utils.sql_backends import SQLiteBackend
+
+
+@pytest.fixture(autouse=True)
+def caches(tmp_path):
+    db_file = str(tmp_path / "test.db")
+    sqlite3.connect(db_file).close()
+    sql_backend = SQLiteBackend(db_file, pool_size=1, max_rows=10, timeout=5)
+    sql_backend.result_cache = ResultCache()
+    set_sql_backend(sql_backend)
+    previous_query_cache, previous_example_store = get_query_cache(), get_example_store()
+    set_query_cache(QueryCache())
+    set_example_store(ExampleStore(path="", auto_append=True))
+    yield sql_backend
+    set_sql_backend(None)
+    set_query_cache(previous_query_cache)
+    set_example_store(previous_example_store)
+    sql_backend.pool.close()
+
+
+class RecordingProcess:
+    """Stand-in for SqlProcess recording the caches each run sees."""
+    seen = []
+
+    def __init__(self, kernel, tracker=None):
+        self.run_context = None
+
+    async def start(self, user_query, run_context=None):
+        self.run_context = run_context
+        run_context.result = {"sql_statement": "SELECT 1", "response": {"result": [[1]]}}
+        RecordingProcess.seen.append(evaluate.get_cache_state(use_caches=True))
+
+
+def run(use_caches):
+    RecordingProcess.seen = []
+    questions = [{"id": "1", "question": "one"}, {"id": "2", "question": "two"}]
+    return asyncio.run(evaluate.run_batch(None, questions, concurrency=2, use_caches=use_caches))
+
+
+def test_run_batch_disables_the_caches_and_restores_them(monkeypatch, caches):
+    monkeypatch.setattr(evaluate, "SqlProcess", RecordingProcess)
+    records = run(use_caches=False)
+    assert [record.status for record in records] == ["completed", "completed"]
+    assert RecordingProcess.seen == [
+        {"query_cache": False, "result_cache": False, "example_auto_append": False}
+    ] * 2
+    assert evaluate.get_cache_state(use_caches=True) == {
+        "query_cache": True, "result_cache": True, "example_auto_append": True
+    }
+
+
+def test_run_batch_keeps_the_caches_on_request(monkeypatch):
+    monkeypatch.setattr(evaluate, "SqlProcess", RecordingProcess)
+    run(use_caches=True)
+    assert RecordingProcess.seen == [
+        {"query_cache": True, "result_cache": True, "example_auto_append": True}
+    ] * 2
+
+
+def test_report_records_the_cache_state(monkeypatch):
+    monkeypatch.setattr(evaluate, "SqlProcess", RecordingProcess)
+    questions = [{"id": "1", "question": "one", "expected_result": [[1]]}]
+    caches = evaluate.get_cache_state(use_caches=False)
+    records = asyncio.run(evaluate.run_batch(None, questions, concurrency=1))
+    report = asyncio.run(evaluate.build_report(questions, records, 0.1, caches))
+    assert report["caches"] == {"query_cache": False, "result_cache": False, "example_auto_append": False}
+    assert report["execution_accuracy"] == 1.0
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from src.constants.data_model import global_database_model
+from src.constants.prompts import few_shot_seed_examples
+from src.utils.example_store import ExampleStore, tokenize
+from src.utils.sql_prevalidation import SqlPrevalidator
+
+SEEDS = [
+    {"question": "from which counties do our providers come from?", "sql_statement": "SELECT DISTINCT COUNTY FROM G"},
+    {"question": "Find the top 5 medications with the lowest adherence rates", "sql_statement": "SELECT 1"},
+    {"question": "How many patients use wearable devices?", "sql_statement": "SELECT 2"},
+]
+
+
+def test_tokenize_drops_stop_words_and_plurals():
+    assert tokenize("Which counties do the providers come from?") == ["county", "provider", "come"]
+    assert tokenize("class address") == ["class", "address"]
+
+
+def test_search_ranks_the_most_similar_question_first():
+    store = ExampleStore(SEEDS, path="")
+    results = store.search("list the counties of the providers", top_k=2)
+    assert results[0][1].question == SEEDS[0]["question"]
+    assert all(score > 0 for score, _ in results)
+    assert store.search("hospital beds", top_k=2) == []
+
+
+def test_same_question_is_deduplicated_and_the_latest_sql_wins():
+    store = ExampleStore(SEEDS, path="")
+    store.add("How many patients use wearable devices ?", "SELECT 3")
+    assert len(store) == len(SEEDS)
+    _, example = store.search("wearable devices", top_k=1)[0]
+    assert (example.sql_statement, example.source) == ("SELECT 3", "run")
+
+
+def test_eviction_removes_the_oldest_run_example_and_keeps_the_seeds():
+    store = ExampleStore(SEEDS, path="", max_examples=len(SEEDS) + 2)
+    for i in range(4):
+        store.add(f"question number {i} about claims", f"SELECT {i}")
+    questions = [example.question for _, example in store.search("question number about claims", top_k=10)]
+    assert sorted(questions) == ["question number 2 about claims", "question number 3 about claims"]
+    assert store.get_stats()["seed"] == len(SEEDS)
+    assert len(store) == len(SEEDS) + 2
+    # Evicted questions leave no term behind in the index
+    assert store.search("0", top_k=10) == []
+
+
+def test_examples_are_persisted_and_reloaded_for_the_same_schema(tmp_path):
+    path = str(tmp_path / "examples" / "examples.jsonl")
+    store = ExampleStore(SEEDS, path=path, schema_version="v1")
+    store.add("average premium per insurance plan", "SELECT PLAN_ID, AVG(PREMIUM) FROM P GROUP BY PLAN_ID")
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    # Seeds come from the code, only the examples added from runs are written
+    assert [record["question"] for record in records] == ["average premium per insurance plan"]
+
+    reloaded = ExampleStore(SEEDS, path=path, schema_version="v1")
+    assert len(reloaded) == len(SEEDS) + 1
+    assert reloaded.search("premium per plan", top_k=1)[0][1].source == "run"
+
+    other_schema = ExampleStore(SEEDS, path=path, schema_version="v2")
+    assert len(other_schema) == len(SEEDS)
+
+
+def test_corrupt_examples_file_keeps_the_seeds(tmp_path):
+    path = tmp_path / "examples.jsonl"
+    path.write_text("not json\n", encoding="utf-8")
+    store = ExampleStore(SEEDS, path=str(path))
+    assert len(store) == len(SEEDS)
+
+
+def test_render_keeps_the_examples_within_the_token_budget():
+    store = ExampleStore(SEEDS, path="")
+    store.add("providers per county and specialty", "SELECT COUNTY, SPECIALTY, COUNT(*) FROM PROVIDERS " * 50)
+    rendered = store.render("providers per county", top_k=3, token_budget=60)
+    assert "Example #1" in rendered
+    assert "SPECIALTY" not in rendered
+    assert store.render("hospital beds") == "No examples available for this question."
+
+
+@pytest.mark.parametrize("example", few_shot_seed_examples, ids=lambda example: example["question"])
+def test_seed_examples_compile_against_the_data_model(example):
+    prevalidator = SqlPrevalidator(global_database_model)
+    table_names = [table["TableName"] for table in global_database_model]
+    assert prevalidator.check(example["sql_statement"], table_names) == []
@@ -0,0 +1,121 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from src.models.events import SQLEvents
+from src.models.step_models import ExecutionStepInput, GetColumnNames
+from src.steps.execution_step import ExecutionStep
+from src.utils.db_helpers import set_sql_backend
+from src.utils.example_store import ExampleStore, set_example_store
+from src.utils.query_cache import QueryCache, get_query_cache, set_query_cache
+from src.utils.run_context import RunContext, reset_run_context, set_run_context
+from src.utils.sql_backends import SQLiteBackend
+
+
+class RecordingContext:
+    def __init__(self):
+        self.events = []
+
+    async def emit_event(self, process_event, data=None):
+        self.events.append(process_event)
+
+
+@pytest.fixture(autouse=True)
+def backend(tmp_path):
+    db_file = str(tmp_path / "test.db")
+    with sqlite3.connect(db_file) as conn:
+        conn.execute("CREATE TABLE patients (id INTEGER)")
+        conn.executemany("INSERT INTO patients VALUES (?)", [(i,) for i in range(3)])
+    sql_backend = SQLiteBackend(db_file, pool_size=1, max_rows=10, timeout=5)
+    set_sql_backend(sql_backend)
+    previous_cache = get_query_cache()
+    set_query_cache(QueryCache())
+    set_example_store(None)
+    yield sql_backend
+    set_sql_backend(None)
+    set_query_cache(previous_cache)
+    sql_backend.pool.close()
+
+
+def run_step(data: ExecutionStepInput, query_cache: QueryCache) -> RecordingContext:
+    async def run():
+        token = set_run_context(RunContext(user_query=data.user_query, query_cache=query_cache))
+        try:
+            context = RecordingContext()
+            await ExecutionStep().execute_sql(context, data, kernel=None)
+            return context
+        finally:
+            reset_run_context(token)
+    return asyncio.run(run())
+
+
+def test_results_are_stored_in_the_cache_of_the_run():
+    run_cache = QueryCache()
+    data = ExecutionStepInput(
+        user_query="How many patients?",
+        table_column_names=GetColumnNames(table_column_list=[]),
+        sql_statement="SELECT COUNT(*) AS n FROM patients",
+        review_passed=True,
+    )
+    context = run_step(data, run_cache)
+    assert context.events == [SQLEvents.ExecutionSuccess]
+    assert len(run_cache) == 1
+    assert len(get_query_cache()) == 0
+
+
+def test_sql_let_through_after_the_retry_limit_is_not_cached():
+    run_cache = QueryCache()
+    data = ExecutionStepInput(
+        user_query="How many patients?",
+        table_column_names=GetColumnNames(table_column_list=[]),
+        sql_statement="SELECT COUNT(*) AS n FROM patients",
+        review_passed=False,
+    )
+    context = run_step(data, run_cache)
+    assert context.events == [SQLEvents.ExecutionSuccess]
+    assert len(run_cache) == 0
+
+
+def test_failed_cached_sql_discards_the_matched_entry():
+    run_cache = QueryCache()
+    entry = asyncio.run(run_cache.store(
+        "count the patients", "SELECT COUNT(*) FROM missing", GetColumnNames(table_column_list=[])
+    ))
+    # A semantic hit: the new phrasing differs from the query the entry is stored under
+    data = ExecutionStepInput(
+        user_query="How many patients are there?",
+        table_column_names=entry.table_column_names,
+        sql_statement=entry.sql_statement,
+        from_cache=True,
+        cache_key=entry.key,
+    )
+    run_step(data, run_cache)
+    assert len(run_cache) == 0
+
+
+@pytest.mark.parametrize("review_passed, expected", [(True, 1), (False, 0)])
+def test_only_reviewed_sql_is_added_to_the_example_store(review_passed, expected):
+    example_store = ExampleStore(path="", auto_append=True)
+    set_example_store(example_store)
+    data = ExecutionStepInput(
+        user_query="How many patients?",
+        table_column_names=GetColumnNames(table_column_list=[]),
+        sql_statement="SELECT COUNT(*) AS n FROM patients",
+        review_passed=review_passed,
+    )
+    run_step(data, QueryCache())
+    assert len(example_store) == expected
+
+
+def test_example_store_auto_append_is_off_by_default():
+    example_store = ExampleStore(path="")
+    set_example_store(example_store)
+    data = ExecutionStepInput(
+        user_query="How many patients?",
+        table_column_names=GetColumnNames(table_column_list=[]),
+        sql_statement="SELECT COUNT(*) AS n FROM patients",
+        review_passed=True,
+    )
+    run_step(data, QueryCache())
+    assert len(example_store) == 0
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatPromptExecutionSettings
+from semantic_kernel.contents import AuthorRole, StreamingChatMessageContent
+from semantic_kernel.kernel import Kernel
+
+from src import server
+from src.utils import chat_helpers
+from src.utils.broadcaster import ConnectionManager
+from src.utils.run_context import RunContext
+from src.utils.step_tracker import StepTracker
+
+
+class StreamingChat(ChatCompletionClientBase):
+    def get_prompt_execution_settings_class(self):
+        return OpenAIChatPromptExecutionSettings
+
+    async def _inner_get_streaming_chat_message_contents(self, chat_history, settings, function_invoke_attempt=0):
+        for text in ("There are ", "42 ", "patients."):
+            yield [StreamingChatMessageContent(role=AuthorRole.ASSISTANT, content=text, choice_index=0)]
+
+
+class RecordingManager(ConnectionManager):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def publish(self, message):
+        self.messages.append(message)
+
+
+class FakeProcess:
+    """Stands in for the SqlProcess, hands back a SQL result like the ExecutionStep."""
+
+    def __init__(self, kernel, tracker=None):
+        self.tracker = tracker or StepTracker()
+        self.run_context = None
+
+    async def start(self, query, run_context=None):
+        self.run_context = run_context or RunContext(user_query=query)
+        self.run_context.result = {"response": {"result": [{"count": 42}]}}
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(chat_helpers, "_deployment_semaphores", {})
+
+    async def initialize_kernel():
+        kernel = Kernel()
+        kernel.add_service(StreamingChat(service_id=chat_helpers.SERVICE_ID, ai_model_id="deployment-a"))
+        return kernel
+
+    manager = RecordingManager()
+    monkeypatch.setattr(server, "initialize_kernel", initialize_kernel)
+    monkeypatch.setattr(server, "SqlProcess", FakeProcess)
+    monkeypatch.setattr(server, "manager", manager)
+    return manager
+
+
+def test_final_answer_deltas_are_broadcast_before_the_final_answer(manager):
+    run_context = RunContext(user_query="How many patients?")
+    run_context.tracker = StepTracker(run_id=run_context.run_id)
+
+    result = asyncio.run(server.run_sql_process("How many patients?", run_context=run_context))
+
+    assert result["final_answer"] == "There are 42 patients."
+    assert [message["type"] for message in manager.messages] == [
+        "process_started", "final_answer_delta", "final_answer_delta", "final_answer_delta",
+        "final_answer", "process_completed",
+    ]
+    deltas = [message["delta"] for message in manager.messages if message["type"] == "final_answer_delta"]
+    assert deltas == ["There are ", "42 ", "patients."]
+    # Every message carries the run ID, so viewers of other runs do not receive it
+    assert all(message["run_id"] == run_context.run_id for message in manager.messages)
+    assert manager.messages[-2]["answer"] == "There are 42 patients."
+    # The answer generation is tracked as its own step, with the usage of the streaming call
+    assert run_context.tracker.get_usage_metrics()["steps"]["FinalAnswerGeneration"]["calls"] == 1
+
+
+def test_streaming_errors_are_broadcast(manager, monkeypatch):
+    async def failing_stream(*args, **kwargs):
+        raise RuntimeError("connection reset")
+    monkeypatch.setattr(server, "call_function_streaming", failing_stream)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(server.run_sql_process("How many patients?"))
+    assert manager.messages[-1]["type"] == "error"
+    assert manager.messages[-1]["message"] == "connection reset"
+    assert "final_answer" not in [message["type"] for message in manager.messages]
@@ -0,0 +1,34 @@
+import json
+import os
+
+import pytest
+
+from src.utils.prompt_capture import JsonlPromptSink, MemoryPromptSink, PromptSink
+
+
+def test_prompt_sink_is_abstract():
+    with pytest.raises(TypeError):
+        PromptSink()
+
+
+def test_memory_sink_keeps_the_latest_prompts():
+    sink = MemoryPromptSink(capacity=2)
+    for i in range(3):
+        sink.capture("run", "SQLGenerationStep", f"prompt {i}", index=i)
+    assert [entry["prompt"] for entry in sink.records("run")] == ["prompt 1", "prompt 2"]
+    assert sink.records("other") == []
+
+
+def test_jsonl_sink_rolls_over_on_the_byte_size(tmp_path):
+    path = str(tmp_path / "prompts.jsonl")
+    sink = JsonlPromptSink(path=path, max_bytes=2000, backups=10)
+    for i in range(20):
+        sink.capture("run", "SQLGenerationStep", f"Quelle clinique à Zürich ? {i} " + "é" * 50, index=i)
+    sink.close()
+
+    files = [path] + [f"{path}.{i}" for i in range(1, 11) if os.path.exists(f"{path}.{i}")]
+    assert len(files) > 1
+    assert all(os.path.getsize(f) <= 2000 for f in files)
+    entries = [json.loads(line) for f in files for line in open(f, encoding="utf-8")]
+    assert sorted(entry["index"] for entry in entries) == list(range(20))
+    assert sink.captured == 20
@@ -0,0 +1,67 @@
+import pytest
+
+from src.utils.result_cache import ResultCache, sql_fingerprint
+
+
+@pytest.mark.parametrize("first, second", [
+    ("SELECT * FROM a WHERE name = 'a , b'", "SELECT * FROM a WHERE name = 'a,b'"),
+    ("SELECT * FROM a WHERE name = 'a  b'", "SELECT * FROM a WHERE name = 'a b'"),
+    ("SELECT * FROM a WHERE name = 'A'", "SELECT * FROM a WHERE name = 'a'"),
+    ('SELECT "Total  Cost" FROM a', 'SELECT "Total Cost" FROM a'),
+])
+def test_literals_are_not_normalized(first, second):
+    assert sql_fingerprint(first) != sql_fingerprint(second)
+    assert ResultCache.key(first, 10) != ResultCache.key(second, 10)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("SELECT id, name FROM a WHERE id = 1", "select id,name\n  from a where id=1;"),
+    ("SELECT id FROM a -- first\nWHERE name = 'x  y'", "SELECT id FROM a /* second */ WHERE name='x  y'"),
+    ("SELECT COUNT( * ) FROM a", "SELECT count(*) FROM a"),
+    ("SELECT name FROM a WHERE name IN ('x' , 'y')", "SELECT name FROM a WHERE name IN ('x','y')"),
+])
+def test_equivalent_spellings_share_a_key(first, second):
+    assert sql_fingerprint(first) == sql_fingerprint(second)
+    assert ResultCache.key(first, 10) == ResultCache.key(second, 10)
+
+
+def test_row_limit_is_part_of_the_key():
+    assert ResultCache.key("SELECT 1", 10) != ResultCache.key("SELECT 1", 20)
+
+
+def test_entry_is_dropped_when_the_data_version_changes():
+    cache = ResultCache(max_bytes=1024)
+    key = ResultCache.key("SELECT 1", 10)
+    cache.put(key, 1, {"result": [{"1": 1}]})
+    assert cache.get(key, 1) == {"result": [{"1": 1}]}
+    assert cache.get(key, 2) is None
+    assert len(cache) == 0
+
+
+def test_cached_rows_cannot_be_changed_by_callers():
+    cache = ResultCache(max_bytes=1024)
+    key = ResultCache.key("SELECT id FROM a", 10)
+    response = {"result": [{"id": 1}]}
+    cache.put(key, 1, response)
+    response["result"][0]["id"] = 2
+
+    served = cache.get(key, 1)
+    served["result"][0]["id"] = 3
+    served["result"].append({"id": 4})
+    assert cache.get(key, 1) == {"result": [{"id": 1}]}
+
+
+def test_least_recently_used_entries_are_evicted_within_the_byte_budget():
+    cache = ResultCache(max_bytes=60)
+    keys = [ResultCache.key(f"SELECT {i}", 10) for i in range(3)]
+    for key in keys[:2]:
+        cache.put(key, 1, {"result": [{"n": 1}]})
+    cache.get(keys[0], 1)
+    cache.put(keys[2], 1, {"result": [{"n": 1}]})
+    assert cache.get(keys[1], 1) is None
+    assert cache.get(keys[0], 1) is not None
+    assert cache.size <= cache.max_bytes
+    # Responses larger than the whole budget and errors are not cached
+    cache.put(keys[1], 1, {"result": [{"n": "x" * 100}]})
+    cache.put(keys[1], 1, {"error": "no such table"})
+    assert cache.get(keys[1], 1) is None
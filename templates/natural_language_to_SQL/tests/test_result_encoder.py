@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from src.utils import result_encoder
+from src.utils.result_encoder import ResultEncoder, summarize_columns
+
+TRUNCATED = "(result truncated: the query returned more than 3 rows, only the first 3 were fetched)"
+
+
+@pytest.mark.parametrize("mode", ["columnar", "markdown", "raw"])
+def test_truncated_results_are_flagged_in_the_prompt(mode):
+    rows = [{"id": i} for i in range(3)]
+    encoded = ResultEncoder(mode=mode, token_budget=0).encode({"result": rows, "truncated": True})
+    assert TRUNCATED in encoded
+    assert "truncated" not in ResultEncoder(mode=mode, token_budget=0).encode({"result": rows})
+
+
+@pytest.fixture
+def char_tokens(monkeypatch):
+    # One token per character keeps the budget arithmetic independent of tiktoken
+    monkeypatch.setattr(result_encoder, "_token_counter", len)
+
+
+def test_columnar_encoding_writes_the_header_once():
+    rows = [{"name": "Anna", "age": 31}, {"name": "Ben", "age": None}]
+    encoded = ResultEncoder(mode="columnar", token_budget=0).encode({"result": rows})
+    assert encoded == 'columns: ["name", "age"]\n["Anna", 31]\n["Ben", null]'
+
+
+def test_markdown_encoding_escapes_cell_values():
+    rows = [{"name": "a|b", "note": "two\nlines"}, {"name": None, "note": "x"}]
+    encoded = ResultEncoder(mode="markdown", token_budget=0).encode(rows)
+    assert encoded == "| name | note |\n|---|---|\n| a\\|b | two lines |\n|  | x |"
+
+
+def test_errors_and_empty_results_are_passed_through():
+    encoder = ResultEncoder(token_budget=0)
+    assert encoder.encode({"error": "no such table: claims"}) == "{'error': 'no such table: claims'}"
+    assert encoder.encode({"result": []}) == "{'result': []}"
+
+
+def test_rows_over_the_token_budget_are_summarized(char_tokens):
+    rows = [{"id": i, "city": "Bern" if i % 3 else "Biel"} for i in range(10)]
+    header = 'columns: ["id", "city"]'
+    # Room for the header and three rows of 11 characters plus their newlines
+    encoded = ResultEncoder(mode="columnar", token_budget=len(header) + 3 * 12, top_k=1).encode({"result": rows})
+    lines = encoded.split("\n")
+    assert lines[:4] == [header, '[0, "Biel"]', '[1, "Bern"]', '[2, "Bern"]']
+    assert lines[4] == "(3 of 10 rows shown)"
+    # The statistics cover every row, not only the ones shown
+    assert json.loads(lines[5].split(": ", 1)[1]) == {
+        "id": {"count": 10, "min": 0, "max": 9},
+        "city": {"count": 10, "distinct": 2, "top": ["Bern"]},
+    }
+
+
+def test_summary_stats_can_be_disabled(char_tokens):
+    rows = [{"id": i} for i in range(10)]
+    encoded = ResultEncoder(mode="columnar", token_budget=20, summary_stats=False).encode(rows)
+    assert encoded.split("\n")[-1] == "(1 of 10 rows shown)"
+    assert "summary" not in encoded
+
+
+def test_summarize_columns_skips_nulls_and_mixed_types():
+    rows = [{"value": 1, "flag": True}, {"value": "n/a", "flag": False}, {"value": None, "flag": True}]
+    assert summarize_columns(["value", "flag", "missing"], rows, top_k=2) == {
+        "value": {"count": 2, "distinct": 2, "top": ["1", "n/a"]},
+        "flag": {"count": 3, "distinct": 2, "top": ["True", "False"]},
+        "missing": {"count": 0},
+    }
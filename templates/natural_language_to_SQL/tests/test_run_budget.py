@@ -0,0 +1,145 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+from semantic_kernel.kernel import Kernel
+
+from src.models.events import SQLEvents
+from src.models.step_models import GetColumnNames, SQLGenerateResult, SQLGenerationStepInput
+from src.process.sql_process import SqlProcess
+from src.steps.sql_generation_step import SQLGenerationStep
+from src.utils.db_helpers import set_sql_backend
+from src.utils.query_cache import QueryCache
+from src.utils.run_budget import RunBudget
+from src.utils.run_context import RunContext, reset_run_context, set_run_context
+from src.utils.sql_backends import SQLiteBackend
+from src.utils.step_tracker import StepTracker
+
+
+class RecordingContext:
+    def __init__(self):
+        self.events = []
+
+    async def emit_event(self, process_event, data=None):
+        self.events.append(process_event)
+
+
+@pytest.fixture(autouse=True)
+def backend(tmp_path):
+    db_file = str(tmp_path / "test.db")
+    with sqlite3.connect(db_file) as conn:
+        conn.execute("CREATE TABLE patients (id INTEGER)")
+        conn.executemany("INSERT INTO patients VALUES (?)", [(i,) for i in range(3)])
+    sql_backend = SQLiteBackend(db_file, pool_size=1, max_rows=10, timeout=5)
+    set_sql_backend(sql_backend)
+    yield sql_backend
+    set_sql_backend(None)
+    sql_backend.pool.close()
+
+
+def test_llm_call_cap():
+    budget = RunBudget(max_llm_calls=2, max_seconds=0, max_tokens=0)
+    budget.record_llm_call(10, 5)
+    assert budget.exceeded() is None
+    budget.record_llm_call(10, 5)
+    assert budget.exceeded().startswith("LLM call budget exhausted (2/2 calls)")
+
+
+def test_token_cap():
+    budget = RunBudget(max_llm_calls=0, max_seconds=0, max_tokens=100)
+    budget.record_llm_call(60, 30)
+    assert budget.exceeded() is None
+    budget.record_llm_call(5, 5)
+    assert budget.exceeded() == "Token budget exhausted (100/100 tokens)"
+
+
+def test_time_cap():
+    budget = RunBudget(max_llm_calls=0, max_seconds=5, max_tokens=0)
+    assert budget.exceeded() is None
+    budget.started_at = time.monotonic() - 6
+    assert budget.exceeded().startswith("Time budget exhausted")
+
+
+def test_disabled_caps_never_trigger():
+    budget = RunBudget(max_llm_calls=0, max_seconds=0, max_tokens=0, max_repeated_sql=0)
+    for _ in range(100):
+        budget.record_llm_call(1000, 1000)
+        assert budget.check_loop("SELECT 1") is None
+    assert budget.exceeded() is None
+
+
+def test_loop_detection_ignores_case_and_whitespace():
+    budget = RunBudget(max_repeated_sql=3)
+    assert budget.check_loop("SELECT id FROM patients") is None
+    assert budget.check_loop("SELECT COUNT(*) FROM patients") is None
+    assert budget.check_loop("select id  from patients") is None
+    assert budget.check_loop("SELECT id FROM patients\n") == "Loop detected: the same SQL statement was generated 3 times"
+    assert (budget.iterations, len(budget.sql_counts)) == (4, 2)
+
+
+def run_generation(run_context: RunContext, data: SQLGenerationStepInput) -> RecordingContext:
+    async def run():
+        token = set_run_context(run_context)
+        try:
+            context = RecordingContext()
+            await SQLGenerationStep().generate_sql(context, data, kernel=None)
+            return context
+        finally:
+            reset_run_context(token)
+    return asyncio.run(run())
+
+
+def make_run_context(**budget) -> RunContext:
+    run_context = RunContext(user_query="How many patients?", budget=RunBudget(**budget))
+    run_context.tracker = StepTracker(run_id=run_context.run_id, console_output="off")
+    return run_context
+
+
+def generation_input() -> SQLGenerationStepInput:
+    return SQLGenerationStepInput(user_query="How many patients?", table_column_names=GetColumnNames(table_column_list=[]))
+
+
+def test_exhausted_budget_gives_up_before_generating(monkeypatch):
+    async def fail(*args, **kwargs):
+        raise AssertionError("no SQL is generated once the budget is exhausted")
+    monkeypatch.setattr(SQLGenerationStep, "_generate_sql", fail)
+    run_context = make_run_context(max_llm_calls=1)
+    run_context.budget.record_llm_call()
+    run_context.budget.set_best_sql("SELECT COUNT(*) AS n FROM patients")
+
+    context = run_generation(run_context, generation_input())
+    assert context.events == [SQLEvents.GiveUp]
+    # The best statement so far is executed once and returned
+    assert run_context.result["response"]["result"] == [{"n": 3}]
+    assert run_context.result["gave_up_reason"].startswith("LLM call budget exhausted")
+    assert run_context.budget.gave_up_reason == run_context.result["gave_up_reason"]
+
+
+def test_repeated_sql_gives_up_with_the_last_statement(monkeypatch):
+    async def generate(self, kernel, user_query, data):
+        return SQLGenerateResult(sql_statement="SELECT COUNT(*) AS n FROM patients", status="OK", reason="")
+    monkeypatch.setattr(SQLGenerationStep, "_generate_sql", generate)
+    monkeypatch.setattr(SQLGenerationStep, "_precheck_sql", lambda self, data, sql_statement: [])
+    run_context = make_run_context(max_repeated_sql=2)
+
+    assert run_generation(run_context, generation_input()).events == [SQLEvents.SQLGenerationStepDone]
+    assert run_generation(run_context, generation_input()).events == [SQLEvents.GiveUp]
+    assert run_context.result["gave_up_reason"].startswith("Loop detected")
+    assert run_context.result["sql_statement"] == "SELECT COUNT(*) AS n FROM patients"
+
+
+@pytest.mark.parametrize("schema_selection", ["two_stage", "combined"])
+def test_give_up_stops_the_process(schema_selection):
+    run_context = make_run_context(max_tokens=100)
+    run_context.budget.record_llm_call(100, 0)
+    sql_process = SqlProcess(Kernel(), query_cache=QueryCache(), tracker=run_context.tracker,
+                             schema_selection=schema_selection)
+    # The first step gives up without calling the model, and no other step runs
+    asyncio.run(sql_process.start(run_context.user_query, run_context=run_context))
+
+    transitions = [(t.step_name, t.next_event) for t in run_context.tracker.transitions]
+    first_step = "SchemaSelectionStep" if schema_selection == "combined" else "TableNameStep"
+    assert (first_step, SQLEvents.GiveUp) in transitions
+    assert {step_name for step_name, _ in transitions} <= {"Process Start", first_step, "Process End"}
+    assert run_context.result["response"] == {"error": "No answer could be produced: Token budget exhausted (100/100 tokens)"}
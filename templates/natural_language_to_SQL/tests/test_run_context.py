@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from semantic_kernel.functions import kernel_function
+from semantic_kernel.kernel import Kernel
+from semantic_kernel.processes.kernel_process import KernelProcessStep, KernelProcessStepContext
+from semantic_kernel.processes.process_builder import ProcessBuilder
+
+from src.models.events import SQLEvents
+from src.models.step_models import TableNamesStepInput
+from src.process.sql_process import SqlProcess
+from src.utils.query_cache import QueryCache
+from src.utils.run_context import RunContext, get_run_context, peek_run_context
+from src.utils.step_tracker import StepTracker
+
+# Number of validation rounds each query goes through before its run completes
+ROUNDS = {"first question": 4, "second question": 1, "third question": 2}
+
+
+class StubGenerationStep(KernelProcessStep):
+    @kernel_function(name="generate")
+    async def generate(self, context: KernelProcessStepContext, data: TableNamesStepInput):
+        await asyncio.sleep(0.005)
+        await context.emit_event(process_event="Generated", data=data)
+
+
+class StubValidationStep(KernelProcessStep):
+    @kernel_function(name="validate")
+    async def validate(self, context: KernelProcessStepContext, data: TableNamesStepInput):
+        run_context = get_run_context()
+        assert run_context.user_query == data.user_query
+        run_context.validation_retries += 1
+        run_context.add_issue(f"{data.user_query}: round {run_context.validation_retries}")
+        # Yield so that the steps of the other runs interleave with this one
+        await asyncio.sleep(0.005)
+        if run_context.validation_retries < ROUNDS[data.user_query]:
+            await context.emit_event(process_event="Retry", data=data)
+        else:
+            run_context.result = {"query": data.user_query}
+            await context.emit_event(process_event="Done", data=data)
+
+
+def build_stub_process(self):
+    process = ProcessBuilder(name="StubProcess")
+    generation_step = process.add_step(StubGenerationStep)
+    validation_step = process.add_step(StubValidationStep)
+    process.on_input_event(event_id=SQLEvents.StartProcess).send_event_to(target=generation_step, parameter_name="data")
+    generation_step.on_event(event_id="Generated").send_event_to(target=validation_step, parameter_name="data")
+    validation_step.on_event(event_id="Retry").send_event_to(target=generation_step, parameter_name="data")
+    validation_step.on_event(event_id="Done").stop_process()
+    return process.build()
+
+
+@pytest.fixture
+def stub_process(monkeypatch):
+    monkeypatch.setattr(SqlProcess, "get_sql_process", build_stub_process)
+
+
+async def run(query: str) -> RunContext:
+    run_context = RunContext(user_query=query)
+    run_context.tracker = StepTracker(run_id=run_context.run_id)
+    process = SqlProcess(Kernel(), query_cache=QueryCache(), tracker=run_context.tracker, schema_selection="two_stage")
+    await process.start(query, run_context)
+    return run_context
+
+
+def test_overlapping_runs_keep_their_own_state(stub_process):
+    async def run_all():
+        return await asyncio.gather(*(run(query) for query in ROUNDS))
+
+    for query, run_context in zip(ROUNDS, asyncio.run(run_all())):
+        assert run_context.validation_retries == ROUNDS[query]
+        assert list(run_context.issue_history) == [f"{query}: round {i + 1}" for i in range(ROUNDS[query])]
+        assert run_context.result == {"query": query}
+
+
+def test_run_context_is_reset_after_the_run(stub_process):
+    async def run_and_peek():
+        await run("second question")
+        return peek_run_context()
+
+    assert asyncio.run(run_and_peek()) is None
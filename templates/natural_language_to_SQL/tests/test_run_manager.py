@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import server
+from src.process.run_manager import RunManager, RunQueueFullError
+
+
+def test_runs_execute_concurrently_on_the_worker_pool():
+    async def run():
+        running, peak = 0, 0
+
+        async def handler(run_context):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            if run_context.user_query == "fail":
+                raise ValueError("no such table")
+            return {"query": run_context.user_query}
+
+        run_manager = RunManager(handler, workers=2, queue_size=10, history_size=10).start()
+        try:
+            records = [run_manager.submit(query) for query in ("a", "b", "fail", "c")]
+            await asyncio.gather(*(record.done.wait() for record in records))
+        finally:
+            await run_manager.stop()
+        return records, peak, run_manager.get_stats()
+
+    records, peak, stats = asyncio.run(run())
+    assert peak == 2
+    assert [record.status for record in records] == ["completed", "completed", "failed", "completed"]
+    assert records[0].result == {"query": "a"}
+    assert records[2].error == "no such table"
+    assert stats["runs"] == {"completed": 3, "failed": 1}
+    assert len({record.run_id for record in records}) == 4
+
+
+def test_submit_raises_when_the_queue_is_full():
+    async def run():
+        run_manager = RunManager(lambda run_context: None, workers=0, queue_size=2)
+        run_manager.submit("a")
+        run_manager.submit("b")
+        with pytest.raises(RunQueueFullError):
+            run_manager.submit("c")
+        # The rejected run is not listed
+        return [record.run_context.user_query for record in run_manager.list_runs()]
+
+    assert asyncio.run(run()) == ["a", "b"]
+
+
+def test_only_finished_runs_are_evicted_from_the_history():
+    async def run():
+        release = asyncio.Event()
+
+        async def handler(run_context):
+            if run_context.user_query == "slow":
+                await release.wait()
+            return {}
+
+        run_manager = RunManager(handler, workers=2, queue_size=10, history_size=2).start()
+        try:
+            slow = run_manager.submit("slow")
+            first = run_manager.submit("first")
+            await first.done.wait()
+            second = run_manager.submit("second")
+            await second.done.wait()
+            third = run_manager.submit("third")
+            # Over capacity: the finished runs go oldest first, the running one stays
+            kept = [record.run_context.user_query for record in run_manager.list_runs()]
+            release.set()
+            await slow.done.wait()
+            await third.done.wait()
+            return kept, run_manager.get(first.run_id)
+        finally:
+            await run_manager.stop()
+
+    kept, evicted = asyncio.run(run())
+    assert kept == ["slow", "third"]
+    assert evicted is None
+
+
+def test_submit_endpoint_answers_429_when_the_queue_is_full(monkeypatch):
+    monkeypatch.setattr(server, "run_manager", RunManager(server.execute_run, workers=0, queue_size=1))
+    client = TestClient(server.app)
+
+    accepted = client.post("/api/runs", json={"query": "How many patients?"})
+    assert accepted.status_code == 202
+    assert accepted.json()["status"] == "queued"
+    rejected = client.post("/api/runs", json={"query": "How many providers?"})
+    assert rejected.status_code == 429
+    assert "queue is full" in rejected.json()["detail"]
+
+    run_id = accepted.json()["run_id"]
+    assert client.get(f"/api/runs/{run_id}").json()["query"] == "How many patients?"
+    assert client.get("/api/runs/unknown").status_code == 404
@@ -0,0 +1,59 @@
+import json
+
+from src.constants.data_model import global_database_model
+from src.utils.schema_index import SchemaIndex
+
+DATABASE_MODEL = [
+    {"TableName": "patients", "Description": "One row per patient", "Columns": [
+        {"ColumnName": "PATIENT_ID", "DataType": "VARCHAR", "Description": "Unique \"patient\" identifier"},
+        {"ColumnName": "INSURANCE_REC.PATIENT_AGE_NUM", "DataType": "INT", "Description": "Age in years"},
+        {"ColumnName": "CITY", "DataType": "VARCHAR", "Description": "Zürich, Genève"},
+    ]},
+    {"TableName": "providers", "Description": "Healthcare providers", "Columns": [
+        {"ColumnName": "PROVIDER_ID", "DataType": "VARCHAR", "Description": "Unique provider identifier"},
+    ]},
+]
+
+
+def test_lookups():
+    index = SchemaIndex(DATABASE_MODEL)
+    assert index.has_table("patients") and not index.has_table("claims")
+    assert index.has_column("patients", "INSURANCE_REC.PATIENT_AGE_NUM")
+    assert not index.has_column("providers", "PATIENT_ID")
+    assert index.get_column("providers", "PROVIDER_ID")["DataType"] == "VARCHAR"
+    assert index.get_table("claims") is None
+
+
+def test_render_tables_matches_the_model_and_skips_unknown_tables():
+    index = SchemaIndex(DATABASE_MODEL)
+    assert json.loads(index.render_tables(["providers", "claims", "patients"])) == [DATABASE_MODEL[1], DATABASE_MODEL[0]]
+    assert index.render_tables([]) == "[]"
+
+
+def test_render_table_columns_keeps_the_selected_columns_in_order():
+    index = SchemaIndex(DATABASE_MODEL)
+    rendered = index.render_table_columns([
+        ("patients", ["CITY", "UNKNOWN", "PATIENT_ID"]),
+        ("claims", ["CLAIM_ID"]),
+        ("providers", []),
+    ])
+    patients, providers = DATABASE_MODEL
+    assert json.loads(rendered) == [
+        {"TableName": "patients", "Description": "One row per patient",
+         "Columns": [patients["Columns"][2], patients["Columns"][0]]},
+        {"TableName": "providers", "Description": "Healthcare providers", "Columns": []},
+    ]
+    # Non-ASCII text is kept as is in the prompt
+    assert "Zürich" in rendered
+    # Repeated selections are served from the cache with the same result
+    assert index.render_table_columns([("providers", [])]) == "[" + rendered.split("}]}, ")[1]
+    assert index._render_table_subset.cache_info().hits == 1
+
+
+def test_every_table_and_column_of_the_data_model_is_indexed():
+    index = SchemaIndex(global_database_model)
+    for table in global_database_model:
+        column_names = [column["ColumnName"] for column in table.get("Columns", [])]
+        assert all(index.has_column(table["TableName"], name) for name in column_names)
+        rendered = json.loads(index.render_table_columns([(table["TableName"], column_names)]))
+        assert rendered[0]["Columns"] == table.get("Columns", [])
@@ -0,0 +1,53 @@
+import pytest
+from semantic_kernel.kernel import Kernel
+
+from src import server
+from src.process.sql_process import SqlProcess
+
+
+@pytest.fixture(autouse=True)
+def clear_step_names():
+    server.get_process_step_names.cache_clear()
+    yield
+    server.get_process_step_names.cache_clear()
+
+
+def step_ids():
+    return [step["id"] for step in server.get_process_steps()]
+
+
+def test_parallel_review_advertises_the_review_step(monkeypatch):
+    monkeypatch.setattr("src.process.sql_process.PARALLEL_SQL_REVIEW", True)
+    ids = step_ids()
+    assert "sql_review_step" in ids
+    assert "business_rules_step" not in ids and "validation_step" not in ids
+    assert ids[0] == "process_start" and ids[-1] == "process_end"
+
+
+def test_sequential_review_advertises_both_checks(monkeypatch):
+    monkeypatch.setattr("src.process.sql_process.PARALLEL_SQL_REVIEW", False)
+    ids = step_ids()
+    assert ids.index("business_rules_step") < ids.index("validation_step") < ids.index("execution_step")
+    assert "sql_review_step" not in ids
+
+
+@pytest.mark.parametrize("parallel_review", [True, False])
+@pytest.mark.parametrize("schema_selection", ["combined", "two_stage", "auto"])
+def test_step_names_match_the_built_process(parallel_review, schema_selection):
+    process = SqlProcess(Kernel(), parallel_review=parallel_review, schema_selection=schema_selection)
+    built = [step.state.name for step in process.process.steps]
+    assert SqlProcess.get_step_names(parallel_review, schema_selection) == built
+
+
+def test_auto_selection_advertises_the_resolved_steps(monkeypatch):
+    monkeypatch.setattr("src.process.sql_process.SCHEMA_SELECTION_MODE", "auto")
+    monkeypatch.setattr("src.process.sql_process.SCHEMA_SELECTION_MAX_TOKENS", 10 ** 9)
+    ids = step_ids()
+    assert "schema_selection_step" in ids
+    assert "table_name_step" not in ids and "column_name_step" not in ids
+
+    server.get_process_step_names.cache_clear()
+    monkeypatch.setattr("src.process.sql_process.SCHEMA_SELECTION_MAX_TOKENS", 0)
+    ids = step_ids()
+    assert ids.index("table_name_step") < ids.index("column_name_step")
+    assert "schema_selection_step" not in ids
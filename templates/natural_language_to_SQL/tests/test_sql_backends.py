@@ -0,0 +1,141 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from src.utils.result_cache import ResultCache
+from src.utils.sql_backends import SQLiteBackend, DuckDBBackend
+
+
+def _create_tables(execute):
+    execute("CREATE TABLE a (id INTEGER, name VARCHAR)")
+    execute("CREATE TABLE b (id INTEGER, a_id INTEGER)")
+    for i in range(5):
+        execute(f"INSERT INTO a VALUES ({i}, 'name {i}')")
+        execute(f"INSERT INTO b VALUES ({i + 100}, {i})")
+
+
+@pytest.fixture(params=["sqlite", "duckdb"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        db_file = str(tmp_path / "test.db")
+        conn = sqlite3.connect(db_file)
+        _create_tables(conn.execute)
+        conn.commit()
+        conn.close()
+        backend = SQLiteBackend(db_file, pool_size=2, max_rows=3, timeout=10)
+    else:
+        duckdb = pytest.importorskip("duckdb")
+        db_file = str(tmp_path / "test.duckdb")
+        conn = duckdb.connect(db_file)
+        _create_tables(conn.execute)
+        conn.close()
+        backend = DuckDBBackend(db_file, pool_size=2, max_rows=3, timeout=10)
+    yield backend
+    backend.pool.close()
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT id FROM a -- note",
+    "SELECT id FROM a;\n-- done",
+    "SELECT id FROM a /* trailing block comment */",
+    "SELECT id FROM a;",
+])
+def test_statements_with_comments_and_semicolons(backend, sql):
+    response = backend.execute(sql, max_rows=0)
+    assert "error" not in response, response
+    assert [row["id"] for row in response["result"]] == [0, 1, 2, 3, 4]
+
+
+def test_duplicate_column_names_keep_their_name(backend):
+    response = backend.execute("SELECT a.id, b.id FROM a JOIN b ON b.a_id = a.id ORDER BY a.id", max_rows=0)
+    assert "error" not in response, response
+    # As with the plain cursor, the last column of a duplicated name wins
+    assert [set(row) for row in response["result"]] == [{"id"}] * 5
+    assert response["result"][0]["id"] == 100
+
+
+def test_row_limit_is_enforced_while_fetching(backend):
+    response = backend.execute("SELECT id FROM a ORDER BY id -- comment")
+    assert [row["id"] for row in response["result"]] == [0, 1, 2]
+    assert response["truncated"] is True
+
+    response = backend.execute("SELECT id FROM a WHERE id < 3")
+    assert len(response["result"]) == 3
+    assert "truncated" not in response
+
+
+def test_execute_async(backend):
+    response = asyncio.run(backend.execute_async("SELECT name FROM a WHERE id = 1 -- c"))
+    assert response == {"result": [{"name": "name 1"}]}
+
+
+def test_result_cache_lookup_runs_off_the_event_loop(backend, monkeypatch):
+    backend.result_cache = ResultCache()
+    data_version = backend.data_version
+    version_threads = []
+
+    def recording_data_version():
+        version_threads.append(threading.current_thread())
+        return data_version()
+
+    monkeypatch.setattr(backend, "data_version", recording_data_version)
+
+    async def execute_twice():
+        first = await backend.execute_async("SELECT id FROM a WHERE id = 1")
+        second = await backend.execute_async("select id from a where id=1;")
+        return first, second
+
+    first, second = asyncio.run(execute_twice())
+    assert first == second == {"result": [{"id": 1}]}
+    assert backend.result_cache.hits == 1
+    assert len(version_threads) == 2
+    assert threading.main_thread() not in version_threads
+
+
+def test_connections_are_read_only(backend):
+    response = backend.execute("INSERT INTO a VALUES (9, 'name 9')")
+    assert "error" in response
+    assert backend.execute("SELECT COUNT(*) AS n FROM a")["result"] == [{"n": 5}]
+
+
+def test_pool_is_bounded_and_reuses_connections(backend):
+    connect = backend.connect
+    created = []
+
+    def counting_connect():
+        created.append(connect())
+        return created[-1]
+    backend.pool._connect = counting_connect
+
+    for _ in range(5):
+        backend.execute("SELECT id FROM a", max_rows=0)
+    assert len(created) == 1
+
+    # Two streams held open at once take both pooled connections, a third waits for a release
+    with backend.stream("SELECT id FROM a") as first, backend.stream("SELECT id FROM b") as second:
+        assert len(created) == 2
+        waiter = threading.Thread(target=backend.execute, args=("SELECT 1",))
+        waiter.start()
+        waiter.join(0.2)
+        assert waiter.is_alive()
+        list(first), list(second)
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert len(created) == 2
+
+
+def test_stream_fetches_rows_in_batches(backend):
+    with backend.stream("SELECT id, name FROM a ORDER BY id", max_rows=0) as rows:
+        rows.batch_size = 2
+        assert rows.columns == ["id", "name"]
+        assert [len(batch) for batch in rows.fetch_batches()] == [2, 2, 1]
+    with backend.stream("SELECT id FROM a ORDER BY id", max_rows=4) as rows:
+        rows.batch_size = 3
+        assert [row[0] for row in rows] == [0, 1, 2, 3]
+        assert rows.truncated
+
+
+def test_nested_field_names_are_rewritten(backend):
+    assert backend.rewrite_sql('SELECT "INSURANCE_REC.PATIENT_AGE_NUM" FROM t') == 'SELECT "INSURANCE_REC_PATIENT_AGE_NUM" FROM t'
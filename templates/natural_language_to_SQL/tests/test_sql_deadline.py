@@ -0,0 +1,99 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from src.models.events import SQLEvents
+from src.models.step_models import ExecutionStepInput, GetColumnNames
+from src.steps import execution_step
+from src.utils.db_helpers import set_sql_backend
+from src.utils.query_cache import QueryCache
+from src.utils.run_context import RunContext, reset_run_context, set_run_context
+from src.utils.sql_backends import SQLiteBackend
+
+# Never finishes on its own
+ENDLESS_SQL = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM c"
+
+
+@pytest.fixture
+def backend(tmp_path):
+    db_file = str(tmp_path / "test.db")
+    with sqlite3.connect(db_file) as conn:
+        conn.execute("CREATE TABLE a (id INTEGER)")
+        conn.execute("INSERT INTO a VALUES (1)")
+    backend = SQLiteBackend(db_file, pool_size=1, max_rows=10, timeout=30)
+    yield backend
+    backend.pool.close()
+
+
+def test_statement_is_interrupted_at_the_deadline(backend):
+    start_time = time.perf_counter()
+    response = backend.execute(ENDLESS_SQL, timeout=0.2)
+    assert response == {"error": "Query exceeded the 0.2s deadline"}
+    assert time.perf_counter() - start_time < 5
+    # The connection went back to the pool and is usable
+    assert backend.execute("SELECT id FROM a") == {"result": [{"id": 1}]}
+
+
+def test_event_loop_keeps_running_during_a_query(backend):
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        response = await backend.execute_async(ENDLESS_SQL, timeout=0.3)
+        ticking.cancel()
+        return response, ticks
+
+    response, ticks = asyncio.run(run())
+    assert "deadline" in response["error"]
+    assert ticks >= 10
+
+
+def test_cancelled_caller_interrupts_the_statement(backend):
+    async def run():
+        task = asyncio.create_task(backend.execute_async(ENDLESS_SQL, timeout=0))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # With a single thread and connection, this only runs once the endless statement stopped
+        return await asyncio.wait_for(backend.execute_async("SELECT id FROM a"), 5)
+
+    assert asyncio.run(run()) == {"result": [{"id": 1}]}
+
+
+def test_execution_step_applies_the_deadline(backend, monkeypatch):
+    monkeypatch.setattr(execution_step, "SQL_EXECUTION_DEADLINE", 0.2)
+    set_sql_backend(backend)
+    events = []
+
+    class RecordingContext:
+        async def emit_event(self, process_event, data=None):
+            events.append(process_event)
+
+    data = ExecutionStepInput(user_query="count", table_column_names=GetColumnNames(table_column_list=[]),
+                              sql_statement=ENDLESS_SQL)
+
+    async def run():
+        run_context = RunContext(user_query="count", query_cache=QueryCache())
+        token = set_run_context(run_context)
+        try:
+            await execution_step.ExecutionStep().execute_sql(RecordingContext(), data, kernel=None)
+        finally:
+            reset_run_context(token)
+        return run_context
+
+    try:
+        run_context = asyncio.run(run())
+    finally:
+        set_sql_backend(None)
+    # Like any failed statement, the deadline error is handed to the final answer
+    assert events == [SQLEvents.ExecutionSuccess]
+    assert run_context.result["response"] == {"error": "Query exceeded the 0.2s deadline"}
@@ -0,0 +1,78 @@
+import sqlite3
+
+import pytest
+
+from src.utils.sql_prevalidation import SqlPrevalidator
+
+DATABASE_MODEL = [
+    {"TableName": "patients", "Columns": [
+        {"ColumnName": "PATIENT_ID", "DataType": "VARCHAR"},
+        {"ColumnName": "INSURANCE_REC.PATIENT_AGE_NUM", "DataType": "INT"},
+    ]},
+    {"TableName": "providers", "Columns": [{"ColumnName": "PROVIDER_ID", "DataType": "VARCHAR"}]},
+    {"TableName": "plans", "Columns": [{"ColumnName": "PLAN_ID", "DataType": "VARCHAR"}]},
+]
+
+
+@pytest.fixture
+def prevalidator():
+    prevalidator = SqlPrevalidator(DATABASE_MODEL, max_schemas=2)
+    yield prevalidator
+    prevalidator.close()
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT PATIENT_ID FROM patients",
+    "-- get count\nSELECT COUNT(*) FROM patients",
+    "/* patients\n   over 65 */ SELECT PATIENT_ID FROM patients WHERE \"INSURANCE_REC.PATIENT_AGE_NUM\" > 65",
+    "  -- one\n  -- two\n/* three */\nWITH p AS (SELECT PATIENT_ID FROM patients) SELECT * FROM p;",
+])
+def test_read_statements_pass(prevalidator, sql):
+    assert prevalidator.check(sql, ["patients"]) == []
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM patients",
+    "-- SELECT\nDELETE FROM patients",
+    "/* SELECT */ DROP TABLE patients",
+    "-- only a comment",
+    "SELECTED FROM patients",
+])
+def test_other_statements_are_rejected(prevalidator, sql):
+    assert prevalidator.check(sql, ["patients"]) == ["Only read-only SELECT (or WITH ... SELECT) statements are allowed."]
+
+
+def test_unknown_and_unselected_tables_and_columns(prevalidator):
+    assert prevalidator.check("SELECT PLAN_ID FROM plans", ["patients"])[0].startswith(
+        "no such table: plans (the table exists but was not selected"
+    )
+    assert prevalidator.check("SELECT 1 FROM claims", ["patients"])[0].startswith("no such table: claims")
+    assert prevalidator.check("SELECT AGE FROM patients", ["patients"]) == ["no such column: AGE"]
+
+
+def test_schema_connections_are_bounded_and_closed(prevalidator):
+    connections = []
+    original = prevalidator._create_schema_connection
+
+    def create(table_names):
+        connections.append(original(table_names))
+        return connections[-1]
+    prevalidator._create_schema_connection = create
+
+    prevalidator.check("SELECT 1", ["patients"])
+    prevalidator.check("SELECT 1", ["providers"])
+    prevalidator.check("SELECT 1", ["patients"])
+    assert len(connections) == 2
+    # A third selection evicts and closes the least recently used connection
+    prevalidator.check("SELECT 1", ["plans"])
+    assert len(prevalidator._connections) == 2
+    with pytest.raises(sqlite3.ProgrammingError):
+        connections[1].execute("SELECT 1")
+    connections[0].execute("SELECT 1")
+
+    prevalidator.close()
+    assert len(prevalidator._connections) == 0
+    with pytest.raises(sqlite3.ProgrammingError):
+        connections[0].execute("SELECT 1")
+    # Connections are created again on demand after close
+    assert prevalidator.check("SELECT PATIENT_ID FROM patients", ["patients"]) == []
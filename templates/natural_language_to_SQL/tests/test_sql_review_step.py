@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from src.models.events import SQLEvents
+from src.models.step_models import BusinessRulesStepInput, GetColumnNames, SQLGenerateResult, ValidationResult
+from src.steps import sql_review_step
+from src.steps.business_rules_step import BusinessRulesStep
+from src.steps.sql_review_step import SQLReviewStep
+from src.steps.validation_step import ValidationStep
+from src.utils.run_context import RunContext, reset_run_context, set_run_context
+
+OK = ValidationResult(status="OK")
+ERROR = ValidationResult(status="ERROR", list_of_issues=["Wrong column"])
+
+
+class RecordingContext:
+    def __init__(self):
+        self.events = []
+
+    async def emit_event(self, process_event, data=None):
+        self.events.append((process_event, data))
+
+
+def review(monkeypatch, business_rules: ValidationResult, validation: ValidationResult, run_context: RunContext):
+    async def apply_business_rules(self, kernel, data):
+        return business_rules
+
+    async def validate_sql(self, kernel, user_query, data):
+        return validation
+
+    monkeypatch.setattr(BusinessRulesStep, "_apply_business_rules", apply_business_rules)
+    monkeypatch.setattr(ValidationStep, "_validate_sql", validate_sql)
+    data = BusinessRulesStepInput(
+        user_query="How many patients?",
+        table_column_names=GetColumnNames(table_column_list=[]),
+        sql_generation_result=SQLGenerateResult(sql_statement="SELECT COUNT(*) FROM patients", status="OK", reason=""),
+    )
+
+    async def run():
+        token = set_run_context(run_context)
+        try:
+            context = RecordingContext()
+            await SQLReviewStep().review_sql(context, data, kernel=None)
+            return context.events
+        finally:
+            reset_run_context(token)
+    return asyncio.run(run())
+
+
+def test_passing_review_is_flagged(monkeypatch):
+    [(event, result)] = review(monkeypatch, OK, OK, RunContext())
+    assert event == SQLEvents.SQLReviewPassed
+    assert result.review_passed
+
+
+@pytest.mark.parametrize("business_rules, validation", [(ERROR, OK), (OK, ERROR), (ERROR, ERROR)])
+def test_sql_let_through_after_the_retry_limit_is_not_flagged(monkeypatch, business_rules, validation):
+    run_context = RunContext(
+        business_rules_retries=sql_review_step.BUSINESS_RULES_MAX_RETRIES,
+        validation_retries=sql_review_step.VALIDATION_MAX_RETRIES,
+    )
+    [(event, result)] = review(monkeypatch, business_rules, validation, run_context)
+    assert event == SQLEvents.SQLReviewPassed
+    assert not result.review_passed
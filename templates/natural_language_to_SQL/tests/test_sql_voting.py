@@ -0,0 +1,124 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from src.models.step_models import GetColumnNames, SQLGenerateResult, SQLGenerationStepInput
+from src.steps import sql_generation_step
+from src.utils.db_helpers import set_sql_backend
+from src.utils.sql_backends import SQLiteBackend
+from src.utils.sql_voting import result_fingerprint, vote_candidates
+
+
+def responses(mapping: dict):
+    async def execute(sql: str):
+        response = mapping[sql]
+        if isinstance(response, Exception):
+            raise response
+        return response
+    return execute
+
+
+def test_fingerprint_ignores_row_order_and_column_names():
+    first = {"result": [{"city": "Bern", "n": 2}, {"city": "Biel", "n": 1.0000001}]}
+    second = {"result": [{"total": 1.0, "name": "Biel"}, {"total": 2, "name": "Bern"}]}
+    assert result_fingerprint(first) == result_fingerprint({"result": [{"n": 1.0000001, "city": "Biel"}, {"n": 2, "city": "Bern"}]})
+    assert result_fingerprint(first) != result_fingerprint({"result": [{"city": "Bern", "n": 3}]})
+    # Floats are compared after rounding
+    assert result_fingerprint({"result": [{"n": 0.1 + 0.2}]}) == result_fingerprint({"result": [{"n": 0.3}]})
+    assert result_fingerprint(second) != result_fingerprint({"result": second["result"], "truncated": True})
+    assert result_fingerprint({"error": "no such table: claims"}) is None
+
+
+def test_majority_cluster_wins():
+    vote = asyncio.run(vote_candidates(["a", "b", "c"], responses({
+        "a": {"result": [{"n": 1}]},
+        "b": {"result": [{"n": 2}]},
+        "c": {"result": [{"count": 2}]},
+    })))
+    assert (vote.winner, vote.votes, vote.failed) == (1, 2, [])
+    assert sorted(vote.clusters.values()) == [[0], [1, 2]]
+
+
+def test_ties_go_to_the_earliest_candidate():
+    vote = asyncio.run(vote_candidates(["a", "b", "c", "d"], responses({
+        "a": {"error": "no such column: x"},
+        "b": {"result": [{"n": 1}]},
+        "c": {"result": [{"n": 2}]},
+        "d": {"result": [{"n": 2}]},
+    })))
+    assert (vote.winner, vote.votes) == (2, 2)
+
+    vote = asyncio.run(vote_candidates(["a", "b", "c"], responses({
+        "a": {"error": "no such column: x"},
+        "b": {"result": [{"n": 1}]},
+        "c": {"result": [{"n": 2}]},
+    })))
+    assert (vote.winner, vote.votes, vote.failed) == (1, 1, [0])
+
+
+def test_skipped_and_failed_candidates_do_not_vote():
+    vote = asyncio.run(vote_candidates([None, "a", "b"], responses({
+        "a": RuntimeError("database is locked"),
+        "b": {"result": []},
+    })))
+    assert (vote.winner, vote.votes, vote.failed) == (2, 1, [1])
+
+
+def test_first_candidate_wins_when_all_fail():
+    vote = asyncio.run(vote_candidates([None, "a", "b"], responses({
+        "a": {"error": "no such table: claims"},
+        "b": TimeoutError(),
+    })))
+    assert (vote.winner, vote.votes, vote.clusters, vote.failed) == (1, 0, {}, [1, 2])
+    assert asyncio.run(vote_candidates([None, None], responses({}))).winner == 0
+
+
+def test_generation_step_forwards_the_majority_candidate(tmp_path, monkeypatch):
+    db_file = str(tmp_path / "test.db")
+    with sqlite3.connect(db_file) as conn:
+        conn.execute("CREATE TABLE patients (id INTEGER, city TEXT)")
+        conn.executemany("INSERT INTO patients VALUES (?, ?)", [(1, "Bern"), (2, "Bern"), (3, "Biel")])
+    backend = SQLiteBackend(db_file, pool_size=2, max_rows=10, timeout=5)
+    candidates = [
+        SQLGenerateResult(sql_statement="SELECT COUNT(*) FROM patients WHERE city = 'Biel'", status="OK", reason=""),
+        SQLGenerateResult(sql_statement="SELECT COUNT(*) FROM patients WHERE city = 'Bern'", status="OK", reason=""),
+        SQLGenerateResult(sql_statement="SELECT COUNT(id) AS n FROM patients WHERE city IN ('Bern')", status="OK", reason=""),
+        SQLGenerateResult(sql_statement="SELECT 2", status="IMPOSSIBLE", reason="unsure"),
+    ]
+    running, peak = 0, 0
+
+    async def generate(kernel, prompt, response_format, sample=0):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return candidates[sample]
+
+    monkeypatch.setattr(sql_generation_step, "SQL_CANDIDATES", len(candidates))
+    monkeypatch.setattr(sql_generation_step, "SQL_CANDIDATE_CONCURRENCY", 2)
+    monkeypatch.setattr(sql_generation_step, "call_chat_completion_structured_outputs", generate)
+    step = sql_generation_step.SQLGenerationStep()
+    monkeypatch.setattr(step, "_precheck_sql", lambda data, sql_statement: [])
+    data = SQLGenerationStepInput(user_query="How many patients live in Bern?",
+                                  table_column_names=GetColumnNames(table_column_list=[]))
+    set_sql_backend(backend)
+    try:
+        result = asyncio.run(step._generate_candidates(kernel=None, prompt="prompt", data=data))
+    finally:
+        set_sql_backend(None)
+        backend.pool.close()
+    assert result is candidates[1]
+    assert peak == 2
+
+
+def test_generation_step_raises_when_every_generation_fails(monkeypatch):
+    async def generate(kernel, prompt, response_format, sample=0):
+        raise RuntimeError(f"rate limited {sample}")
+
+    monkeypatch.setattr(sql_generation_step, "SQL_CANDIDATES", 2)
+    monkeypatch.setattr(sql_generation_step, "call_chat_completion_structured_outputs", generate)
+    data = SQLGenerationStepInput(user_query="count", table_column_names=GetColumnNames(table_column_list=[]))
+    with pytest.raises(RuntimeError, match="rate limited 0"):
+        asyncio.run(sql_generation_step.SQLGenerationStep()._generate_candidates(kernel=None, prompt="prompt", data=data))
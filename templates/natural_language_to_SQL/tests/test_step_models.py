@@ -0,0 +1,18 @@
+import pytest
+from pydantic import ValidationError
+
+from src.models.step_models import VALID_TABLE_NAMES, get_table_names_response_format
+
+
+def test_candidate_tables_restrict_the_table_names():
+    table_name = sorted(VALID_TABLE_NAMES)[0]
+    response_format = get_table_names_response_format((table_name,))
+    assert response_format.model_validate({"table_names": [{"table_name": table_name}]})
+    with pytest.raises(ValidationError):
+        response_format.model_validate({"table_names": [{"table_name": "not_a_table"}]})
+
+
+def test_no_candidate_tables_allows_every_table():
+    response_format = get_table_names_response_format(())
+    for table_name in VALID_TABLE_NAMES:
+        assert response_format.model_validate({"table_names": [{"table_name": table_name}]})
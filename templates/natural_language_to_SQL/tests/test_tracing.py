@@ -0,0 +1,24 @@
+import importlib.util
+import sys
+
+import src.utils.tracing as tracing
+
+
+def load_tracing_without_opentelemetry(monkeypatch):
+    # A None entry makes `import opentelemetry` raise ImportError
+    monkeypatch.setitem(sys.modules, "opentelemetry", None)
+    monkeypatch.setenv("OTEL_TRACING_ENABLED", "true")
+    monkeypatch.setenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+    spec = importlib.util.spec_from_file_location("tracing_without_opentelemetry", tracing.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_tracing_is_disabled_without_opentelemetry(monkeypatch):
+    module = load_tracing_without_opentelemetry(monkeypatch)
+    assert module.trace is None
+    assert module.get_step_tracer() is None
+    assert not module.exporter_configured()
+    assert module.set_up_tracing() is None
+    module.shutdown_tracing()
@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+
+from src.utils.transition_store import TransitionRecord, TransitionStore
+
+
+def make_record(index: int) -> TransitionRecord:
+    return TransitionRecord(f"Step{index}", float(index), index + 0.5, {"index": index}, None, None, None, None)
+
+
+def read_spill_file(path) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_ring_spills_its_oldest_tenth_when_full():
+    store = TransitionStore(capacity=10, max_runs=5, spill_path="")
+    ring = store.open("run")
+    for i in range(12):
+        ring.append(make_record(i))
+    # Full at the 11th append: the oldest one is spilled, again at the 12th
+    assert [record.step_name for record in ring.records()] == [f"Step{i}" for i in range(2, 12)]
+    assert [record.step_name for record in ring][0] == "Step11"
+    assert ring.spilled == store.spilled == 2
+    assert store.get_stats() == {"runs": 1, "transitions": 10, "spilled": 2, "dropped": 0}
+
+
+def test_oldest_runs_are_evicted_and_spilled(tmp_path):
+    path = tmp_path / "spill" / "transitions.jsonl"
+    store = TransitionStore(capacity=10, max_runs=2, spill_path=str(path))
+    for run_id in ("a", "b", "c"):
+        ring = store.open(run_id)
+        ring.append(make_record(1))
+        ring.append(make_record(2))
+    store.flush()
+    assert store.run_ids() == ["c", "b"]
+    assert store.get("a") is None
+    assert [(line["run_id"], line["step_name"], line["input_data"]) for line in read_spill_file(path)] == [
+        ("a", "Step1", {"index": 1}), ("a", "Step2", {"index": 2})
+    ]
+    store.close()
+
+
+def test_reopened_run_spills_its_previous_partition(tmp_path):
+    path = tmp_path / "transitions.jsonl"
+    store = TransitionStore(capacity=10, max_runs=5, spill_path=str(path))
+    store.open("a").append(make_record(1))
+    store.open("a").append(make_record(2))
+    store.close()
+    assert [line["step_name"] for line in read_spill_file(path)] == ["Step1"]
+    assert [record.step_name for record in store.get("a").records()] == ["Step2"]
+
+
+def test_spill_does_not_wait_for_the_file(tmp_path):
+    store = TransitionStore(capacity=1, max_runs=5, spill_path=str(tmp_path / "transitions.jsonl"))
+    release = threading.Event()
+    write = store._write
+
+    def slow_write(batches):
+        release.wait(5)
+        write(batches)
+    store._write = slow_write
+
+    ring = store.open("run")
+    start_time = time.perf_counter()
+    for i in range(5):
+        ring.append(make_record(i))
+    assert time.perf_counter() - start_time < 1
+    release.set()
+    store.close()
+    assert [line["step_name"] for line in read_spill_file(tmp_path / "transitions.jsonl")] == [f"Step{i}" for i in range(4)]
+
+
+def test_batches_are_dropped_when_the_queue_is_full(tmp_path):
+    store = TransitionStore(capacity=1, max_runs=5, spill_path=str(tmp_path / "transitions.jsonl"), queue_size=1)
+    release = threading.Event()
+    write = store._write
+
+    def blocked_write(batches):
+        release.wait(5)
+        write(batches)
+    store._write = blocked_write
+
+    ring = store.open("run")
+    for i in range(6):
+        ring.append(make_record(i))
+    release.set()
+    store.close()
+    written = len(read_spill_file(tmp_path / "transitions.jsonl"))
+    assert store.spilled == 5
+    assert store.dropped == 5 - written > 0
+
+
+def test_write_errors_are_counted(tmp_path):
+    # The spill path is a directory, so every write fails
+    store = TransitionStore(capacity=1, max_runs=5, spill_path=str(tmp_path))
+    ring = store.open("run")
+    ring.append(make_record(1))
+    ring.append(make_record(2))
+    store.close()
+    assert store.dropped == 1
@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import server
+from src.process.run_manager import RunManager
+from src.utils import usage_metrics
+from src.utils.run_context import RunContext, reset_run_context, set_run_context
+from src.utils.step_tracker import StepTracker
+from src.utils.usage_metrics import LLMCallUsage, MetricsRegistry, UsageStats, record_llm_call
+
+
+def make_response(prompt_tokens=100, cached_tokens=40, completion_tokens=20, reasoning_tokens=5):
+    usage = SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+        completion_tokens_details=SimpleNamespace(reasoning_tokens=reasoning_tokens),
+    )
+    return [SimpleNamespace(metadata={"usage": usage})]
+
+
+@pytest.fixture
+def prices(monkeypatch):
+    monkeypatch.setattr(usage_metrics, "LLM_PRICE_PER_1K_PROMPT_TOKENS", 2.0)
+    monkeypatch.setattr(usage_metrics, "LLM_PRICE_PER_1K_CACHED_PROMPT_TOKENS", 1.0)
+    monkeypatch.setattr(usage_metrics, "LLM_PRICE_PER_1K_COMPLETION_TOKENS", 8.0)
+
+
+def test_usage_is_read_from_the_response_metadata(prices):
+    usage = LLMCallUsage.from_response(make_response(), "SQLGenerationStep", "gpt-4o", 0.5, prefix_hash="abc")
+    assert (usage.prompt_tokens, usage.cached_prompt_tokens, usage.completion_tokens, usage.reasoning_tokens) == (100, 40, 20, 5)
+    # 60 uncached and 40 cached prompt tokens, 20 completion tokens
+    assert usage.cost == pytest.approx((60 * 2.0 + 40 * 1.0 + 20 * 8.0) / 1000)
+    # Responses without usage metadata count as a call with no tokens
+    empty = LLMCallUsage.from_response([SimpleNamespace(metadata={})], "SQLGenerationStep", "gpt-4o", 0.1)
+    assert (empty.prompt_tokens, empty.completion_tokens, empty.cost) == (0, 0, 0)
+
+
+def test_usage_stats_aggregate_and_merge(prices):
+    first, second = UsageStats(), UsageStats()
+    first.add(LLMCallUsage("A", "m", prompt_tokens=100, cached_prompt_tokens=50, completion_tokens=10, latency=1.0, prefix_hash="p"))
+    second.add(LLMCallUsage("A", "m", prompt_tokens=100, completion_tokens=30, latency=3.0, prefix_hash="p", replayed=True))
+    first.merge(second)
+    data = first.to_dict()
+    assert (data["calls"], data["total_tokens"], data["replayed_calls"]) == (2, 240, 1)
+    assert (data["latency_avg"], data["latency_max"]) == (2.0, 3.0)
+    assert data["cached_prompt_ratio"] == 0.25
+    assert data["prefix_hashes"] == {"p": 2}
+    assert data["cost"] == pytest.approx(first.cost)
+
+
+def test_registry_renders_counters_per_step_and_model():
+    registry = MetricsRegistry()
+    registry.record(LLMCallUsage("SQLGenerationStep", "gpt-4o", prompt_tokens=100, completion_tokens=20, latency=0.5))
+    registry.record(LLMCallUsage("SQLGenerationStep", "gpt-4o", prompt_tokens=50, completion_tokens=10, latency=1.5))
+    registry.record(LLMCallUsage('Step "quoted"', "gpt-4o", prompt_tokens=1))
+    lines = registry.render_prometheus().splitlines()
+    assert "# TYPE nl2sql_llm_calls_total counter" in lines
+    assert 'nl2sql_llm_calls_total{step="SQLGenerationStep",model="gpt-4o"} 2' in lines
+    assert 'nl2sql_llm_prompt_tokens_total{step="SQLGenerationStep",model="gpt-4o"} 150' in lines
+    assert 'nl2sql_llm_latency_seconds_max{step="SQLGenerationStep",model="gpt-4o"} 1.5' in lines
+    # Label values are escaped
+    assert 'nl2sql_llm_calls_total{step="Step \\"quoted\\"",model="gpt-4o"} 1' in lines
+
+
+def test_calls_are_attributed_to_the_step_the_run_budget_and_the_registry(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(usage_metrics, "_metrics_registry", registry)
+    tracker = StepTracker(run_id="run")
+    run_context = RunContext(user_query="How many patients?")
+    token = set_run_context(run_context)
+    try:
+        record_llm_call(make_response(), "gpt-4o", 0.5, step_name="SQLGenerationStep", tracker=tracker)
+        record_llm_call(make_response(prompt_tokens=10), "gpt-4o", 0.5, step_name="SQLGenerationStep", tracker=tracker)
+    finally:
+        reset_run_context(token)
+
+    metrics = tracker.get_usage_metrics()
+    assert list(metrics["steps"]) == ["SQLGenerationStep"]
+    assert metrics["total"]["calls"] == 2
+    assert metrics["total"]["prompt_tokens"] == 110
+    assert (run_context.budget.llm_calls, run_context.budget.total_tokens) == (2, 150)
+    assert 'nl2sql_llm_calls_total{step="SQLGenerationStep",model="gpt-4o"} 2' in registry.render_prometheus()
+
+
+def test_run_metrics_endpoint(monkeypatch):
+    run_manager = RunManager(server.execute_run, workers=0, queue_size=1)
+    monkeypatch.setattr(server, "run_manager", run_manager)
+    record = run_manager.submit("How many patients?")
+    record.tracker.record_llm_usage(LLMCallUsage("SQLGenerationStep", "gpt-4o", prompt_tokens=100, completion_tokens=20))
+    client = TestClient(server.app)
+
+    response = client.get(f"/api/runs/{record.run_id}/metrics").json()
+    assert response["status"] == "queued"
+    assert response["usage"]["steps"]["SQLGenerationStep"]["total_tokens"] == 120
+    assert response["usage"]["total"]["calls"] == 1
+    assert client.get("/api/runs/unknown/metrics").status_code == 404